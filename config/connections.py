@@ -7,21 +7,65 @@ import os
 import json
 import getpass
 import uuid
+import tempfile
+import threading
 from datetime import datetime
 
 from rich.console import Console
 from rich.panel import Panel
 
+from utils.constants import CONSUME_MODES, DEFAULT_CONSUME_MODE, CONFIG_SAVE_DEBOUNCE
+from utils.state import bump_version
+
 # Import from relative paths instead of absolute paths
 # Removed circular import: from config.connections import update_connection_last_used
 
+CONFIG_PATH = os.path.join(os.path.expanduser("~"), ".rmq_connections_config")
+
+# Campi salvati su disco; tutto il resto è stato di runtime (connessioni, thread, cache)
+PERSISTED_FIELDS = (
+    "id",
+    "name",
+    "host",
+    "user",
+    "password",
+    "vhost",
+    "consume_mode",
+    "tap_max_length",
+    "sampling_mode",
+    "sampling_rate",
+    "sampling_window",
+    "sampling_adaptive",
+    "discovery_interval",
+    "include_queues",
+    "exclude_queues",
+    "include_types",
+    "require_arguments",
+    "message_filter",
+    "alert_rules",
+    "heavy_hitter_headers",
+    "decoder_pool",
+    "decoder_workers",
+    "ingest_process",
+    "leader_aware",
+    "node_hosts",
+    "last_used",
+)
+
 # Global variables for connection management
 CONNECTIONS_LIST = []
 
+_config_lock = threading.RLock()
+_config_mtime = None  # mtime del file all'ultima lettura/scrittura
+_last_saved = None  # Contenuto serializzato dell'ultima scrittura
+_save_timer = None  # Timer per il salvataggio differito (debounce)
+
+
 def set_connections_list(connections):
     """Set the global connections list"""
     global CONNECTIONS_LIST
     CONNECTIONS_LIST = connections
+    bump_version('connections')
 
 
 def get_connections_list():
@@ -29,21 +73,65 @@ def get_connections_list():
     return CONNECTIONS_LIST
 
 
+def persisted_view(connection):
+    """
+    Ritorna solo i campi persistenti di una connessione.
+    
+    Args:
+        connection (dict): Configurazione di connessione (anche con stato di runtime)
+    
+    Returns:
+        dict: Copia con i soli campi da salvare su disco
+    """
+    return {key: connection[key] for key in PERSISTED_FIELDS if key in connection}
+
+
+def new_runtime_connection(connection):
+    """
+    Crea il dizionario di runtime di una connessione a partire dalle impostazioni salvate.
+    Lo stato di runtime (connessione pika, thread, topologia) non tocca la lista salvata.
+    
+    Args:
+        connection (dict): Impostazioni della connessione
+    
+    Returns:
+        dict: Nuovo dizionario di runtime
+    """
+    return persisted_view(connection)
+
+
+def _read_mtime():
+    try:
+        return os.stat(CONFIG_PATH).st_mtime_ns
+    except OSError:
+        return None
+
+
 def get_connections_config():
     """
     Recupera le configurazioni delle connessioni da un file nascosto nella home dell'utente.
+    Il file viene riletto solo se il suo mtime è cambiato dall'ultima lettura.
     Ritorna una lista di dizionari con i dettagli di ogni connessione.
     """
+    global _config_mtime, _last_saved
     console = Console()
-    config_path = os.path.join(os.path.expanduser("~"), ".rmq_connections_config")
 
-    if os.path.exists(config_path):
+    with _config_lock:
+        mtime = _read_mtime()
+        if mtime is None:
+            return []
+        if mtime == _config_mtime:
+            return CONNECTIONS_LIST
+
         try:
-            with open(config_path, "r") as f:
-                connections = json.load(f)
+            with open(CONFIG_PATH, "r") as f:
+                content = f.read()
+            connections = json.loads(content)
             
             # Aggiorna la variabile globale
             set_connections_list(connections)
+            _config_mtime = mtime
+            _last_saved = json.dumps([persisted_view(conn) for conn in connections])
             return connections
         except Exception as e:
             console.print(
@@ -54,46 +142,89 @@ def get_connections_config():
                 )
             )
             return []
-    else:
-        return []
+
+
+def _write_atomically(content):
+    """Scrive il file di configurazione tramite file temporaneo e rename"""
+    directory = os.path.dirname(CONFIG_PATH)
+    fd, temp_path = tempfile.mkstemp(prefix=".rmq_connections_config.", dir=directory)
+    try:
+        # Permessi 600 (solo lettura/scrittura per il proprietario) prima di scrivere i dati
+        os.chmod(temp_path, 0o600)
+        with os.fdopen(fd, "w") as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, CONFIG_PATH)
+    except Exception:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
 
 
 def save_connections_config(connections):
     """
     Salva le configurazioni delle connessioni in un file nascosto nella home dell'utente.
+    La scrittura è atomica e avviene solo se il contenuto è cambiato.
     
     Args:
         connections (list): Lista di dizionari con le configurazioni di connessione
     """
+    global _config_mtime, _last_saved
     console = Console()
-    config_path = os.path.join(os.path.expanduser("~"), ".rmq_connections_config")
 
-    try:
-        with open(config_path, "w") as f:
-            json.dump(connections, f)
+    with _config_lock:
+        _cancel_pending_save()
         
         # Aggiorna la variabile globale
         set_connections_list(connections)
         
-        # Imposta i permessi a 600 (solo lettura/scrittura per il proprietario)
+        content = json.dumps([persisted_view(conn) for conn in connections])
+        if content == _last_saved:
+            return
+
         try:
-            os.chmod(config_path, 0o600)
+            _write_atomically(content)
+            _last_saved = content
+            _config_mtime = _read_mtime()
         except Exception as e:
             console.print(
                 Panel(
-                    f"Non è stato possibile impostare i permessi per il file di configurazione:\n{e}",
-                    title="WARNING",
-                    style="yellow",
+                    f"Errore nel salvataggio del file di configurazione:\n{e}",
+                    title="ERROR",
+                    style="red",
                 )
             )
-    except Exception as e:
-        console.print(
-            Panel(
-                f"Errore nel salvataggio del file di configurazione:\n{e}",
-                title="ERROR",
-                style="red",
-            )
-        )
+
+
+def _cancel_pending_save():
+    global _save_timer
+    if _save_timer is not None:
+        _save_timer.cancel()
+        _save_timer = None
+
+
+def schedule_connections_save(delay=CONFIG_SAVE_DEBOUNCE):
+    """
+    Pianifica il salvataggio della lista corrente dopo 'delay' secondi.
+    Le richieste ravvicinate vengono accorpate in un'unica scrittura.
+    
+    Args:
+        delay (float): Ritardo del salvataggio in secondi
+    """
+    global _save_timer
+    with _config_lock:
+        _cancel_pending_save()
+        _save_timer = threading.Timer(delay, flush_connections_config)
+        _save_timer.daemon = True
+        _save_timer.start()
+
+
+def flush_connections_config():
+    """Esegue subito un eventuale salvataggio differito"""
+    save_connections_config(get_connections_list())
 
 
 def add_new_connection():
@@ -115,6 +246,13 @@ def add_new_connection():
     user = input("Inserisci RabbitMQ User: ").strip()
     password = getpass.getpass("Inserisci RabbitMQ Password: ").strip()
     vhost = input("Inserisci RabbitMQ VHost [/]: ").strip() or "/"
+    consume_mode = input(
+        f"Modalità di consumo ({'/'.join(CONSUME_MODES)}) [{DEFAULT_CONSUME_MODE}]: "
+    ).strip().lower() or DEFAULT_CONSUME_MODE
+    if consume_mode not in CONSUME_MODES:
+        consume_mode = DEFAULT_CONSUME_MODE
+    include_queues = input("Code da includere (glob o re:regex, separati da virgola) [tutte]: ").strip()
+    exclude_queues = input("Code da escludere (glob o re:regex, separati da virgola) [nessuna]: ").strip()
 
     connection_id = str(uuid.uuid4())
     connection = {
@@ -124,6 +262,9 @@ def add_new_connection():
         "user": user,
         "password": password,
         "vhost": vhost,
+        "consume_mode": consume_mode,
+        "include_queues": [p.strip() for p in include_queues.split(",") if p.strip()],
+        "exclude_queues": [p.strip() for p in exclude_queues.split(",") if p.strip()],
         "last_used": datetime.now().isoformat()
     }
 
@@ -137,22 +278,18 @@ def add_new_connection():
 def update_connection_last_used(connection):
     """
     Aggiorna la data di ultimo utilizzo della connessione.
+    Il salvataggio su disco è differito e accorpato.
     
     Args:
         connection (dict): Configurazione di connessione da aggiornare
     """
-    connections = get_connections_list()
-    
-    # Aggiorna la data di ultimo utilizzo
-    connection["last_used"] = datetime.now().isoformat()
-    
-    # Aggiorna la connessione nella lista
-    updated = False
-    for i, conn in enumerate(connections):
-        if conn.get("id") == connection.get("id"):
-            connections[i] = connection
-            updated = True
-            break
+    last_used = datetime.now().isoformat()
+    connection["last_used"] = last_used
     
-    if updated:
-        save_connections_config(connections)
\ No newline at end of file
+    # Aggiorna solo il campo nella lista salvata, senza copiarvi lo stato di runtime
+    with _config_lock:
+        for conn in get_connections_list():
+            if conn.get("id") == connection.get("id"):
+                conn["last_used"] = last_used
+                schedule_connections_save()
+                break
@@ -4,31 +4,264 @@
 LT Superstar - Monitoraggio code RabbitMQ
 Punto di ingresso dell'applicazione con gestione migliorata della connessione
 """
+from utils.startup import mark_once, get_mark, format_marks  # Primo import: fissa l'istante di avvio
+
 import sys
 import time
 import os
+import argparse
+import threading
 import traceback
 
 try:
     import keyboard
 except ImportError:
-    print("Installazione del pacchetto keyboard...")
-    import subprocess
-    subprocess.check_call([sys.executable, "-m", "pip", "install", "keyboard"])
-    import keyboard
+    # Nessuna installazione a runtime: la dipendenza è dichiarata in requirements.txt
+    keyboard = None
 
 # Import dai moduli interni
-from ui.animations import boot_animation
 from ui.layouts import create_full_layout
-from config.connections import get_connections_config, add_new_connection
-from rabbitmq.connection import run_consumer_for_connection
-from utils.constants import initialize_globals, get_active_connection, set_live_instance, get_selected_index
+from config.connections import get_connections_config, add_new_connection, flush_connections_config
+from rabbitmq.consumer import process_delivery
+from rabbitmq.sampling import flush_expired_window
+from rabbitmq.decoders import shutdown_decoders
+from utils.constants import MAX_MESSAGES, REPLAY_MAX_IN_FLIGHT, RENDER_MIN_INTERVAL, PEEK_DEFAULT_COUNT
+from utils.state import initialize_globals, get_active_connection, set_live_instance, get_selected_index
+from utils.state import set_fast_start, set_max_messages, get_version, wait_for_change
 from utils.logger import log_message, log_error, ensure_log_directory
+from utils.export import export_messages, iter_log_messages, EXPORT_FORMATS
+from utils.capture import iter_capture_messages, start_capture, stop_capture
+from rabbitmq.replay import replay_messages, format_replay_stats
+from rabbitmq.ingest import set_ingest_process_default, stop_ingest_process
+from rabbitmq.leaders import set_leader_aware_default
+from rabbitmq.warm_cache import close_warm_connections
 
 from rich.live import Live
 from rich.console import Console
 from rich.panel import Panel
-from rich.traceback import install
+
+mark_once('imports')
+
+
+def parse_args(argv=None):
+    """
+    Interpreta gli argomenti da riga di comando.
+    
+    Args:
+        argv (list, optional): Argomenti da interpretare. Defaults to sys.argv[1:].
+    
+    Returns:
+        argparse.Namespace: Opzioni di avvio
+    """
+    parser = argparse.ArgumentParser(description="LT Superstar - Monitoraggio code RabbitMQ")
+    parser.add_argument("--splash", action="store_true",
+                        help="mostra boot animation, benvenuto e messaggi di stato temporizzati")
+    parser.add_argument("--debug", action="store_true",
+                        help="abilita i traceback avanzati di rich con le variabili locali")
+    parser.add_argument("--max-messages", type=int, default=MAX_MESSAGES, metavar="N",
+                        help=f"messaggi trattenuti in memoria e indicizzati per la ricerca (default: {MAX_MESSAGES})")
+    parser.add_argument("--connect", metavar="NOME",
+                        help="si connette subito alla connessione salvata con questo nome")
+    parser.add_argument("--benchmark-startup", action="store_true",
+                        help="misura time to first frame e time to first message, poi esce")
+    parser.add_argument("--benchmark-timeout", type=float, default=30.0, metavar="SECONDI",
+                        help="attesa massima del primo messaggio nel benchmark (default: 30)")
+    parser.add_argument("--capture", metavar="FILE",
+                        help="salva i messaggi elaborati in un file di cattura JSONL (ripubblicabile)")
+    parser.add_argument("--ingest-process", action="store_true",
+                        help="riceve i messaggi in un processo separato tramite memoria condivisa")
+    parser.add_argument("--leader-aware", action="store_true",
+                        help="apre una connessione per nodo e consuma ogni coda dal suo leader")
+    parser.add_argument("--no-prefetch", action="store_true",
+                        help="non precarica in background le connessioni usate di recente")
+    
+    subparsers = parser.add_subparsers(dest="command")
+    
+    export_parser = subparsers.add_parser("export", help="esporta i log dei messaggi in CSV/Parquet/Arrow")
+    export_parser.add_argument("inputs", nargs="*", metavar="LOG",
+                               help="file di log da esportare (default: tutti i log in ~/.rmq_messages_log)")
+    export_parser.add_argument("-o", "--output", required=True, help="file di destinazione")
+    export_parser.add_argument("--format", choices=EXPORT_FORMATS,
+                               help="formato di esportazione (default: dall'estensione del file)")
+    export_parser.add_argument("--headers", default="",
+                               help="header da esportare come colonne, separati da virgola")
+    
+    replay_parser = subparsers.add_parser("replay", help="ripubblica i messaggi di un file di cattura")
+    replay_parser.add_argument("inputs", nargs="+", metavar="CATTURA", help="file di cattura JSONL")
+    replay_parser.add_argument("--connection", required=True, metavar="NOME",
+                               help="connessione salvata su cui ripubblicare")
+    replay_parser.add_argument("--exchange", help="exchange di destinazione (default: quello originale)")
+    replay_parser.add_argument("--routing-key", help="routing key di destinazione (default: quella originale)")
+    replay_parser.add_argument("--rate", type=float, default=0, metavar="MSG/S",
+                               help="messaggi al secondo (default: il più veloce possibile)")
+    replay_parser.add_argument("--max-in-flight", type=int, default=REPLAY_MAX_IN_FLIGHT, metavar="N",
+                               help=f"pubblicazioni non confermate ammesse (default: {REPLAY_MAX_IN_FLIGHT})")
+    
+    peek_parser = subparsers.add_parser("peek", help="legge i primi messaggi di una coda e li rimette in coda")
+    peek_parser.add_argument("queue", metavar="CODA", help="coda da ispezionare")
+    peek_parser.add_argument("--connection", required=True, metavar="NOME", help="connessione salvata da usare")
+    peek_parser.add_argument("-n", "--count", type=int, default=PEEK_DEFAULT_COUNT, metavar="N",
+                             help=f"numero massimo di messaggi (default: {PEEK_DEFAULT_COUNT})")
+    
+    bench_parser = subparsers.add_parser("bench", help="benchmark di throughput del broker e dell'explorer")
+    bench_subparsers = bench_parser.add_subparsers(dest="bench_command", required=True)
+    publish_parser = bench_subparsers.add_parser("publish", help="pubblica messaggi sintetici e li riconsuma")
+    target = publish_parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--connection", metavar="NOME", help="connessione salvata da usare")
+    target.add_argument("--loopback", action="store_true",
+                        help="usa un broker in-process (misura solo l'ingestione dell'explorer)")
+    publish_parser.add_argument("--connections", type=int, default=1, metavar="N",
+                                help="connessioni di pubblicazione (default: 1)")
+    publish_parser.add_argument("--channels", type=int, default=1, metavar="N",
+                                help="canali per connessione (default: 1)")
+    publish_parser.add_argument("--messages", type=int, default=10000, metavar="N",
+                                help="messaggi totali (default: 10000)")
+    publish_parser.add_argument("--size", type=int, default=256, metavar="BYTE",
+                                help="dimensione del corpo (default: 256)")
+    publish_parser.add_argument("--rate", type=float, default=0, metavar="MSG/S",
+                                help="ritmo complessivo (default: il più veloce possibile)")
+    publish_parser.add_argument("--persistent", action="store_true", help="pubblica con delivery_mode=2")
+    publish_parser.add_argument("--confirm", action="store_true", help="attende la conferma di ogni messaggio")
+    return parser.parse_args(argv)
+
+
+def run_export_command(args):
+    """
+    Esegue l'esportazione da riga di comando, senza interfaccia interattiva.
+    
+    Args:
+        args (argparse.Namespace): Opzioni del sottocomando export
+    
+    Returns:
+        int: Codice di uscita
+    """
+    inputs = args.inputs
+    if not inputs:
+        log_dir = ensure_log_directory()
+        inputs = sorted(
+            os.path.join(log_dir, filename)
+            for filename in os.listdir(log_dir)
+            if filename.startswith('messages_') and filename.endswith('.log')
+        )
+    header_names = [name.strip() for name in args.headers.split(",") if name.strip()]
+    
+    # I file di cattura JSONL conservano header e corpo originali; gli altri sono log testuali
+    if inputs and all(path.endswith('.jsonl') for path in inputs):
+        messages = iter_capture_messages(inputs)
+    else:
+        messages = iter_log_messages(inputs)
+    
+    try:
+        stats = export_messages(messages, args.output, args.format, header_names)
+    except (OSError, ValueError, RuntimeError) as e:
+        print(f"Esportazione fallita: {e}")
+        return 1
+    
+    print(f"Esportati {stats['rows']} messaggi in {stats['path']} ({stats['format']}) "
+          f"in {stats['elapsed']:.2f}s")
+    return 0
+
+
+def run_replay_command(args):
+    """
+    Ripubblica da riga di comando i messaggi di uno o più file di cattura.
+    
+    Args:
+        args (argparse.Namespace): Opzioni del sottocomando replay
+    
+    Returns:
+        int: Codice di uscita (1 anche se il broker ha rifiutato dei messaggi)
+    """
+    connection = find_connection_by_name(get_connections_config(), args.connection)
+    if connection is None:
+        print(f"Connessione '{args.connection}' non trovata")
+        return 1
+    
+    try:
+        stats = replay_messages(
+            connection,
+            iter_capture_messages(args.inputs),
+            exchange=args.exchange,
+            routing_key=args.routing_key,
+            rate=args.rate,
+            max_in_flight=args.max_in_flight
+        )
+    except (OSError, RuntimeError) as e:
+        print(f"Replay fallito: {e}")
+        return 1
+    
+    print(format_replay_stats(stats))
+    return 1 if stats['nacked'] or stats['unconfirmed'] else 0
+
+
+def run_peek_command(args):
+    """
+    Stampa i primi messaggi di una coda, in ordine di coda, e il tempo impiegato.
+    
+    Args:
+        args (argparse.Namespace): Opzioni del sottocomando peek
+    
+    Returns:
+        int: Codice di uscita
+    """
+    from rabbitmq.peek import peek_queue, format_peek_stats
+    
+    connection = find_connection_by_name(get_connections_config(), args.connection)
+    if connection is None:
+        print(f"Connessione '{args.connection}' non trovata")
+        return 1
+    
+    try:
+        stats = peek_queue(connection, args.queue, args.count)
+    except Exception as e:
+        print(f"Peek fallito: {e}")
+        return 1
+    
+    for position, message in enumerate(reversed(stats['messages']), 1):
+        print(f"#{position} {message['exchange']}/{message['routing_key']} ({message['size']} byte)")
+        print(message['body'])
+        print("-" * 50)
+    print(format_peek_stats(stats))
+    return 0
+
+
+def run_bench_command(args):
+    """
+    Esegue il benchmark di pubblicazione e ne stampa il riepilogo.
+    
+    Args:
+        args (argparse.Namespace): Opzioni del sottocomando bench publish
+    
+    Returns:
+        int: Codice di uscita
+    """
+    from rabbitmq.bench import run_publish_benchmark, format_benchmark_stats
+    
+    connection = None
+    if args.connection:
+        connection = find_connection_by_name(get_connections_config(), args.connection)
+        if connection is None:
+            print(f"Connessione '{args.connection}' non trovata")
+            return 1
+    
+    try:
+        stats = run_publish_benchmark(
+            connection,
+            connections=args.connections,
+            channels=args.channels,
+            messages=args.messages,
+            size=args.size,
+            rate=args.rate,
+            persistent=args.persistent,
+            confirm=args.confirm,
+            loopback=args.loopback
+        )
+    except Exception as e:
+        print(f"Benchmark fallito: {e}")
+        return 1
+    
+    print(format_benchmark_stats(stats))
+    return 0 if stats['received'] == stats['published'] else 1
 
 
 def check_python_version():
@@ -62,19 +295,74 @@ def setup_environment():
         print(f"Errore nella pulizia dei log: {e}")
 
 
-def main():
+def find_connection_by_name(connections, name):
+    """Ritorna la connessione salvata con il nome indicato, o None"""
+    for connection in connections:
+        if connection.get('name') == name:
+            return connection
+    return None
+
+
+def run_startup_benchmark(live, connection, timeout):
+    """
+    Si connette alla connessione indicata e attende il primo messaggio consumato.
+    
+    Args:
+        live (Live): Istanza di Live per l'aggiornamento dell'interfaccia
+        connection (dict): Connessione da usare, o None per misurare solo il primo frame
+        timeout (float): Attesa massima del primo messaggio in secondi
+    """
+    if connection is None:
+        return
+    
+    from rabbitmq.connection import run_consumer_for_connection
+    if not run_consumer_for_connection(connection, live):
+        return
+    mark_once('connected')
+    
+    deadline = time.perf_counter() + timeout
+    while get_mark('first_message') is None and time.perf_counter() < deadline:
+        time.sleep(0.01)
+
+
+def main(argv=None):
     """Funzione principale dell'applicazione."""
+    args = parse_args(argv)
+    
+    if args.command == "export":
+        return run_export_command(args)
+    if args.command == "replay":
+        return run_replay_command(args)
+    if args.command == "bench":
+        return run_bench_command(args)
+    if args.command == "peek":
+        return run_peek_command(args)
+    
     # Verifica la versione di Python
     check_python_version()
     
-    # Configura l'ambiente
-    setup_environment()
+    if keyboard is None and not args.benchmark_startup:
+        print("Il pacchetto 'keyboard' non è installato. Esegui: pip install -r requirements.txt")
+        return 1
+    
+    # Pulizia dei log in background: non deve ritardare il primo frame
+    threading.Thread(target=setup_environment, daemon=True).start()
     
     # Inizializza variabili globali e configurazioni
     initialize_globals()
+    set_fast_start(not args.splash)
+    set_max_messages(args.max_messages)
+    if args.capture:
+        start_capture(args.capture)
+    if args.ingest_process:
+        set_ingest_process_default(True)
+    if args.leader_aware:
+        set_leader_aware_default(True)
     
-    # Abilita traceback avanzati per il debug
-    install(show_locals=True)
+    # Traceback avanzati solo su richiesta: show_locals rallenta avvio e gestione errori
+    if args.debug:
+        from rich.traceback import install
+        install(show_locals=True)
     console = Console()
     
     # Avvia il log dell'applicazione
@@ -85,23 +373,25 @@ def main():
     })
     
     try:
-        # Mostra la boot animation
-        boot_animation(duration=2)
-        
-        # Mostra messaggio di benvenuto per la nuova versione con scoperta dinamica
-        console.print(Panel(
-            "LT Superstar - Versione con Scoperta Dinamica delle Code\n"
-            "Questa versione non richiede l'accesso alla API Management di RabbitMQ.",
-            title="Benvenuto",
-            style="bold cyan"
-        ))
-        time.sleep(1)
+        if args.splash:
+            # Mostra la boot animation
+            from ui.animations import boot_animation
+            boot_animation(duration=2)
+            
+            # Mostra messaggio di benvenuto per la nuova versione con scoperta dinamica
+            console.print(Panel(
+                "LT Superstar - Versione con Scoperta Dinamica delle Code\n"
+                "Questa versione non richiede l'accesso alla API Management di RabbitMQ.",
+                title="Benvenuto",
+                style="bold cyan"
+            ))
+            time.sleep(1)
         
         # Carica le connessioni salvate
         connections = get_connections_config()
         
         # Se non ci sono connessioni, chiede all'utente di crearne una nuova
-        if not connections:
+        if not connections and not args.benchmark_startup:
             console.print(Panel("Nessuna connessione salvata. Crea una nuova connessione.", style="cyan"))
             connection = add_new_connection()
             connections = get_connections_config()  # Ricarica le connessioni
@@ -109,7 +399,8 @@ def main():
         # Inizializza variabili di controllo per l'interfaccia
         selected_index = 0
         last_refresh_time = time.time()
-        auto_refresh_interval = 1.0  # Aggiorna ogni secondo
+        auto_refresh_interval = 1.0  # Aggiorna almeno ogni secondo (valori che dipendono dal tempo)
+        rendered_version = get_version()  # Versione dello stato all'ultimo aggiornamento
         connection_status_check_interval = 5.0  # Controlla stato connessione ogni 5 secondi
         last_connection_check_time = time.time()
         
@@ -117,22 +408,49 @@ def main():
         with Live(create_full_layout(selected_index), refresh_per_second=4, screen=True) as live:
             # Imposta l'istanza live globalmente per l'uso nei callback
             set_live_instance(live)
+            mark_once('first_frame')
+            
+            auto_connection = None
+            if args.connect:
+                auto_connection = find_connection_by_name(connections, args.connect)
+                if auto_connection is None:
+                    log_error(f"Connessione '{args.connect}' non trovata")
+            
+            if args.benchmark_startup:
+                run_startup_benchmark(live, auto_connection, args.benchmark_timeout)
+                live.stop()
+                console.print(Panel(format_marks(), title="Benchmark di avvio", style="cyan"))
+                return 0
             
             # Importa il gestore tastiera
-            from ui.keyboard_handler import handle_keyboard_events
+            from ui.keyboard_handler import handle_keyboard_events, is_prompt_open
             
             # Registra il gestore degli eventi della tastiera
             handle_keyboard_events(live, connections, selected_index)
             
+            # Broker usati di recente connessi in background: il primo passaggio è immediato
+            if not args.no_prefetch:
+                from rabbitmq.connection import prefetch_connections
+                prefetch_connections(connections, exclude=auto_connection)
+            
+            if auto_connection is not None:
+                from rabbitmq.connection import run_consumer_for_connection
+                run_consumer_for_connection(auto_connection, live)
+            
             try:
                 # Loop principale dell'applicazione
                 while True:
                     current_time = time.time()
                     
-                    # Aggiorna la schermata a intervalli regolari
-                    if current_time - last_refresh_time >= auto_refresh_interval:
+                    # Aggiorna la schermata quando lo stato cambia (al massimo ogni RENDER_MIN_INTERVAL)
+                    # e comunque a intervalli regolari
+                    state_version = get_version()
+                    elapsed = current_time - last_refresh_time
+                    if (state_version != rendered_version and elapsed >= RENDER_MIN_INTERVAL) \
+                            or elapsed >= auto_refresh_interval:
                         live.update(create_full_layout(get_selected_index()))
                         last_refresh_time = current_time
+                        rendered_version = state_version
                     
                     # Controlla lo stato della connessione a intervalli regolari
                     if current_time - last_connection_check_time >= connection_status_check_interval:
@@ -159,7 +477,7 @@ def main():
                                     )
                                     
                                     # Reset della connessione attiva
-                                    from utils.constants import set_active_connection
+                                    from utils.state import set_active_connection
                                     set_active_connection(None)
                                     
                                     # Aggiorna l'interfaccia
@@ -167,13 +485,21 @@ def main():
                         
                         last_connection_check_time = current_time
                     
+                    # Rilascia il reservoir del campionamento quando il traffico si ferma
+                    if get_active_connection():
+                        for delivery in flush_expired_window():
+                            process_delivery(*delivery)
+                    
                     # MODIFICA: Verifica direttamente i tasti premuti
-                    if keyboard.is_pressed('q'):
+                    if keyboard.is_pressed('q') and not is_prompt_open():
                         print("\nUscita dall'applicazione...")
                         break
                     
-                    # Evita utilizzo elevato della CPU
-                    time.sleep(0.1)
+                    # Attende un cambiamento dello stato invece di dormire a vuoto (max 0.1s per il tasto Q)
+                    if get_version() == rendered_version:
+                        wait_for_change(rendered_version, 0.1)
+                    else:
+                        time.sleep(0.05)
                     
             except KeyboardInterrupt:
                 # Gestisci uscita con Ctrl+C
@@ -200,16 +526,30 @@ def main():
             'timestamp': time.strftime('%Y-%m-%d %H:%M:%S')
         })
         
-        # Chiudi eventuali connessioni attive
+        # Scrive subito eventuali salvataggi differiti della configurazione
+        flush_connections_config()
+        
+        # Ferma il pool di decodifica dei payload
+        shutdown_decoders()
+        
+        # Chiude il file di cattura
+        stop_capture()
+        
+        # Chiudi le connessioni tenute in cache e quella attiva
+        close_warm_connections()
         try:
             active_connection = get_active_connection()
             if active_connection:
                 consumer = active_connection.get('dynamic_consumer')
                 if consumer and hasattr(consumer, 'disconnect'):
                     consumer.disconnect()
+                # Il processo di ingest chiude la sua connessione, il lettore rimuove il buffer condiviso
+                active_connection['closing'] = True
+                if stop_ingest_process(active_connection):
+                    active_connection['consumer_thread'].join(2)
         except Exception as shutdown_error:
             log_error(f"Errore durante la chiusura: {shutdown_error}")
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    sys.exit(main())
\ No newline at end of file
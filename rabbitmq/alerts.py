@@ -0,0 +1,235 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Allarmi a soglia valutati su ogni snapshot delle code.
+Lo snapshot viene trasformato in una tabella colonnare e ogni regola opera su colonne intere.
+
+Sintassi delle regole:
+    messages > 10000
+    consumers = 0 and messages > 0 for 60
+    publish_rate > deliver_rate for 120
+
+Colonne: messages, ready, unacked, consumers, publish_rate, deliver_rate.
+Il valore di confronto può essere un numero o un'altra colonna; "for N" richiede che la
+condizione resti vera per N secondi prima di far scattare l'allarme.
+
+NumPy è opzionale: senza, le colonne sono array della libreria standard e ogni condizione
+viene applicata all'intera colonna con map() sugli operatori di operator, senza cicli Python
+per riga. È il percorso previsto per l'installazione di base, non un ripiego d'emergenza.
+"""
+import operator
+import re
+import threading
+import time
+from array import array
+from itertools import compress, repeat
+
+from utils.constants import DEFAULT_ALERT_RULES
+from utils.logger import log_alerts, log_error
+
+# Dipendenza opzionale: senza NumPy le colonne sono array della libreria standard
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+ALERT_COLUMNS = ("messages", "ready", "unacked", "consumers", "publish_rate", "deliver_rate")
+_OPS = {
+    ">": operator.gt, "<": operator.lt, ">=": operator.ge, "<=": operator.le,
+    "=": operator.eq, "==": operator.eq, "!=": operator.ne,
+}
+_CONDITION_RE = re.compile(r"^\s*(\w+)\s*(>=|<=|==|!=|=|>|<)\s*(\S+)\s*$")
+_DURATION_RE = re.compile(r"^(.*?)\s+for\s+(\d+(?:\.\d+)?)\s*s?\s*$", re.IGNORECASE)
+
+_lock = threading.Lock()
+_pending = {}  # regola -> {coda: istante in cui la condizione è diventata vera}
+_firing = {}  # regola -> {coda: istante in cui l'allarme è scattato}
+_last_elapsed = 0.0
+
+
+def parse_alert_rule(text):
+    """
+    Interpreta una regola di allarme.
+
+    Args:
+        text (str): Regola (es. "consumers = 0 and messages > 0 for 60")
+
+    Returns:
+        dict: {'text', 'conditions': [(colonna, op, numero o colonna)], 'duration'}
+
+    Raises:
+        ValueError: Se la regola non è valida
+    """
+    body = text.strip()
+    duration = 0.0
+    match = _DURATION_RE.match(body)
+    if match:
+        body, duration = match.group(1), float(match.group(2))
+
+    conditions = []
+    for part in re.split(r"\s+and\s+", body, flags=re.IGNORECASE):
+        match = _CONDITION_RE.match(part)
+        if not match:
+            raise ValueError(f"Condizione non valida: {part!r}")
+        column, op, operand = match.groups()
+        if column not in ALERT_COLUMNS:
+            raise ValueError(f"Colonna sconosciuta: {column}")
+        if operand not in ALERT_COLUMNS:
+            try:
+                operand = float(operand)
+            except ValueError:
+                raise ValueError(f"Valore non valido: {operand}")
+        conditions.append((column, op, operand))
+    return {'text': text.strip(), 'conditions': conditions, 'duration': duration}
+
+
+def get_alert_rules(connection_config):
+    """
+    Ritorna le regole compilate della connessione, in cache nella configurazione di runtime.
+    Le regole non valide vengono registrate negli errori e ignorate.
+
+    Args:
+        connection_config (dict): Configurazione di connessione (chiave 'alert_rules')
+
+    Returns:
+        list: Regole compilate
+    """
+    texts = tuple(connection_config.get('alert_rules') or DEFAULT_ALERT_RULES)
+    cached = connection_config.get('compiled_alert_rules')
+    if cached is not None and cached[0] == texts:
+        return cached[1]
+
+    rules = []
+    for text in texts:
+        try:
+            rules.append(parse_alert_rule(text))
+        except ValueError as e:
+            log_error(f"Regola di allarme ignorata ({text}): {e}")
+    connection_config['compiled_alert_rules'] = (texts, rules)
+    return rules
+
+
+def _column_values(queues_data, column):
+    if column == "publish_rate" or column == "deliver_rate":
+        key = "publish_details" if column == "publish_rate" else "deliver_get_details"
+        return [(((queue.get("message_stats") or {}).get(key) or {}).get("rate") or 0) for queue in queues_data]
+    key = {"ready": "messages_ready", "unacked": "messages_unacknowledged"}.get(column, column)
+    values = list(map(dict.get, queues_data, repeat(key, len(queues_data))))
+    if None in values:
+        # Campi assenti o nulli nello snapshot
+        values = [value or 0 for value in values]
+    return values
+
+
+def build_queue_table(queues_data):
+    """
+    Converte uno snapshot delle code in una tabella colonnare.
+
+    Args:
+        queues_data (list): Snapshot delle code dall'API Management
+
+    Returns:
+        tuple: (nomi delle code, {colonna: array di float})
+    """
+    names = [queue.get("name", "") for queue in queues_data]
+    columns = {}
+    for column in ALERT_COLUMNS:
+        values = _column_values(queues_data, column)
+        if numpy is not None:
+            columns[column] = numpy.fromiter(values, dtype=numpy.float64, count=len(names))
+        else:
+            columns[column] = array("d", values)
+    return names, columns
+
+
+def _matching_indices(columns, conditions):
+    """Indici delle righe che soddisfano tutte le condizioni"""
+    if numpy is not None:
+        mask = None
+        for column, op, operand in conditions:
+            right = columns[operand] if isinstance(operand, str) else operand
+            result = _OPS[op](columns[column], right)
+            mask = result if mask is None else mask & result
+        return numpy.flatnonzero(mask).tolist() if mask is not None else []
+
+    # Senza NumPy: ogni condizione produce una maschera di byte 0/1 sull'intera colonna
+    mask = None
+    for column, op, operand in conditions:
+        left = columns[column]
+        right = columns[operand] if isinstance(operand, str) else repeat(operand, len(left))
+        result = bytes(map(_OPS[op], left, right))
+        mask = result if mask is None else bytes(map(operator.and_, mask, result))
+        if 1 not in mask:
+            return []
+    return list(compress(range(len(mask)), mask)) if mask is not None else []
+
+
+def evaluate_alerts(connection_config, queues_data, now=None):
+    """
+    Valuta le regole sullo snapshot, registra gli allarmi che scattano o rientrano.
+
+    Args:
+        connection_config (dict): Configurazione di connessione
+        queues_data (list): Snapshot delle code
+        now (float, optional): Istante della valutazione (time.monotonic)
+
+    Returns:
+        float: Durata della valutazione in secondi
+    """
+    global _last_elapsed
+    started = time.perf_counter()
+    now = time.monotonic() if now is None else now
+    rules = get_alert_rules(connection_config)
+    names, columns = build_queue_table(queues_data)
+
+    alert_lines = []
+    with _lock:
+        for rule in rules:
+            matched = {names[index] for index in _matching_indices(columns, rule['conditions'])}
+            rule_text = rule['text']
+            pending = _pending.setdefault(rule_text, {})
+            firing = _firing.setdefault(rule_text, {})
+
+            # Condizioni non più vere: l'allarme rientra
+            for queue_name in [queue_name for queue_name in pending if queue_name not in matched]:
+                del pending[queue_name]
+                if firing.pop(queue_name, None) is not None:
+                    alert_lines.append(f"RIENTRATO [{queue_name}] {rule_text}")
+
+            for queue_name in matched:
+                since = pending.setdefault(queue_name, now)
+                if queue_name not in firing and now - since >= rule['duration']:
+                    firing[queue_name] = now
+                    alert_lines.append(f"ATTIVO [{queue_name}] {rule_text}")
+
+        _last_elapsed = time.perf_counter() - started
+
+    log_alerts(alert_lines)
+    return _last_elapsed
+
+
+def reset_alerts():
+    """Azzera lo stato degli allarmi (es. al cambio di connessione)"""
+    with _lock:
+        _pending.clear()
+        _firing.clear()
+
+
+def get_firing_alerts():
+    """
+    Ritorna gli allarmi attivi raggruppati per coda.
+
+    Returns:
+        dict: Nome coda -> lista delle regole attive
+    """
+    with _lock:
+        firing = {}
+        for rule_text, queues in _firing.items():
+            for queue_name in queues:
+                firing.setdefault(queue_name, []).append(rule_text)
+        return firing
+
+
+def get_alert_evaluation_time():
+    """Ritorna la durata dell'ultima valutazione in secondi"""
+    return _last_elapsed
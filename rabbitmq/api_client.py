@@ -4,19 +4,32 @@
 Client per l'API Management di RabbitMQ
 """
 import urllib.parse
-import requests
 from rich.console import Console
 from rich.panel import Panel
 from utils.logger import log_error
+from utils.state import bump_version
 
 console = Console()
 
-def get_queues_from_api(config):
+
+def _api_get(api_url, auth, timeout=10):
+    """
+    Esegue una GET verso l'API Management.
+    requests viene importato solo al primo utilizzo per non rallentare l'avvio.
+    """
+    import requests
+    return requests.get(api_url, auth=auth, timeout=timeout)
+
+
+def get_queues_from_api(config, quiet=False, timeout=10):
     """
     Recupera la lista di tutte le code utilizzando l'API Management di RabbitMQ.
     
     Args:
         config (dict): Configurazione di connessione con host, vhost, user, password
+        quiet (bool): Registra gli errori solo nel log, senza pannelli sulla console
+            (es. richieste in background mentre l'interfaccia è attiva)
+        timeout (float): Timeout della richiesta in secondi
     
     Returns:
         list: Lista di dizionari con i dettagli di ogni coda
@@ -31,10 +44,13 @@ def get_queues_from_api(config):
         auth = (config['user'], config['password'])
         
         # Make request
-        response = requests.get(api_url, auth=auth, timeout=10)
+        response = _api_get(api_url, auth, timeout)
         
         if response.status_code == 200:
             return response.json()
+        elif quiet:
+            log_error(f"Errore nella richiesta API: {response.status_code} - {response.text}")
+            return []
         else:
             console.print(
                 Panel(
@@ -46,6 +62,8 @@ def get_queues_from_api(config):
             return []
     except Exception as e:
         log_error(f"Errore nella richiesta API: {e}")
+        if quiet:
+            return []
         console.print(
             Panel(
                 f"Errore nella connessione all'API RabbitMQ: {e}",
@@ -55,12 +73,13 @@ def get_queues_from_api(config):
         )
         return []
 
-def filter_consumable_queues(queues_data):
+def filter_consumable_queues(queues_data, queue_filter=None):
     """
-    Filtra le code escludendo quelle "exclusive".
+    Filtra le code escludendo quelle "exclusive" e quelle scartate dal filtro.
     
     Args:
         queues_data (list): Lista di dizionari con i dettagli delle code
+        queue_filter (callable, optional): Predicato compilato (vedi rabbitmq.queue_filter)
     
     Returns:
         list: Lista di nomi delle code consumabili
@@ -73,28 +92,33 @@ def filter_consumable_queues(queues_data):
         # Skip exclusive queues
         if queue.get("exclusive", False):
             continue
+        if queue_filter is not None and not queue_filter(queue):
+            continue
         consumable_queues.append(queue["name"])
     
     return consumable_queues
 
-def setup_api_client(connection_config):
+def setup_api_client(connection_config, quiet=False, timeout=10):
     """
     Configura il client API per RabbitMQ Management
     
     Args:
         connection_config (dict): Configurazione della connessione
+        quiet (bool): Errori solo nel log, senza pannelli sulla console
+        timeout (float): Timeout della richiesta in secondi
         
     Returns:
         tuple: (success, api_client_info)
     """
     try:
         # Test API connection
-        queues = get_queues_from_api(connection_config)
+        queues = get_queues_from_api(connection_config, quiet=quiet, timeout=timeout)
         
         if queues:
             # Add API connection info to config
             connection_config['api_connected'] = True
             connection_config['queues_data'] = queues
+            bump_version('queues')
             
             # Return success
             return True, {'type': 'api_client', 'queues_count': len(queues)}
@@ -104,6 +128,49 @@ def setup_api_client(connection_config):
         log_error(f"Errore nella configurazione API client: {e}")
         return False, None
 
+def get_nodes_from_api(config):
+    """
+    Recupera la lista dei nodi del cluster utilizzando l'API Management.
+    
+    Args:
+        config (dict): Configurazione di connessione
+        
+    Returns:
+        list: Lista di dizionari con i dettagli dei nodi (name, running, ...)
+    """
+    try:
+        # Build API URL
+        host = config['host']
+        api_url = f"http://{host}:15672/api/nodes"
+        
+        # Authentication
+        auth = (config['user'], config['password'])
+        
+        # Make request
+        response = _api_get(api_url, auth)
+        
+        if response.status_code == 200:
+            return response.json()
+        else:
+            log_error(f"Errore nella richiesta API nodes: {response.status_code} - {response.text}")
+            return []
+    except Exception as e:
+        log_error(f"Errore nella richiesta API nodes: {e}")
+        return []
+
+def queue_leader(queue):
+    """
+    Ritorna il nodo che ospita una coda: il leader per le quorum queue e gli stream,
+    il nodo della coda per le classic queue.
+    
+    Args:
+        queue (dict): Coda come restituita da /api/queues
+        
+    Returns:
+        str: Nome del nodo (es. "rabbit@node1"), o None se non indicato
+    """
+    return queue.get("leader") or queue.get("node")
+
 def get_all_exchanges(config):
     """
     Recupera la lista di tutti gli exchange utilizzando l'API Management.
@@ -124,7 +191,7 @@ def get_all_exchanges(config):
         auth = (config['user'], config['password'])
         
         # Make request
-        response = requests.get(api_url, auth=auth, timeout=10)
+        response = _api_get(api_url, auth)
         
         if response.status_code == 200:
             return response.json()
@@ -157,7 +224,7 @@ def get_queue_bindings(config, queue_name):
         auth = (config['user'], config['password'])
         
         # Make request
-        response = requests.get(api_url, auth=auth, timeout=10)
+        response = _api_get(api_url, auth)
         
         if response.status_code == 200:
             return response.json()
@@ -168,6 +235,37 @@ def get_queue_bindings(config, queue_name):
         log_error(f"Errore nella richiesta API bindings: {e}")
         return []
 
+def get_vhost_bindings(config):
+    """
+    Recupera tutti i binding del vhost con una sola richiesta.
+    
+    Args:
+        config (dict): Configurazione di connessione
+        
+    Returns:
+        list: Lista di dizionari con i dettagli dei binding, None se la richiesta fallisce
+    """
+    try:
+        # Build API URL
+        host = config['host']
+        vhost = urllib.parse.quote_plus(config['vhost'])
+        api_url = f"http://{host}:15672/api/bindings/{vhost}"
+        
+        # Authentication
+        auth = (config['user'], config['password'])
+        
+        # Make request
+        response = _api_get(api_url, auth)
+        
+        if response.status_code == 200:
+            return response.json()
+        else:
+            log_error(f"Errore nella richiesta API bindings: {response.status_code} - {response.text}")
+            return None
+    except Exception as e:
+        log_error(f"Errore nella richiesta API bindings: {e}")
+        return None
+
 def refresh_queues_data(config):
     """
     Aggiorna i dati delle code nella configurazione.
@@ -182,6 +280,7 @@ def refresh_queues_data(config):
         queues = get_queues_from_api(config)
         if queues:
             config['queues_data'] = queues
+            bump_version('queues')
             return True
         return False
     except Exception as e:
@@ -0,0 +1,231 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Generatore di carico e benchmark di throughput: pubblica messaggi sintetici su N connessioni
+e li riconsuma con setup_consumer, misurando throughput end-to-end e latenze.
+"""
+import math
+import threading
+import time
+import uuid
+from array import array
+
+from config.connections import new_runtime_connection
+from rabbitmq.consumer import setup_consumer, set_delivery_observer
+from rabbitmq.loopback import LoopbackBroker, BasicProperties as LoopbackProperties
+from utils.constants import BENCH_HEADER, BENCH_DRAIN_TIMEOUT
+from utils.logger import log_error
+
+
+def percentile(sorted_values, fraction):
+    """
+    Percentile nearest-rank di una sequenza già ordinata.
+
+    Args:
+        sorted_values (sequence): Valori ordinati
+        fraction (float): Percentile in [0, 1]
+
+    Returns:
+        float: Valore del percentile (0.0 se la sequenza è vuota)
+    """
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, math.ceil(fraction * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+
+def _open_connection(connection_config, broker):
+    if broker is not None:
+        return broker.connect()
+
+    import pika  # Importato al primo utilizzo per non rallentare l'avvio
+    credentials = pika.PlainCredentials(connection_config['user'], connection_config['password'])
+    parameters = pika.ConnectionParameters(
+        host=connection_config['host'],
+        virtual_host=connection_config['vhost'],
+        credentials=credentials,
+        heartbeat=15,
+    )
+    return pika.BlockingConnection(parameters)
+
+
+def _make_properties(broker, persistent):
+    if broker is not None:
+        properties_class = LoopbackProperties
+    else:
+        import pika
+        properties_class = pika.BasicProperties
+    return lambda: properties_class(
+        content_type="text/plain",
+        delivery_mode=2 if persistent else 1,
+        headers={BENCH_HEADER: time.time()},
+    )
+
+
+def _publisher(connection_config, broker, queue_name, channels, count, body, rate, persistent, confirm, stats):
+    """Thread di pubblicazione: una connessione con più canali usati a rotazione"""
+    try:
+        connection = _open_connection(connection_config, broker)
+    except Exception as e:
+        stats['errors'].append(f"Connessione publisher fallita: {e}")
+        return
+
+    try:
+        channel_list = [connection.channel() for _ in range(max(1, channels))]
+        if confirm:
+            for channel in channel_list:
+                channel.confirm_delivery()
+        make_properties = _make_properties(broker, persistent)
+
+        started = time.monotonic()
+        for sent in range(count):
+            if rate:
+                delay = started + sent / rate - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+            channel = channel_list[sent % len(channel_list)]
+            try:
+                # Con confirm_delivery attivo basic_publish attende la conferma del broker
+                channel.basic_publish('', queue_name, body, make_properties())
+            except Exception as e:
+                with stats['lock']:
+                    stats['nacked'] += 1
+                if not connection.is_open:
+                    stats['errors'].append(f"Connessione publisher chiusa: {e}")
+                    return
+                continue
+            with stats['lock']:
+                stats['published'] += 1
+    finally:
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+
+def run_publish_benchmark(connection_config=None, connections=1, channels=1, messages=10000, size=256,
+                          rate=0, persistent=False, confirm=False, loopback=False,
+                          drain_timeout=BENCH_DRAIN_TIMEOUT):
+    """
+    Pubblica messaggi sintetici su una coda temporanea e li riconsuma tramite setup_consumer.
+
+    Args:
+        connection_config (dict): Connessione salvata (ignorata con loopback)
+        connections (int): Connessioni di pubblicazione, ognuna su un thread
+        channels (int): Canali per connessione
+        messages (int): Messaggi totali da pubblicare
+        size (int): Dimensione del corpo in byte
+        rate (float): Messaggi al secondo complessivi (0 = il più veloce possibile)
+        persistent (bool): Pubblica con delivery_mode=2
+        confirm (bool): Attende la conferma del broker per ogni pubblicazione
+        loopback (bool): Usa il broker in-process invece di RabbitMQ
+        drain_timeout (float): Attesa massima del consumer dopo l'ultima pubblicazione
+
+    Returns:
+        dict: Statistiche di pubblicazione, throughput end-to-end e percentili di latenza (ms)
+    """
+    broker = LoopbackBroker() if loopback else None
+    connection_config = connection_config or {'name': 'loopback', 'host': 'loopback', 'vhost': '/'}
+    connections = max(1, connections)
+    body = (b"x" * size)
+
+    # Il consumer usa le stesse impostazioni della connessione ma consuma tutto, senza filtri
+    bench_config = new_runtime_connection(connection_config)
+    bench_config.update({'consume_mode': 'consume', 'sampling_mode': 'all', 'message_filter': ''})
+
+    consumer_connection = _open_connection(connection_config, broker)
+    consumer_channel = consumer_connection.channel()
+    queue_name = consumer_channel.queue_declare(
+        queue=f"lt-superstar.bench.{uuid.uuid4().hex[:8]}", exclusive=True, auto_delete=True
+    ).method.queue
+
+    latencies = array('d')
+    received = {'count': 0, 'first': None, 'last': None, 'target': messages}
+    done = threading.Event()
+
+    def observe(observed_queue, properties, observed_body):
+        if observed_queue != queue_name:
+            return
+        now = time.time()
+        sent = (getattr(properties, 'headers', None) or {}).get(BENCH_HEADER)
+        if sent is not None:
+            latencies.append((now - float(sent)) * 1000.0)
+        received['count'] += 1
+        if received['first'] is None:
+            received['first'] = now
+        received['last'] = now
+        if received['count'] >= received['target']:
+            done.set()
+
+    set_delivery_observer(observe)
+    stats = {'published': 0, 'nacked': 0, 'errors': [], 'lock': threading.Lock()}
+    try:
+        if not setup_consumer(consumer_connection, consumer_channel, [queue_name], bench_config):
+            raise RuntimeError("Configurazione del consumer di benchmark fallita")
+
+        # Ripartizione dei messaggi e del ritmo tra le connessioni
+        shares = [messages // connections + (1 if index < messages % connections else 0)
+                  for index in range(connections)]
+        publish_started = time.time()
+        threads = [
+            threading.Thread(
+                target=_publisher,
+                args=(connection_config, broker, queue_name, channels, share, body,
+                      rate / connections if rate else 0, persistent, confirm, stats),
+                daemon=True,
+            )
+            for share in shares
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        publish_elapsed = time.time() - publish_started
+
+        # Si attendono solo i messaggi effettivamente pubblicati
+        received['target'] = stats['published']
+        if received['count'] >= received['target']:
+            done.set()
+        done.wait(drain_timeout)
+    finally:
+        set_delivery_observer(None)
+        try:
+            consumer_connection.add_callback_threadsafe(consumer_channel.stop_consuming)
+            consumer_thread = bench_config.get('consumer_thread')
+            if consumer_thread is not None:
+                consumer_thread.join(5)
+            consumer_connection.close()
+        except Exception as e:
+            log_error(f"Errore nella chiusura del consumer di benchmark: {e}")
+
+    for error in stats['errors']:
+        log_error(f"Benchmark: {error}")
+
+    ordered = sorted(latencies)
+    end_to_end = (received['last'] or publish_started) - publish_started
+    return {
+        'published': stats['published'],
+        'nacked': stats['nacked'],
+        'received': received['count'],
+        'errors': len(stats['errors']),
+        'publish_elapsed': publish_elapsed,
+        'publish_rate': stats['published'] / publish_elapsed if publish_elapsed > 0 else 0.0,
+        'end_to_end_elapsed': end_to_end,
+        'end_to_end_rate': received['count'] / end_to_end if end_to_end > 0 else 0.0,
+        'latency_p50': percentile(ordered, 0.50),
+        'latency_p90': percentile(ordered, 0.90),
+        'latency_p99': percentile(ordered, 0.99),
+        'latency_max': ordered[-1] if ordered else 0.0,
+    }
+
+
+def format_benchmark_stats(stats):
+    """Riepilogo leggibile di un benchmark di pubblicazione"""
+    return "\n".join([
+        f"Pubblicati: {stats['published']} ({stats['nacked']} rifiutati, {stats['errors']} errori) "
+        f"in {stats['publish_elapsed']:.2f}s = {stats['publish_rate']:.0f} msg/s",
+        f"Ricevuti: {stats['received']} in {stats['end_to_end_elapsed']:.2f}s "
+        f"= {stats['end_to_end_rate']:.0f} msg/s end-to-end",
+        f"Latenza (ms): p50 {stats['latency_p50']:.2f}  p90 {stats['latency_p90']:.2f}  "
+        f"p99 {stats['latency_p99']:.2f}  max {stats['latency_max']:.2f}",
+    ])
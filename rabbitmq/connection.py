@@ -4,21 +4,37 @@
 Gestione delle connessioni a RabbitMQ utilizzando l'API Management
 """
 import time
+import random
 import traceback
-import pika
 import threading
-from datetime import datetime
 from rich.console import Console
 from rich.panel import Panel
 
-from utils.constants import set_active_connection, get_active_connection, add_message
+from utils.state import set_active_connection, get_active_connection
+from utils.constants import (
+    RECONNECT_BASE_DELAY,
+    RECONNECT_MAX_DELAY,
+    CONSUME_MODE_CONSUME,
+    DEFAULT_CONSUME_MODE,
+    WARM_PREFETCH_COUNT,
+    WARM_PREFETCH_API_TIMEOUT,
+)
 from utils.logger import log_error, log_message
-from config.connections import update_connection_last_used
-from rabbitmq.api_client import setup_api_client
+from config.connections import update_connection_last_used, new_runtime_connection
+from rabbitmq.api_client import setup_api_client, filter_consumable_queues
 from rabbitmq.consumer import setup_consumer
+from rabbitmq.queue_filter import get_queue_filter
+from rabbitmq.health import attach_health_callbacks, mark_closed
+from rabbitmq.discovery import start_queue_discovery
+from rabbitmq.ingest import uses_ingest_process, start_ingest_process, stop_ingest_process
+from rabbitmq.leaders import uses_leader_consumers, open_leader_consumers, close_leader_consumers
+from rabbitmq.warm_cache import park_connection, store_warm_connection, take_warm_connection
 
 console = Console()
 
+# Serializza l'avvio delle riconnessioni tra i thread consumer
+_reconnect_lock = threading.Lock()
+
 def run_consumer_for_connection(connection, live):
     """
     Esegue un consumer per la connessione RabbitMQ specificata utilizzando l'API Management.
@@ -34,6 +50,22 @@ def run_consumer_for_connection(connection, live):
         # Import delayed to prevent circular imports
         from ui.animations import show_status_message
         
+        previous_connection = get_active_connection()
+        if previous_connection is not None:
+            if previous_connection.get('id') == connection.get('id') \
+                    and not previous_connection.get('connection_lost'):
+                # Già connessi a questo broker: una nuova sottoscrizione duplicherebbe i consumer
+                return True
+            release_connection(previous_connection)
+        
+        # Broker usato di recente: connessione e topologia sono già pronte
+        warm_connection = take_warm_connection(connection)
+        if warm_connection is not None and resume_warm_connection(warm_connection, connection, live):
+            return True
+        
+        # Runtime state lives in its own dict, never in the saved connections list
+        connection = new_runtime_connection(connection)
+        
         log_message({
             'queue': 'system',
             'body': f"Tentativo di connessione a {connection['host']}/{connection['vhost']}...",
@@ -99,36 +131,12 @@ def run_consumer_for_connection(connection, live):
         
         # Now set up the AMQP connection
         try:
-            # Create a connection to RabbitMQ
-            credentials = pika.PlainCredentials(connection['user'], connection['password'])
-            parameters = pika.ConnectionParameters(
-                host=connection['host'],
-                virtual_host=connection['vhost'],
-                credentials=credentials,
-                heartbeat=15,  # Seconds
-                blocked_connection_timeout=30,
-                connection_attempts=3
-            )
-            
-            # Connect to RabbitMQ
-            rmq_connection = pika.BlockingConnection(parameters)
-            channel = rmq_connection.channel()
-            
-            # Add connection objects to the config
-            connection['rmq_connection'] = rmq_connection
-            connection['channel'] = channel
-            
-            # Get list of queues from API data
-            from rabbitmq.api_client import filter_consumable_queues
-            queues_data = connection.get('queues_data', [])
-            consumable_queues = filter_consumable_queues(queues_data)
-            
-            # Set up consumer
-            consumer_setup = setup_consumer(rmq_connection, channel, consumable_queues, connection)
+            # Connect to RabbitMQ and subscribe the queues
+            consumer_setup = open_consumer(connection)
             
             if consumer_setup:
-                # Start monitoring thread for connection health
-                start_connection_monitor(connection)
+                # Pick up queues created or deleted after the initial subscription
+                start_queue_discovery(connection)
                 
                 # Update UI
                 from ui.layouts import create_full_layout
@@ -183,62 +191,321 @@ def run_consumer_for_connection(connection, live):
         set_active_connection(None)
         return False
 
-def start_connection_monitor(connection):
+def release_connection(connection):
+    """
+    Lascia la connessione attiva: la mette in pausa nella cache se possibile, altrimenti la chiude.
+    
+    Args:
+        connection (dict): Connessione di runtime da lasciare
+    """
+    if park_connection(connection):
+        log_message({
+            'queue': 'system',
+            'body': f"Connessione a {connection['host']}/{connection['vhost']} in pausa nella cache",
+            'timestamp': time.strftime('%Y-%m-%d %H:%M:%S')
+        })
+    else:
+        disconnect_connection(connection)
+
+
+def resume_warm_connection(connection, saved_connection, live):
     """
-    Avvia un thread per monitorare lo stato della connessione.
+    Riprende il consumo su una connessione presa dalla cache, senza handshake né chiamate API:
+    le code vengono risottoscritte usando la topologia in cache, aggiornata dal primo polling.
+    
+    Args:
+        connection (dict): Connessione di runtime presa dalla cache
+        saved_connection (dict): Impostazioni salvate della connessione
+        live (Live): Istanza di Live per l'aggiornamento dell'interfaccia
+        
+    Returns:
+        bool: True se il consumo è ripreso, False se serve una connessione nuova
+    """
+    set_active_connection(connection)
+    update_connection_last_used(saved_connection)
+    
+    queues_data = connection.get('queues_data', [])
+    consumable_queues = filter_consumable_queues(queues_data, get_queue_filter(connection))
+    if not setup_consumer(
+        connection['rmq_connection'],
+        connection['channel'],
+        consumable_queues,
+        connection,
+        on_stopped=lambda: handle_connection_lost(connection)
+    ):
+        disconnect_connection(connection)
+        set_active_connection(None)
+        return False
+    
+    start_queue_discovery(connection)
+    
+    from ui.layouts import create_full_layout
+    live.update(create_full_layout(0))
+    
+    log_message({
+        'queue': 'system',
+        'body': f"Ripresa la connessione in cache a {connection['host']}/{connection['vhost']}",
+        'timestamp': time.strftime('%Y-%m-%d %H:%M:%S')
+    })
+    return True
+
+
+def prefetch_connections(connections, exclude=None, count=WARM_PREFETCH_COUNT):
+    """
+    Apre in background le connessioni usate più di recente (API e AMQP) e le mette in cache,
+    così il primo passaggio a quei broker è immediato.
+    
+    Args:
+        connections (list): Connessioni salvate
+        exclude (dict, optional): Connessione da non precaricare (es. quella aperta all'avvio)
+        count (int): Numero di connessioni da precaricare
+    """
+    excluded_id = exclude.get('id') if exclude else None
+    recent = sorted(
+        (conn for conn in connections if conn.get('last_used') and conn.get('id') != excluded_id),
+        key=lambda conn: conn['last_used'],
+        reverse=True
+    )[:count]
+    if not recent:
+        return
+    
+    def prefetch():
+        for saved_connection in recent:
+            try:
+                prefetch_connection(saved_connection)
+            except Exception as e:
+                log_error(f"Precaricamento di {saved_connection.get('host')} fallito: {e}")
+    
+    threading.Thread(target=prefetch, daemon=True).start()
+
+
+def prefetch_connection(saved_connection):
+    """
+    Precarica una connessione: topologia dall'API Management e connessione AMQP inattiva in cache.
+    Le connessioni con processo di ingest o consumo per leader non vengono precaricate.
+    
+    Args:
+        saved_connection (dict): Impostazioni salvate della connessione
+        
+    Returns:
+        bool: True se la connessione è stata messa in cache
+    """
+    connection = new_runtime_connection(saved_connection)
+    if uses_ingest_process(connection) or uses_leader_consumers(connection):
+        return False
+    
+    # Il broker non è stato scelto dall'utente: gli errori vanno solo nel log, non sull'interfaccia
+    api_success, api_info = setup_api_client(connection, quiet=True, timeout=WARM_PREFETCH_API_TIMEOUT)
+    if not api_success:
+        return False
+    connection['api_info'] = api_info
+    
+    rmq_connection, channel = open_amqp_connection(connection, connection_attempts=1)
+    connection['rmq_connection'] = rmq_connection
+    connection['channel'] = channel
+    store_warm_connection(connection)
+    
+    log_message({
+        'queue': 'system',
+        'body': f"Precaricata la connessione a {connection['host']}/{connection['vhost']}",
+        'timestamp': time.strftime('%Y-%m-%d %H:%M:%S')
+    })
+    return True
+
+
+def open_amqp_connection(connection, connection_attempts=3):
+    """
+    Apre la connessione AMQP verso l'host della connessione e registra le callback di salute.
     
     Args:
         connection (dict): Configurazione di connessione
+        connection_attempts (int): Tentativi di connessione delegati a pika
+        
+    Returns:
+        tuple: (connessione pika, canale)
+    """
+    import pika  # Importato al primo utilizzo per non rallentare l'avvio
+    
+    credentials = pika.PlainCredentials(connection['user'], connection['password'])
+    parameters = pika.ConnectionParameters(
+        host=connection['host'],
+        virtual_host=connection['vhost'],
+        credentials=credentials,
+        heartbeat=15,  # Seconds
+        blocked_connection_timeout=30,
+        connection_attempts=connection_attempts
+    )
+    
+    # Connect to RabbitMQ
+    rmq_connection = pika.BlockingConnection(parameters)
+    channel = rmq_connection.channel()
+    
+    # Health tracking driven by pika callbacks (blocked/unblocked, I/O loop ticks)
+    attach_health_callbacks(connection, rmq_connection)
+    return rmq_connection, channel
+
+
+def open_consumer(connection, connection_attempts=3):
     """
-    def monitor_connection():
-        while True:
+    Apre la connessione AMQP e sottoscrive le code usando la topologia già in cache.
+    
+    Args:
+        connection (dict): Configurazione di connessione (con 'queues_data' già popolato)
+        connection_attempts (int): Tentativi di connessione delegati a pika
+        
+    Returns:
+        bool: True se il consumer è stato configurato con successo
+    """
+    # Get list of queues from cached API data
+    queues_data = connection.get('queues_data', [])
+    consumable_queues = filter_consumable_queues(queues_data, get_queue_filter(connection))
+    
+    if uses_ingest_process(connection):
+        # Connessione e consegne in un processo separato, lette dal buffer condiviso
+        return start_ingest_process(
+            connection,
+            consumable_queues,
+            on_stopped=lambda: handle_connection_lost(connection),
+            connection_attempts=connection_attempts
+        )
+    
+    if uses_leader_consumers(connection):
+        if connection.get('consume_mode', DEFAULT_CONSUME_MODE) == CONSUME_MODE_CONSUME:
+            # Una connessione per nodo: ogni coda viene consumata dal suo leader
+            return open_leader_consumers(
+                connection,
+                consumable_queues,
+                on_lost=lambda: handle_connection_lost(connection),
+                connection_attempts=connection_attempts
+            )
+        log_message({
+            'queue': 'system',
+            'body': "Consumo per leader disponibile solo in modalità consume, uso una sola connessione",
+            'timestamp': time.strftime('%Y-%m-%d %H:%M:%S')
+        })
+    
+    rmq_connection, channel = open_amqp_connection(connection, connection_attempts)
+    
+    # Add connection objects to the config
+    connection['rmq_connection'] = rmq_connection
+    connection['channel'] = channel
+    
+    # Set up consumer; a consumer thread that stops unexpectedly triggers a reconnect
+    try:
+        consumer_setup = setup_consumer(
+            rmq_connection,
+            channel,
+            consumable_queues,
+            connection,
+            on_stopped=lambda: handle_connection_lost(connection)
+        )
+    except Exception:
+        _close_failed_consumer(connection, rmq_connection)
+        raise
+    if not consumer_setup:
+        _close_failed_consumer(connection, rmq_connection)
+    return consumer_setup
+
+
+def _close_failed_consumer(connection, rmq_connection):
+    # Senza consumer la connessione appena aperta resterebbe aperta senza nessun riferimento
+    connection.pop('rmq_connection', None)
+    connection.pop('channel', None)
+    try:
+        if rmq_connection.is_open:
+            rmq_connection.close()
+    except Exception as e:
+        log_error(f"Errore nella chiusura della connessione a {connection['host']}: {e}")
+
+
+def is_current_connection(connection):
+    """Verifica se la connessione è ancora quella attiva"""
+    active_connection = get_active_connection()
+    return bool(active_connection) and active_connection.get('id') == connection.get('id')
+
+
+def reconnect_delay(attempt):
+    """
+    Calcola l'attesa prima del prossimo tentativo (backoff esponenziale con full jitter).
+    
+    Args:
+        attempt (int): Numero di tentativi già falliti
+        
+    Returns:
+        float: Secondi di attesa
+    """
+    ceiling = min(RECONNECT_MAX_DELAY, RECONNECT_BASE_DELAY * (2 ** attempt))
+    return random.uniform(0, ceiling)
+
+
+def handle_connection_lost(connection):
+    """
+    Gestisce la perdita della connessione avviando la riconnessione automatica.
+    Le chiamate ripetute mentre una riconnessione è in corso vengono ignorate.
+    
+    Args:
+        connection (dict): Configurazione di connessione
+    """
+    with _reconnect_lock:
+        if connection.get('closing'):
+            mark_closed(connection, reason="chiusura richiesta")
+            return
+        if connection.get('reconnecting'):
+            return
+        if connection.get('parked_at') is not None:
+            # Consumer fermato per mettere la connessione in cache
+            return
+        if not is_current_connection(connection):
+            return
+        connection['reconnecting'] = True
+        connection['connection_lost'] = True
+        connection['disconnected_at'] = time.monotonic()
+        mark_closed(connection, reason="consumer arrestato", reconnecting=True)
+    
+    log_error(f"Connessione RabbitMQ a {connection['host']} persa, avvio riconnessione automatica")
+    
+    reconnect_thread = threading.Thread(target=reconnect_connection, args=(connection,), daemon=True)
+    reconnect_thread.start()
+    connection['reconnect_thread'] = reconnect_thread
+
+
+def reconnect_connection(connection):
+    """
+    Riconnette e ripristina le sottoscrizioni finché la connessione resta quella attiva.
+    Riusa la topologia in cache senza interrogare l'API Management.
+    
+    Args:
+        connection (dict): Configurazione di connessione
+        
+    Returns:
+        bool: True se la riconnessione è riuscita
+    """
+    attempt = 0
+    try:
+        while is_current_connection(connection) and not connection.get('closing'):
+            time.sleep(reconnect_delay(attempt))
+            attempt += 1
             try:
-                # Check if we're still the active connection
-                active_connection = get_active_connection()
-                if not active_connection or active_connection.get('id') != connection.get('id'):
-                    # Not active anymore, stop monitoring
-                    break
-                
-                # Check connection health
-                rmq_connection = connection.get('rmq_connection')
-                if not rmq_connection or not rmq_connection.is_open:
-                    log_error("Connessione RabbitMQ persa")
-                    
-                    # Signal connection loss
-                    connection['connection_lost'] = True
-                    
-                    # Update UI
-                    from ui.animations import show_status_message
-                    show_status_message(
-                        f"Connessione a {connection['host']} persa. Seleziona nuovamente per riconnettere.",
-                        title="DISCONNESSO",
-                        style="red",
-                        duration=2
-                    )
+                if open_consumer(connection, connection_attempts=1):
+                    downtime = time.monotonic() - connection.get('disconnected_at', time.monotonic())
+                    connection['reconnect_count'] = connection.get('reconnect_count', 0) + 1
+                    connection['downtime_total'] = connection.get('downtime_total', 0.0) + downtime
+                    connection['last_downtime'] = downtime
+                    connection['connection_lost'] = False
                     
-                    # Clear active connection
-                    set_active_connection(None)
-                    break
-                
-                # Add heartbeat message occasionally
-                add_message({
-                    'queue': 'system',
-                    'body': "Heartbeat connessione attiva",
-                    'timestamp': datetime.now().isoformat(),
-                    'is_heartbeat': True
-                })
-                
-                # Sleep for a while
-                time.sleep(10)
-                
+                    log_message({
+                        'queue': 'system',
+                        'body': f"Riconnesso a {connection['host']}/{connection['vhost']} "
+                                f"dopo {downtime:.1f}s ({attempt} tentativi)",
+                        'timestamp': time.strftime('%Y-%m-%d %H:%M:%S')
+                    })
+                    return True
             except Exception as e:
-                log_error(f"Errore nel monitoraggio connessione: {e}")
-                time.sleep(5)
-    
-    # Start monitor thread
-    monitor_thread = threading.Thread(target=monitor_connection, daemon=True)
-    monitor_thread.start()
-    connection['monitor_thread'] = monitor_thread
+                log_error(f"Tentativo di riconnessione {attempt} fallito: {e}")
+        return False
+    finally:
+        connection['reconnecting'] = False
+
 
 def disconnect_connection(connection):
     """
@@ -248,6 +515,15 @@ def disconnect_connection(connection):
         connection (dict): Configurazione di connessione
     """
     try:
+        # Evita che la chiusura volontaria venga scambiata per una perdita di connessione
+        connection['closing'] = True
+        if stop_ingest_process(connection):
+            log_message({
+                'queue': 'system',
+                'body': f"Arresto del processo di ingest per {connection['host']}/{connection['vhost']}",
+                'timestamp': time.strftime('%Y-%m-%d %H:%M:%S')
+            })
+        close_leader_consumers(connection)
         rmq_connection = connection.get('rmq_connection')
         if rmq_connection and rmq_connection.is_open:
             rmq_connection.close()
@@ -4,18 +4,59 @@
 Funzionalità consumer per RabbitMQ con API Management
 """
 import threading
+import time
 from datetime import datetime
 
-import pika
-
-from utils.constants import add_message, get_live_instance, get_selected_index
+from utils.state import add_message, bump_version
+from utils.state import payload_digest, get_payload_text, set_payload_text
+from utils.constants import CONSUME_MODE_TAP, CONSUME_MODE_FIREHOSE, DEFAULT_CONSUME_MODE
+from utils.constants import SPILL_THRESHOLD, SPILL_PREVIEW_BYTES
 from utils.logger import log_message, log_error
-from ui.layouts import create_full_layout
+from utils.startup import mark_once
+from utils.search_index import reindex_message
+from rabbitmq.tap import setup_tap_queues, setup_firehose_queue, unwrap_trace_message, unwrap_trace_headers
+from rabbitmq.tap import unwrap_trace_content
+from rabbitmq.decoders import configure_decoders, decode_body, needs_worker, submit_decode
+from rabbitmq.decoders import is_decode_backlog_full, decode_preview
+from rabbitmq.sampling import configure_sampling, sample_delivery, record_processing_time, record_filtered
+from rabbitmq.message_filter import has_message_filter, message_passes_filter, set_message_filter, reset_message_filter
+from rabbitmq.replay import properties_to_dict
+from rabbitmq.heavy_hitters import configure_heavy_hitters, record_heavy_hitters
+from utils.capture import capture_message
+from utils.spill import spill_body, spill_preview
+
+
+_delivery_observer = None  # Chiamata per ogni consegna ricevuta (es. misura della latenza nel benchmark)
+_delivery_sink = None  # Se impostata riceve tutte le consegne al posto di filtro, campionamento ed elaborazione
+
+
+def set_delivery_observer(observer):
+    """
+    Imposta una funzione chiamata per ogni consegna, prima di filtro e campionamento.
+    
+    Args:
+        observer (callable): Funzione (queue_name, properties, body), o None per rimuoverla
+    """
+    global _delivery_observer
+    _delivery_observer = observer
+
+
+def set_delivery_sink(sink):
+    """
+    Devia tutte le consegne verso una funzione esterna (es. il buffer condiviso del processo di ingest).
+    
+    Args:
+        sink (callable): Funzione (queue_name, method, properties, body, traced), o None per rimuoverla
+    """
+    global _delivery_sink
+    _delivery_sink = sink
 
 
-def message_callback(ch, method, properties, body, queue_name):
+def message_callback(ch, method, properties, body, queue_name, traced=False):
     """
     Callback per la gestione dei messaggi ricevuti.
+    Ogni consegna viene contata, ma solo quelle che superano il filtro e il campionamento
+    vengono elaborate.
     
     Args:
         ch: Canale RabbitMQ
@@ -23,44 +64,282 @@ def message_callback(ch, method, properties, body, queue_name):
         properties: Proprietà del messaggio
         body: Corpo del messaggio
         queue_name: Nome della coda
+        traced (bool): True se il messaggio proviene dal firehose tracer
     """
     try:
-        # Ottieni exchange e routing key
+        if _delivery_observer is not None:
+            _delivery_observer(queue_name, properties, body)
+        if _delivery_sink is not None:
+            _delivery_sink(queue_name, method, properties, body, traced)
+            return
+        
+        if traced:
+            exchange, routing_key = unwrap_trace_message(method, properties)
+            headers = unwrap_trace_headers(properties)
+        else:
+            exchange = method.exchange or "default"
+            routing_key = method.routing_key
+            headers = properties.headers
+        record_heavy_hitters(exchange, routing_key, headers, len(body))
+        
+        # Il filtro viene valutato prima di qualsiasi memorizzazione: gli scarti aggiornano solo i contatori
+        if has_message_filter() and not message_passes_filter(queue_name, exchange, routing_key, headers, body):
+            record_filtered(queue_name, len(body))
+            return
+        
+        for delivery in sample_delivery(queue_name, len(body), (method, properties, body, queue_name, traced)):
+            process_delivery(*delivery)
+    except Exception as e:
+        log_error(f"Errore nel callback del messaggio: {e}")
+
+
+def delivery_fields(method, properties, traced=False):
+    """
+    Estrae da una consegna pika i campi memorizzati con il messaggio.
+    
+    Args:
+        method: Metodo di consegna
+        properties: Proprietà del messaggio
+        traced (bool): True se il messaggio proviene dal firehose tracer
+        
+    Returns:
+        dict: exchange, routing_key, content_type, content_encoding, headers, properties, raw_properties
+    """
+    if traced:
+        exchange, routing_key = unwrap_trace_message(method, properties)
+        content_type, content_encoding = unwrap_trace_content(properties)
+        headers = unwrap_trace_headers(properties)
+    else:
         exchange = method.exchange or "default"
         routing_key = method.routing_key
+        content_type, content_encoding = properties.content_type, properties.content_encoding
+        headers = properties.headers
+    return {
+        "exchange": exchange,
+        "routing_key": routing_key,
+        "content_type": content_type,
+        "content_encoding": content_encoding,
+        "headers": headers or {},
+        "properties": str(properties),
+        "raw_properties": properties_to_dict(properties, traced),
+    }
+
+
+def ingest_delivery(queue_name, fields, body):
+    """
+    Equivalente di message_callback per consegne già scomposte in campi
+    (es. lette dal buffer condiviso del processo di ingest): filtro, campionamento, elaborazione.
+    
+    Args:
+        queue_name (str): Nome della coda
+        fields (dict): Campi come restituiti da delivery_fields
+        body (bytes): Corpo del messaggio
+    """
+    try:
+        record_heavy_hitters(fields["exchange"], fields["routing_key"], fields["headers"], len(body))
+        if has_message_filter() and not message_passes_filter(
+                queue_name, fields["exchange"], fields["routing_key"], fields["headers"], body):
+            record_filtered(queue_name, len(body))
+            return
         
-        # Decodifica il body
-        try:
-            body_text = body.decode()
-        except UnicodeDecodeError:
-            body_text = f"[Dati binari - lunghezza: {len(body)} bytes]"
+        for delivery in sample_delivery(queue_name, len(body), (None, None, body, queue_name, False, fields)):
+            process_delivery(*delivery)
+    except Exception as e:
+        log_error(f"Errore nel callback del messaggio: {e}")
+
+
+def process_delivery(method, properties, body, queue_name, traced=False, fields=None):
+    """
+    Elabora una consegna campionata: decodifica, memorizza, registra e aggiorna l'interfaccia.
+    
+    Args:
+        method: Metodo di consegna
+        properties: Proprietà del messaggio
+        body: Corpo del messaggio
+        queue_name: Nome della coda
+        traced (bool): True se il messaggio proviene dal firehose tracer
+        fields (dict, optional): Campi già estratti (in tal caso method e properties sono ignorati)
+    """
+    started = time.perf_counter()
+    try:
+        if fields is None:
+            fields = delivery_fields(method, properties, traced)
+        
+        # Decodifica il body in base a content type/encoding; i casi costosi vanno sul pool
+        # Payload identici a uno già trattenuto riusano il suo testo senza decodificarlo di nuovo
+        content_type, content_encoding = fields["content_type"], fields["content_encoding"]
+        payload_id = payload_digest(body, content_type, content_encoding)
+        body_text = get_payload_text(payload_id)
+        size = len(body)
+        raw_body = body
+        deferred = False
+        decoded = True
+        if body_text is None and size > SPILL_THRESHOLD:
+            # Corpi molto grandi: su disco, in memoria solo il riferimento e un'anteprima
+            raw_body = spill_body(body)
+            body_text = spill_preview(body, content_encoding, SPILL_PREVIEW_BYTES)
+        elif body_text is None:
+            if not needs_worker(body, content_type, content_encoding):
+                body_text = decode_body(body, content_type, content_encoding)
+            elif is_decode_backlog_full():
+                # Pool saturo: solo un'anteprima, che non va condivisa con i payload identici
+                decoded = False
+                body_text = decode_preview(body, content_encoding)
+            else:
+                deferred = True
+                decoded = False
+                body_text = "[Decodifica in corso...]"
 
         # Prepara i dati del messaggio
         message_data = {
             "queue": queue_name,
-            "exchange": exchange,
-            "routing_key": routing_key,
-            "properties": str(properties),
+            "exchange": fields["exchange"],
+            "routing_key": fields["routing_key"],
+            "properties": fields["properties"],
+            "headers": fields["headers"],
             "body": body_text,
-            "timestamp": datetime.now().isoformat()
+            "size": size,
+            "timestamp": datetime.now().isoformat(),
+            # Corpo e proprietà originali, necessari per la cattura strutturata e il replay
+            "raw_body": raw_body,
+            "raw_properties": fields["raw_properties"],
+            "payload_id": payload_id
         }
 
         # Aggiunge il messaggio alla lista globale
-        add_message(message_data)
+        add_message(message_data, decoded=decoded)
+        capture_message(message_data)
+        mark_once('first_message')
         
-        # Registra il messaggio nel log
-        log_message(message_data)
-
-        # Aggiorna l'interfaccia LIVE immediatamente dopo aver ricevuto un messaggio
-        live = get_live_instance()
-        if live:
-            selected_index = get_selected_index()
-            live.update(create_full_layout(selected_index))
+        if deferred:
+            # Il log viene scritto quando il testo decodificato è disponibile
+            submit_decode(body, content_type, content_encoding,
+                          lambda text: complete_decoded_message(message_data, text))
+        else:
+            # Registra il messaggio nel log
+            log_message(message_data)
     except Exception as e:
-        log_error(f"Errore nel callback del messaggio: {e}")
+        log_error(f"Errore nell'elaborazione del messaggio: {e}")
+    finally:
+        record_processing_time(time.perf_counter() - started)
+
+
+def complete_decoded_message(message_data, body_text):
+    """
+    Completa un messaggio la cui decodifica è stata eseguita dal pool di worker.
+    
+    Args:
+        message_data (dict): Messaggio già memorizzato con il corpo provvisorio
+        body_text (str): Testo decodificato
+    """
+    message_data['body'] = body_text
+    set_payload_text(message_data['payload_id'], body_text)
+    reindex_message(message_data['seq'], message_data)
+    bump_version('messages')
+    log_message(message_data)
+
+
+def subscribe_queues(channel, subscriptions, connection_config, traced=False):
+    """
+    Avvia basic_consume per ogni coda indicata e registra i consumer tag.
+    Va chiamata sul thread che possiede la connessione.
+    
+    Args:
+        channel: Canale RabbitMQ
+        subscriptions (list): Lista di tuple (coda consumata, nome coda originale)
+        connection_config (dict): Configurazione di connessione
+        traced (bool): True se le code ricevono messaggi dal firehose tracer
+        
+    Returns:
+        int: Numero di code sottoscritte con successo
+    """
+    active = connection_config.setdefault('subscriptions', {})
+    subscribed = 0
+    for consume_queue, queue_name in subscriptions:
+        try:
+            # Binding della callback con il nome della coda originale
+            callback = lambda ch, method, props, body, q=queue_name: message_callback(
+                ch, method, props, body, q, traced
+            )
+            
+            # Configura il consumer
+            consumer_tag = channel.basic_consume(
+                queue=consume_queue,
+                on_message_callback=callback,
+                auto_ack=True
+            )
+            active[queue_name] = (consume_queue, consumer_tag)
+            subscribed += 1
+        except Exception as queue_err:
+            log_error(f"Errore nella configurazione del consumer per {queue_name}: {queue_err}")
+    
+    # Un solo record di log per l'intera sottoscrizione, non uno per coda
+    consume_mode = connection_config.get('consume_mode', DEFAULT_CONSUME_MODE)
+    log_message({
+        'queue': 'system',
+        'body': f"Consumer configurati per {subscribed}/{len(subscriptions)} code ({consume_mode})",
+        'timestamp': datetime.now().isoformat()
+    })
+    return subscribed
 
 
-def setup_consumer(rmq_connection, channel, consumable_queues, connection_config):
+def unsubscribe_queues(channel, queue_names, connection_config):
+    """
+    Annulla le sottoscrizioni delle code indicate (basic_cancel).
+    Va chiamata sul thread che possiede la connessione.
+    
+    Args:
+        channel: Canale RabbitMQ
+        queue_names (list): Nomi delle code originali da non consumare più
+        connection_config (dict): Configurazione di connessione
+        
+    Returns:
+        int: Numero di sottoscrizioni annullate
+    """
+    active = connection_config.setdefault('subscriptions', {})
+    cancelled = 0
+    for queue_name in queue_names:
+        subscription = active.pop(queue_name, None)
+        if subscription is None:
+            continue
+        try:
+            # Se la coda è già stata cancellata il broker ha già chiuso il consumer
+            channel.basic_cancel(subscription[1])
+        except Exception as cancel_err:
+            log_error(f"Errore nell'annullamento del consumer per {queue_name}: {cancel_err}")
+        cancelled += 1
+    
+    if cancelled:
+        log_message({
+            'queue': 'system',
+            'body': f"Consumer annullati per {cancelled} code",
+            'timestamp': datetime.now().isoformat()
+        })
+    return cancelled
+
+
+def configure_processing(connection_config):
+    """
+    Applica le impostazioni di elaborazione della connessione: campionamento, decodifica,
+    chiavi dominanti e filtro.
+    
+    Args:
+        connection_config (dict): Configurazione di connessione
+    """
+    configure_sampling(connection_config)
+    configure_decoders(connection_config)
+    configure_heavy_hitters(connection_config)
+    
+    # Filtro sui messaggi salvato con la connessione
+    try:
+        set_message_filter(connection_config.get('message_filter', ''))
+    except ValueError as filter_err:
+        # Il filtro della connessione precedente non deve restare attivo sul nuovo broker
+        reset_message_filter(str(filter_err))
+        log_error(f"Filtro messaggi non valido per la connessione: {filter_err}")
+
+
+def setup_consumer(rmq_connection, channel, consumable_queues, connection_config, on_stopped=None):
     """
     Configura il consumer per le code specificate.
     
@@ -69,13 +348,32 @@ def setup_consumer(rmq_connection, channel, consumable_queues, connection_config
         channel: Canale RabbitMQ
         consumable_queues (list): Lista di nomi delle code consumabili
         connection_config (dict): Configurazione di connessione
+        on_stopped (callable, optional): Chiamata quando il thread consumer termina
         
     Returns:
         bool: True se la configurazione è stata completata con successo, False altrimenti
     """
     try:
+        configure_processing(connection_config)
+        
+        consume_mode = connection_config.get('consume_mode', DEFAULT_CONSUME_MODE)
+        traced = False
+        
+        # Sottoscrizioni attive: nome coda originale -> (coda consumata, consumer tag)
+        connection_config['subscriptions'] = {}
+        connection_config['tap_ignored'] = set()
+        
+        # Determina le code da cui consumare: originali, specchio o firehose
+        if consume_mode == CONSUME_MODE_TAP:
+            subscriptions = setup_tap_queues(channel, consumable_queues, connection_config)
+        elif consume_mode == CONSUME_MODE_FIREHOSE:
+            subscriptions = setup_firehose_queue(channel, connection_config)
+            traced = True
+        else:
+            subscriptions = [(queue_name, queue_name) for queue_name in consumable_queues]
+        
         # Se non ci sono code consumabili, crea una coda temporanea
-        if not consumable_queues:
+        if not subscriptions:
             log_message({
                 'queue': 'system',
                 'body': "Nessuna coda consumabile trovata. Creazione coda temporanea...",
@@ -85,6 +383,7 @@ def setup_consumer(rmq_connection, channel, consumable_queues, connection_config
             # Crea una coda temporanea per l'ascolto di tutto il traffico
             result = channel.queue_declare(queue='', exclusive=True)
             temp_queue = result.method.queue
+            connection_config['temp_queue'] = temp_queue
             
             # Binding al default exchange
             channel.queue_bind(exchange='amq.topic', queue=temp_queue, routing_key='#')
@@ -104,28 +403,8 @@ def setup_consumer(rmq_connection, channel, consumable_queues, connection_config
                 'timestamp': datetime.now().isoformat()
             })
         else:
-            # Configura consumer per ogni coda consumabile
-            for queue_name in consumable_queues:
-                try:
-                    # Binding della callback con il nome della coda
-                    callback = lambda ch, method, props, body, q=queue_name: message_callback(
-                        ch, method, props, body, q
-                    )
-                    
-                    # Configura il consumer
-                    channel.basic_consume(
-                        queue=queue_name,
-                        on_message_callback=callback,
-                        auto_ack=True
-                    )
-                    
-                    log_message({
-                        'queue': 'system',
-                        'body': f"Consumer configurato per coda: {queue_name}",
-                        'timestamp': datetime.now().isoformat()
-                    })
-                except Exception as queue_err:
-                    log_error(f"Errore nella configurazione del consumer per {queue_name}: {queue_err}")
+            # Configura consumer per ogni coda (originale o specchio)
+            subscribe_queues(channel, subscriptions, connection_config, traced)
         
         # Avvia un thread per processare i messaggi in background
         def consume_loop():
@@ -140,6 +419,10 @@ def setup_consumer(rmq_connection, channel, consumable_queues, connection_config
                 channel.start_consuming()
             except Exception as e:
                 log_error(f"Errore nel thread consumer: {e}")
+            finally:
+                # Notifica l'arresto del consumer (es. per avviare la riconnessione)
+                if on_stopped:
+                    on_stopped()
         
         consumer_thread = threading.Thread(target=consume_loop, daemon=True)
         consumer_thread.start()
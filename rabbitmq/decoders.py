@@ -0,0 +1,451 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Decodifica dei payload selezionata da content_type e content_encoding.
+Le decodifiche costose vengono eseguite su un pool di worker per non bloccare il thread di pika.
+"""
+import hashlib
+import json
+import threading
+import zlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+from utils.constants import (
+    DECODE_INLINE_MAX,
+    DECODE_CACHE_SIZE,
+    DECODE_MAX_IN_FLIGHT,
+    DECODE_PREVIEW_BYTES,
+    DECODE_MAX_OUTPUT,
+    DECODER_POOL_PROCESS,
+    DEFAULT_DECODER_POOL,
+    DEFAULT_DECODER_WORKERS,
+)
+from utils.logger import log_error
+
+# Dipendenze opzionali: se mancano il relativo formato resta non decodificato
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+_GZIP_MAGIC = b"\x1f\x8b"
+_ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+_OUTPUT_LIMIT = DECODE_MAX_OUTPUT + 1  # Un byte in più segnala l'output troncato
+
+_decoders = {}  # content type -> funzione bytes -> str
+_decompressors = {}  # content encoding -> funzione bytes -> bytes
+
+_cache_lock = threading.Lock()
+_cache = OrderedDict()
+
+_executor_lock = threading.Lock()
+_executor = None
+_pool_kind = DEFAULT_DECODER_POOL
+_pool_workers = DEFAULT_DECODER_WORKERS
+_in_flight = 0  # Decodifiche in coda o in corso sul pool
+
+
+def loads_json(data):
+    """Interpreta JSON con orjson se disponibile, altrimenti con json"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dumps_json(value):
+    """Serializza in JSON compatto con orjson se disponibile, altrimenti con json"""
+    if orjson is not None:
+        return orjson.dumps(value, default=repr).decode("utf-8")
+    return json.dumps(value, ensure_ascii=False, default=repr)
+
+
+def register_decoder(content_type, decoder):
+    """
+    Registra un decoder per un content type.
+
+    Args:
+        content_type (str): Content type (es. "application/json"), senza parametri
+        decoder (callable): Funzione bytes -> str
+    """
+    _decoders[content_type.lower()] = decoder
+
+
+def register_decompressor(content_encoding, decompressor):
+    """
+    Registra un decompressore per un content encoding.
+
+    Args:
+        content_encoding (str): Content encoding (es. "gzip")
+        decompressor (callable): Funzione bytes -> bytes
+    """
+    _decompressors[content_encoding.lower()] = decompressor
+
+
+def _decode_text(data):
+    return data.decode("utf-8")
+
+
+def _decode_json(data):
+    # Il testo JSON viene mostrato così com'è; si ripiega sulla riserializzazione solo se non è UTF-8
+    try:
+        return data.decode("utf-8")
+    except UnicodeDecodeError:
+        return dumps_json(loads_json(data))
+
+
+def _decode_msgpack(data):
+    if msgpack is None:
+        raise ValueError("msgpack non installato")
+    return dumps_json(msgpack.unpackb(data, raw=False, strict_map_key=False))
+
+
+def _read_varint(data, position):
+    result = 0
+    shift = 0
+    while True:
+        if position >= len(data):
+            raise ValueError("varint troncato")
+        byte = data[position]
+        position += 1
+        result |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return result, position
+        shift += 7
+        if shift > 63:
+            raise ValueError("varint troppo lungo")
+
+
+def _decode_protobuf_fields(data, depth=0):
+    """Decodifica il wire format protobuf senza schema: numero campo -> valore/i"""
+    fields = {}
+    position = 0
+    while position < len(data):
+        key, position = _read_varint(data, position)
+        field_number, wire_type = key >> 3, key & 0x07
+        if field_number == 0:
+            raise ValueError("numero di campo non valido")
+
+        if wire_type == 0:
+            value, position = _read_varint(data, position)
+        elif wire_type == 1:
+            value = int.from_bytes(data[position:position + 8], "little")
+            position += 8
+        elif wire_type == 5:
+            value = int.from_bytes(data[position:position + 4], "little")
+            position += 4
+        elif wire_type == 2:
+            length, position = _read_varint(data, position)
+            chunk = data[position:position + length]
+            if len(chunk) != length:
+                raise ValueError("campo troncato")
+            position += length
+            value = _decode_protobuf_chunk(chunk, depth)
+        else:
+            raise ValueError(f"wire type non supportato: {wire_type}")
+
+        if position > len(data):
+            raise ValueError("messaggio troncato")
+        key = str(field_number)
+        if key in fields:
+            if not isinstance(fields[key], list):
+                fields[key] = [fields[key]]
+            fields[key].append(value)
+        else:
+            fields[key] = value
+    return fields
+
+
+def _decode_protobuf_chunk(chunk, depth):
+    # Un campo length-delimited può essere stringa, messaggio annidato o bytes
+    try:
+        text = chunk.decode("utf-8")
+        if text.isprintable():
+            return text
+    except UnicodeDecodeError:
+        pass
+    if depth < 8:
+        try:
+            return _decode_protobuf_fields(chunk, depth + 1)
+        except ValueError:
+            pass
+    return chunk.hex()
+
+
+def _decode_protobuf(data):
+    return dumps_json(_decode_protobuf_fields(data))
+
+
+def _gunzip(data):
+    # Come gzip.decompress (membri concatenati compresi), ma con l'output limitato
+    output = bytearray()
+    while True:
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        output += decompressor.decompress(data, _OUTPUT_LIMIT - len(output))
+        data = decompressor.unused_data
+        if not decompressor.eof or data[:2] != _GZIP_MAGIC or len(output) >= _OUTPUT_LIMIT:
+            return bytes(output)
+
+
+def _inflate(data):
+    return zlib.decompressobj().decompress(data, _OUTPUT_LIMIT)
+
+
+def _decompress_zstd(data):
+    if zstandard is None:
+        raise ValueError("zstandard non installato")
+    output = bytearray()
+    with zstandard.ZstdDecompressor().stream_reader(data) as reader:
+        while len(output) < _OUTPUT_LIMIT:
+            chunk = reader.read(_OUTPUT_LIMIT - len(output))
+            if not chunk:
+                break
+            output += chunk
+    return bytes(output)
+
+
+register_decoder("application/json", _decode_json)
+register_decoder("text/plain", _decode_text)
+register_decoder("application/msgpack", _decode_msgpack)
+register_decoder("application/x-msgpack", _decode_msgpack)
+register_decoder("application/protobuf", _decode_protobuf)
+register_decoder("application/x-protobuf", _decode_protobuf)
+register_decoder("application/vnd.google.protobuf", _decode_protobuf)
+register_decompressor("gzip", _gunzip)
+register_decompressor("x-gzip", _gunzip)
+register_decompressor("deflate", _inflate)
+register_decompressor("zstd", _decompress_zstd)
+register_decompressor("identity", lambda data: data)
+
+
+def _normalize(value):
+    return (value or "").split(";")[0].strip().lower()
+
+
+def _decompress(body, content_encoding):
+    decompressor = _decompressors.get(content_encoding)
+    if decompressor is not None:
+        return decompressor(body)
+    # Nessun encoding dichiarato: riconosce gzip e zstd dai magic bytes
+    if not content_encoding:
+        if body[:2] == _GZIP_MAGIC:
+            return _gunzip(body)
+        if body[:4] == _ZSTD_MAGIC and zstandard is not None:
+            return _decompress_zstd(body)
+    return body
+
+
+def decode_uncached(body, content_type=None, content_encoding=None):
+    """
+    Decodifica un payload in testo leggibile. Funzione pura, eseguibile anche in un processo worker.
+
+    Args:
+        body (bytes): Corpo del messaggio
+        content_type (str, optional): Content type del messaggio
+        content_encoding (str, optional): Content encoding del messaggio
+
+    Returns:
+        str: Testo da mostrare
+    """
+    content_type = _normalize(content_type)
+    content_encoding = _normalize(content_encoding)
+    try:
+        data = _decompress(body, content_encoding)
+    except Exception as e:
+        return f"[Decompressione {content_encoding or 'automatica'} fallita: {e}]"
+    if len(data) > DECODE_MAX_OUTPUT:
+        # Payload che si espande oltre il limite (es. zip bomb): solo l'inizio, come testo
+        return (f"{data[:DECODE_MAX_OUTPUT].decode('utf-8', errors='replace')}\n"
+                f"[... decompressione interrotta a {DECODE_MAX_OUTPUT} bytes]")
+
+    decoder = _decoders.get(content_type)
+    if decoder is None and content_type.startswith("text/"):
+        decoder = _decode_text
+    if decoder is not None:
+        try:
+            return decoder(data)
+        except Exception as e:
+            log_error(f"Decodifica {content_type} fallita: {e}")
+
+    try:
+        return data.decode("utf-8")
+    except UnicodeDecodeError:
+        return f"[Dati binari - lunghezza: {len(body)} bytes]"
+
+
+def _cache_key(body, content_type, content_encoding):
+    digest = hashlib.blake2b(body, digest_size=16).digest()
+    return digest, _normalize(content_type), _normalize(content_encoding)
+
+
+def _cache_get(key):
+    with _cache_lock:
+        text = _cache.get(key)
+        if text is not None:
+            _cache.move_to_end(key)
+        return text
+
+
+def _cache_put(key, text):
+    with _cache_lock:
+        _cache[key] = text
+        _cache.move_to_end(key)
+        while len(_cache) > DECODE_CACHE_SIZE:
+            _cache.popitem(last=False)
+
+
+def decode_body(body, content_type=None, content_encoding=None):
+    """
+    Decodifica un payload usando la cache dei risultati.
+
+    Returns:
+        str: Testo da mostrare
+    """
+    key = _cache_key(body, content_type, content_encoding)
+    text = _cache_get(key)
+    if text is None:
+        text = decode_uncached(body, content_type, content_encoding)
+        _cache_put(key, text)
+    return text
+
+
+def needs_worker(body, content_type=None, content_encoding=None):
+    """
+    Indica se la decodifica è abbastanza costosa da andare sul pool di worker.
+
+    Returns:
+        bool: True per payload compressi, binari strutturati o più grandi di DECODE_INLINE_MAX
+    """
+    content_encoding = _normalize(content_encoding)
+    if content_encoding and content_encoding != "identity":
+        return True
+    if body[:2] == _GZIP_MAGIC or body[:4] == _ZSTD_MAGIC:
+        return True
+    if _normalize(content_type) in ("application/msgpack", "application/x-msgpack", "application/protobuf",
+                                    "application/x-protobuf", "application/vnd.google.protobuf"):
+        return True
+    return len(body) > DECODE_INLINE_MAX
+
+
+def configure_decoders(connection_config):
+    """
+    Configura il tipo e la dimensione del pool di decodifica.
+
+    Args:
+        connection_config (dict): Configurazione di connessione (decoder_pool, decoder_workers)
+    """
+    global _pool_kind, _pool_workers
+    pool_kind = connection_config.get('decoder_pool', DEFAULT_DECODER_POOL)
+    workers = max(1, int(connection_config.get('decoder_workers', DEFAULT_DECODER_WORKERS)))
+    if pool_kind != _pool_kind or workers != _pool_workers:
+        shutdown_decoders()
+        _pool_kind = pool_kind
+        _pool_workers = workers
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            if _pool_kind == DECODER_POOL_PROCESS:
+                _executor = ProcessPoolExecutor(max_workers=_pool_workers)
+            else:
+                _executor = ThreadPoolExecutor(max_workers=_pool_workers, thread_name_prefix="decoder")
+        return _executor
+
+
+def get_decode_backlog():
+    """Ritorna il numero di decodifiche in coda o in corso sul pool"""
+    return _in_flight
+
+
+def is_decode_backlog_full():
+    """Verifica se il pool ha raggiunto DECODE_MAX_IN_FLIGHT decodifiche in sospeso"""
+    return _in_flight >= DECODE_MAX_IN_FLIGHT
+
+
+def decode_preview(body, content_encoding=None):
+    """
+    Anteprima di un payload non decodificato perché il pool di decodifica è saturo.
+
+    Args:
+        body (bytes): Corpo del messaggio
+        content_encoding (str, optional): Content encoding (i corpi compressi non hanno anteprima)
+
+    Returns:
+        str: Anteprima seguita dall'indicazione della dimensione completa
+    """
+    content_encoding = _normalize(content_encoding)
+    prefix = body[:DECODE_PREVIEW_BYTES]
+    if (content_encoding and content_encoding != "identity") or prefix[:2] == _GZIP_MAGIC \
+            or prefix[:4] == _ZSTD_MAGIC:
+        preview = f"[Corpo compresso ({content_encoding or 'automatico'})]"
+    elif b"\x00" in prefix:
+        preview = "[Dati binari]"
+    else:
+        preview = prefix.decode("utf-8", errors="replace")
+    return f"{preview}\n[... {len(body)} bytes non decodificati: troppe decodifiche in sospeso]"
+
+
+def submit_decode(body, content_type, content_encoding, on_decoded):
+    """
+    Decodifica un payload sul pool di worker e chiama on_decoded(testo) al termine.
+    I risultati in cache vengono restituiti subito senza passare dal pool.
+    Il chiamante verifica prima is_decode_backlog_full: il limite non viene applicato qui.
+
+    Args:
+        body (bytes): Corpo del messaggio
+        content_type (str): Content type del messaggio
+        content_encoding (str): Content encoding del messaggio
+        on_decoded (callable): Funzione chiamata con il testo decodificato
+    """
+    key = _cache_key(body, content_type, content_encoding)
+    text = _cache_get(key)
+    if text is not None:
+        on_decoded(text)
+        return
+
+    def done(future):
+        global _in_flight
+        with _executor_lock:
+            _in_flight -= 1
+        try:
+            decoded = future.result()
+        except Exception as e:
+            decoded = f"[Decodifica fallita: {e}]"
+        _cache_put(key, decoded)
+        try:
+            on_decoded(decoded)
+        except Exception as e:
+            log_error(f"Errore nel completamento della decodifica: {e}")
+
+    global _in_flight
+    executor = _get_executor()
+    with _executor_lock:
+        _in_flight += 1
+    try:
+        future = executor.submit(decode_uncached, body, content_type, content_encoding)
+    except Exception:
+        with _executor_lock:
+            _in_flight -= 1
+        raise
+    future.add_done_callback(done)
+
+
+def shutdown_decoders():
+    """Chiude il pool di decodifica (viene ricreato al primo utilizzo)"""
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False)
+            _executor = None
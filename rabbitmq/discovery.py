@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Scoperta incrementale delle code: confronta snapshot periodici dell'API Management
+e aggiunge o annulla le sottoscrizioni senza riconnettersi
+"""
+import threading
+import time
+from datetime import datetime
+
+from utils.constants import (
+    CONSUME_MODE_TAP,
+    CONSUME_MODE_FIREHOSE,
+    DEFAULT_CONSUME_MODE,
+    DISCOVERY_INTERVAL,
+)
+from utils.state import get_active_connection, bump_version
+from utils.logger import log_message, log_error
+from utils.timeseries import record_queue_samples, reset_queue_history
+from rabbitmq.alerts import evaluate_alerts, reset_alerts
+from rabbitmq.api_client import get_queues_from_api, get_vhost_bindings, filter_consumable_queues
+from rabbitmq.consumer import subscribe_queues, unsubscribe_queues
+from rabbitmq.tap import setup_tap_queues
+from rabbitmq.queue_filter import get_queue_filter
+
+
+def diff_queue_snapshot(subscribed, consumable):
+    """
+    Confronta le code sottoscritte con quelle consumabili nello snapshot corrente.
+
+    Args:
+        subscribed (iterable): Nomi delle code attualmente sottoscritte
+        consumable (iterable): Nomi delle code consumabili secondo l'API
+
+    Returns:
+        tuple: (code da aggiungere, code da rimuovere), entrambe ordinate
+    """
+    subscribed = set(subscribed)
+    consumable = set(consumable)
+    return sorted(consumable - subscribed), sorted(subscribed - consumable)
+
+
+def apply_queue_changes(connection, added, removed):
+    """
+    Applica le differenze di topologia sul canale attivo.
+    Va eseguita sul thread che possiede la connessione (add_callback_threadsafe).
+
+    Args:
+        connection (dict): Configurazione di connessione
+        added (list): Code da sottoscrivere
+        removed (list): Code da non consumare più
+    """
+    channel = connection.get('channel')
+    if channel is None or not channel.is_open or connection.get('parked_at') is not None:
+        # Le connessioni in pausa nella cache non consumano
+        return
+
+    # Uno snapshot precedente può aver già portato alle stesse modifiche
+    active = connection.setdefault('subscriptions', {})
+    added = [queue_name for queue_name in added if queue_name not in active]
+
+    try:
+        if removed:
+            unsubscribe_queues(channel, removed, connection)
+
+        if added:
+            if connection.get('consume_mode', DEFAULT_CONSUME_MODE) == CONSUME_MODE_TAP:
+                subscriptions = setup_tap_queues(channel, added, connection)
+            else:
+                subscriptions = [(queue_name, queue_name) for queue_name in added]
+            subscribe_queues(channel, subscriptions, connection)
+
+        log_message({
+            'queue': 'system',
+            'body': f"Scoperta code: +{len(added)} -{len(removed)}",
+            'timestamp': datetime.now().isoformat()
+        })
+    except Exception as e:
+        log_error(f"Errore nell'applicazione delle modifiche alle code: {e}")
+
+
+def poll_queue_changes(connection):
+    """
+    Scarica uno snapshot delle code, aggiorna la cache e pianifica le modifiche
+    alle sottoscrizioni sul thread della connessione.
+
+    Args:
+        connection (dict): Configurazione di connessione
+
+    Returns:
+        tuple: (code aggiunte, code rimosse)
+    """
+    # Polling in background: gli errori dell'API vanno nel log, non sopra l'interfaccia
+    queues_data = get_queues_from_api(connection, quiet=True)
+    if not queues_data:
+        return [], []
+
+    # Lo snapshot aggiorna anche le statistiche e lo storico mostrati nell'interfaccia
+    connection['queues_data'] = queues_data
+    record_queue_samples(queues_data)
+    evaluate_alerts(connection, queues_data)
+    bump_version('queues')
+
+    # Il firehose non ha sottoscrizioni per coda; con il processo di ingest le sottoscrizioni
+    # appartengono al processo figlio e restano quelle iniziali
+    if connection.get('consume_mode', DEFAULT_CONSUME_MODE) == CONSUME_MODE_FIREHOSE:
+        return [], []
+    if connection.get('node_consumers'):
+        # Consumo per leader: ogni coda va sottoscritta sulla connessione al nodo che la ospita
+        from rabbitmq.leaders import rebalance_leader_consumers  # Import ritardato per evitare import circolari
+        return rebalance_leader_consumers(connection, queues_data)
+    rmq_connection = connection.get('rmq_connection')
+    if rmq_connection is None or not rmq_connection.is_open:
+        return [], []
+
+    consumable = filter_consumable_queues(queues_data, get_queue_filter(connection))
+    added, removed = diff_queue_snapshot(connection.get('subscriptions', {}).keys(), consumable)
+    ignored = connection.get('tap_ignored')
+    if ignored:
+        # Le code ignorate dal tap restano fuori finché esistono; se ricreate vengono riprovate
+        ignored.intersection_update(consumable)
+        added = [queue_name for queue_name in added if queue_name not in ignored]
+
+    # Le nuove code in tap richiedono binding aggiornati
+    if added and connection.get('consume_mode', DEFAULT_CONSUME_MODE) == CONSUME_MODE_TAP:
+        bindings_data = get_vhost_bindings(connection)
+        if bindings_data is None:
+            # Con i binding in cache le nuove code risulterebbero senza binding e verrebbero ignorate:
+            # restano da aggiungere e si riprova al prossimo snapshot
+            added = []
+        else:
+            connection['bindings_data'] = bindings_data
+    if not added and not removed:
+        return [], []
+
+    rmq_connection.add_callback_threadsafe(lambda: apply_queue_changes(connection, added, removed))
+    return added, removed
+
+
+def start_queue_discovery(connection):
+    """
+    Avvia il thread di scoperta periodica delle code per la connessione attiva.
+
+    Args:
+        connection (dict): Configurazione di connessione
+    """
+    # Lo storico riparte dallo snapshot iniziale della nuova connessione
+    reset_queue_history()
+    reset_alerts()
+    record_queue_samples(connection.get('queues_data', []))
+    evaluate_alerts(connection, connection.get('queues_data', []))
+    
+    def discovery_loop():
+        interval = float(connection.get('discovery_interval', DISCOVERY_INTERVAL))
+        while True:
+            time.sleep(interval)
+
+            active_connection = get_active_connection()
+            if active_connection is not connection or connection.get('closing'):
+                break
+            if connection.get('discovery_thread') is not threading.current_thread():
+                # Connessione ripresa dalla cache: il polling è passato a un nuovo thread
+                break
+            if connection.get('reconnecting'):
+                continue
+
+            try:
+                poll_queue_changes(connection)
+            except Exception as e:
+                log_error(f"Errore nella scoperta delle code: {e}")
+
+    discovery_thread = threading.Thread(target=discovery_loop, daemon=True)
+    discovery_thread.start()
+    connection['discovery_thread'] = discovery_thread
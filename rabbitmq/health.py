@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Stato di salute delle connessioni guidato dalle callback di pika.
+Le metriche sono tenute separate dai messaggi catturati.
+"""
+import threading
+import time
+
+from utils.constants import HEALTH_TICK_INTERVAL
+from utils.logger import log_message
+
+HEALTH_OPEN = "open"
+HEALTH_BLOCKED = "blocked"
+HEALTH_STALLED = "stalled"
+HEALTH_RECONNECTING = "reconnecting"
+HEALTH_CLOSED = "closed"
+
+_lock = threading.Lock()
+_health = {}
+
+
+def _state_for(connection):
+    key = connection.get('id')
+    state = _health.get(key)
+    if state is None:
+        state = {
+            'state': HEALTH_CLOSED,
+            'opened_at': None,
+            'closed_at': None,
+            'close_reason': None,
+            'blocked_since': None,
+            'blocked_total': 0.0,
+            'blocked_count': 0,
+            'last_io_tick': None,
+        }
+        _health[key] = state
+    return state
+
+
+def attach_health_callbacks(connection, rmq_connection):
+    """
+    Registra le callback di flow control e il tick periodico sull'I/O loop di pika.
+    Va chiamata prima di avviare il thread consumer: da quel momento tutte le callback
+    girano sul thread che possiede la connessione.
+
+    Args:
+        connection (dict): Configurazione di connessione
+        rmq_connection: Connessione pika (BlockingConnection)
+    """
+    def on_blocked(_connection, method):
+        reason = getattr(getattr(method, 'method', None), 'reason', '')
+        mark_blocked(connection, reason)
+
+    def on_unblocked(_connection, _method):
+        mark_unblocked(connection)
+
+    def on_tick():
+        record_io_tick(connection)
+        if rmq_connection.is_open:
+            rmq_connection.call_later(HEALTH_TICK_INTERVAL, on_tick)
+
+    rmq_connection.add_on_connection_blocked_callback(on_blocked)
+    rmq_connection.add_on_connection_unblocked_callback(on_unblocked)
+    rmq_connection.call_later(HEALTH_TICK_INTERVAL, on_tick)
+    mark_open(connection)
+
+
+def mark_open(connection):
+    """Registra l'apertura (o riapertura) della connessione"""
+    with _lock:
+        state = _state_for(connection)
+        state['state'] = HEALTH_OPEN
+        state['opened_at'] = time.monotonic()
+        state['last_io_tick'] = state['opened_at']
+        state['blocked_since'] = None
+
+
+def mark_closed(connection, reason=None, reconnecting=False):
+    """
+    Registra la chiusura della connessione.
+
+    Args:
+        connection (dict): Configurazione di connessione
+        reason (str, optional): Motivo della chiusura
+        reconnecting (bool): True se è partita la riconnessione automatica
+    """
+    with _lock:
+        state = _state_for(connection)
+        now = time.monotonic()
+        if state['blocked_since'] is not None:
+            state['blocked_total'] += now - state['blocked_since']
+            state['blocked_since'] = None
+        state['state'] = HEALTH_RECONNECTING if reconnecting else HEALTH_CLOSED
+        state['closed_at'] = now
+        state['close_reason'] = reason
+
+
+def mark_blocked(connection, reason=''):
+    """Registra l'inizio di un blocco di flow control (connection.blocked)"""
+    with _lock:
+        state = _state_for(connection)
+        if state['blocked_since'] is None:
+            state['blocked_since'] = time.monotonic()
+            state['blocked_count'] += 1
+        state['state'] = HEALTH_BLOCKED
+
+    log_message({
+        'queue': 'system',
+        'body': f"Connessione a {connection.get('host')} bloccata dal broker: {reason}",
+        'timestamp': time.strftime('%Y-%m-%d %H:%M:%S')
+    })
+
+
+def mark_unblocked(connection):
+    """Registra la fine di un blocco di flow control (connection.unblocked)"""
+    with _lock:
+        state = _state_for(connection)
+        if state['blocked_since'] is not None:
+            state['blocked_total'] += time.monotonic() - state['blocked_since']
+            state['blocked_since'] = None
+        state['state'] = HEALTH_OPEN
+
+
+def record_io_tick(connection):
+    """Registra che l'I/O loop di pika è vivo (heartbeat interno)"""
+    with _lock:
+        _state_for(connection)['last_io_tick'] = time.monotonic()
+
+
+def get_health(connection):
+    """
+    Ritorna un'istantanea dello stato di salute della connessione.
+
+    Args:
+        connection (dict): Configurazione di connessione
+
+    Returns:
+        dict: Stato, tempo totale in blocco, numero di blocchi, età dell'ultimo tick
+    """
+    with _lock:
+        state = dict(_state_for(connection))
+
+    now = time.monotonic()
+    blocked_total = state['blocked_total']
+    if state['blocked_since'] is not None:
+        blocked_total += now - state['blocked_since']
+    state['blocked_total'] = blocked_total
+
+    last_tick = state['last_io_tick']
+    state['io_tick_age'] = now - last_tick if last_tick is not None else None
+    if state['state'] == HEALTH_OPEN and state['io_tick_age'] is not None \
+            and state['io_tick_age'] > 3 * HEALTH_TICK_INTERVAL:
+        # L'I/O loop non gira: i callback di pika non vengono serviti
+        state['state'] = HEALTH_STALLED
+    return state
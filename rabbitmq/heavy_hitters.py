@@ -0,0 +1,200 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Chiavi dominanti del traffico (routing key, exchange, valori di header scelti) su finestre
+scorrevoli, con memoria fissa qualunque sia il numero di chiavi distinte.
+
+Ogni dimensione tiene un anello di bucket temporali; ogni bucket ha due Space-Saving
+(per messaggi e per byte), che propongono le chiavi candidate, e due count-min, che ne
+stimano i conteggi sommati sulla finestra.
+"""
+import threading
+import time
+
+from utils.constants import (
+    HEAVY_HITTER_BUCKET_SECONDS,
+    HEAVY_HITTER_WINDOWS,
+    HEAVY_HITTER_CAPACITY,
+    HEAVY_HITTER_SKETCH_WIDTH,
+    HEAVY_HITTER_SKETCH_DEPTH,
+    HEAVY_HITTER_TOP_K,
+    RENDER_MIN_INTERVAL,
+)
+from utils.sketches import SpaceSaving, CountMinSketch
+from utils.state import bump_version
+
+DIMENSION_ROUTING_KEY = "routing_key"
+DIMENSION_EXCHANGE = "exchange"
+HEADER_DIMENSION_PREFIX = "header:"
+
+_BUCKETS = max(HEAVY_HITTER_WINDOWS) // HEAVY_HITTER_BUCKET_SECONDS
+
+_lock = threading.Lock()
+_dimensions = {}  # nome dimensione -> _Dimension
+_header_names = ()
+_last_bump = 0.0
+
+
+class _Bucket:
+    """Conteggi di una dimensione in un intervallo di HEAVY_HITTER_BUCKET_SECONDS secondi"""
+
+    __slots__ = ("period", "top_messages", "top_bytes", "messages", "bytes")
+
+    def __init__(self):
+        self.period = None
+        self.top_messages = SpaceSaving(HEAVY_HITTER_CAPACITY)
+        self.top_bytes = SpaceSaving(HEAVY_HITTER_CAPACITY)
+        self.messages = CountMinSketch(HEAVY_HITTER_SKETCH_WIDTH, HEAVY_HITTER_SKETCH_DEPTH)
+        self.bytes = CountMinSketch(HEAVY_HITTER_SKETCH_WIDTH, HEAVY_HITTER_SKETCH_DEPTH)
+
+    def reset(self, period):
+        self.period = period
+        self.top_messages.clear()
+        self.top_bytes.clear()
+        self.messages.clear()
+        self.bytes.clear()
+
+
+class _Dimension:
+    """Anello di bucket di una dimensione: la memoria è allocata una volta sola"""
+
+    __slots__ = ("buckets",)
+
+    def __init__(self):
+        self.buckets = [_Bucket() for _ in range(_BUCKETS)]
+
+    def bucket_for(self, period):
+        bucket = self.buckets[period % _BUCKETS]
+        if bucket.period != period:
+            bucket.reset(period)
+        return bucket
+
+    def window(self, period, seconds):
+        """Bucket che ricadono negli ultimi 'seconds' secondi"""
+        oldest = period - max(1, seconds // HEAVY_HITTER_BUCKET_SECONDS) + 1
+        return [bucket for bucket in self.buckets if bucket.period is not None and bucket.period >= oldest]
+
+
+def configure_heavy_hitters(connection_config):
+    """
+    Configura le dimensioni tracciate e azzera i conteggi.
+    Durante una riconnessione automatica i conteggi vengono mantenuti.
+
+    Args:
+        connection_config (dict): Configurazione di connessione (heavy_hitter_headers: nomi di header)
+    """
+    global _header_names
+    header_names = tuple(connection_config.get('heavy_hitter_headers') or ())
+    with _lock:
+        if connection_config.get('connection_lost') and header_names == _header_names and _dimensions:
+            return
+        _header_names = header_names
+        _dimensions.clear()
+        for name in get_dimensions():
+            _dimensions[name] = _Dimension()
+    bump_version('heavy_hitters')
+
+
+def get_dimensions():
+    """Ritorna i nomi delle dimensioni tracciate, nell'ordine di visualizzazione"""
+    return (DIMENSION_ROUTING_KEY, DIMENSION_EXCHANGE) + tuple(
+        HEADER_DIMENSION_PREFIX + name for name in _header_names
+    )
+
+
+def _record(dimension, key, size, period):
+    bucket = dimension.bucket_for(period)
+    bucket.top_messages.add(key)
+    bucket.top_bytes.add(key, size)
+    cells = bucket.messages.cells(key)
+    bucket.messages.add_cells(cells)
+    bucket.bytes.add_cells(cells, size)
+
+
+def record_heavy_hitters(exchange, routing_key, headers, size, now=None):
+    """
+    Conta una consegna in tutte le dimensioni tracciate.
+    Va chiamata per ogni consegna, prima di filtro e campionamento.
+
+    Args:
+        exchange (str): Exchange del messaggio
+        routing_key (str): Routing key del messaggio
+        headers (dict): Header del messaggio
+        size (int): Dimensione del corpo in byte
+        now (float, optional): Istante della consegna (time.time)
+    """
+    global _last_bump
+    now = time.time() if now is None else now
+    period = int(now // HEAVY_HITTER_BUCKET_SECONDS)
+    with _lock:
+        if not _dimensions:
+            for name in get_dimensions():
+                _dimensions[name] = _Dimension()
+        _record(_dimensions[DIMENSION_ROUTING_KEY], routing_key or "", size, period)
+        _record(_dimensions[DIMENSION_EXCHANGE], exchange or "default", size, period)
+        if _header_names and headers:
+            for name in _header_names:
+                value = headers.get(name)
+                if value is None:
+                    continue
+                if isinstance(value, bytes):
+                    value = value.decode("utf-8", errors="replace")
+                _record(_dimensions[HEADER_DIMENSION_PREFIX + name], str(value), size, period)
+
+    # L'interfaccia viene avvisata al massimo una volta per intervallo di rendering
+    monotonic = time.monotonic()
+    if monotonic - _last_bump >= RENDER_MIN_INTERVAL:
+        _last_bump = monotonic
+        bump_version('heavy_hitters')
+
+
+def get_top_keys(dimension, seconds, by="messages", k=HEAVY_HITTER_TOP_K, now=None):
+    """
+    Chiavi dominanti di una dimensione sulla finestra indicata.
+
+    Args:
+        dimension (str): Nome della dimensione (vedi get_dimensions)
+        seconds (int): Ampiezza della finestra in secondi
+        by (str): "messages" o "bytes"
+        k (int): Numero di chiavi
+        now (float, optional): Istante di riferimento (time.time)
+
+    Returns:
+        list: Tuple (chiave, messaggi stimati, byte stimati), in ordine decrescente
+    """
+    now = time.time() if now is None else now
+    period = int(now // HEAVY_HITTER_BUCKET_SECONDS)
+    with _lock:
+        state = _dimensions.get(dimension)
+        if state is None:
+            return []
+        buckets = state.window(period, seconds)
+        if not buckets:
+            return []
+
+        # Le candidate vengono dagli Space-Saving, i conteggi dai count-min sommati sulla finestra
+        candidates = set()
+        for bucket in buckets:
+            summary = bucket.top_messages if by == "messages" else bucket.top_bytes
+            candidates.update(summary.counters)
+        message_sketches = [bucket.messages for bucket in buckets]
+        byte_sketches = [bucket.bytes for bucket in buckets]
+        sketch = buckets[0].messages
+        rows = []
+        for key in candidates:
+            cells = sketch.cells(key)
+            rows.append((
+                key,
+                CountMinSketch.estimate_sum(message_sketches, cells),
+                CountMinSketch.estimate_sum(byte_sketches, cells),
+            ))
+
+    rows.sort(key=lambda row: row[1] if by == "messages" else row[2], reverse=True)
+    return rows[:k]
+
+
+def reset_heavy_hitters():
+    """Azzera i conteggi (es. al cambio di connessione)"""
+    with _lock:
+        _dimensions.clear()
+    bump_version('heavy_hitters')
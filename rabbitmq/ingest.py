@@ -0,0 +1,293 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Ingest in un processo separato: la connessione pika e la ricezione girano in un processo
+figlio, che scrive record compatti in un buffer circolare in memoria condivisa.
+Il processo dell'interfaccia legge i record direttamente dal segmento, così rendering,
+log e decodifica non rallentano heartbeat e consegne e l'ingest usa un secondo core.
+"""
+import json
+import multiprocessing
+import struct
+import threading
+import time
+
+from utils.constants import INGEST_RING_BYTES, INGEST_POLL_INTERVAL, HEALTH_TICK_INTERVAL
+from utils.capture import encode_value, decode_value
+from utils.logger import log_error
+from utils.shm_ring import SharedRing, FLAG_BLOCKED
+from config.connections import persisted_view
+from rabbitmq.consumer import setup_consumer, configure_processing, set_delivery_sink
+from rabbitmq.consumer import delivery_fields, ingest_delivery
+from rabbitmq.health import mark_open, mark_blocked, mark_unblocked, record_io_tick
+
+# Lunghezze dei campi di un record, seguite dai campi stessi nello stesso ordine
+_RECORD_HEADER = struct.Struct("<8I")
+_STOP_CHECK_INTERVAL = 0.2
+_START_TIMEOUT = 60.0
+
+_default_enabled = False
+
+
+def set_ingest_process_default(enabled):
+    """
+    Imposta l'uso del processo di ingest per le connessioni che non lo specificano.
+
+    Args:
+        enabled (bool): True per consumare in un processo separato
+    """
+    global _default_enabled
+    _default_enabled = bool(enabled)
+
+
+def uses_ingest_process(connection):
+    """Verifica se la connessione va consumata nel processo di ingest"""
+    return bool(connection.get('ingest_process', _default_enabled))
+
+
+def _text(value):
+    return (value or "").encode("utf-8")
+
+
+def encode_delivery(queue_name, fields, body):
+    """
+    Serializza una consegna in un record del buffer circolare.
+
+    Args:
+        queue_name (str): Nome della coda
+        fields (dict): Campi come restituiti da delivery_fields
+        body (bytes): Corpo del messaggio
+
+    Returns:
+        tuple: Parti del record, da passare a SharedRing.write
+    """
+    meta = json.dumps({
+        "headers": encode_value(fields["headers"]),
+        "properties": encode_value(fields["raw_properties"]),
+    }, separators=(",", ":")).encode("utf-8")
+    parts = [
+        _text(queue_name),
+        _text(fields["exchange"]),
+        _text(fields["routing_key"]),
+        _text(fields["content_type"]),
+        _text(fields["content_encoding"]),
+        _text(fields["properties"]),
+        meta,
+        body,
+    ]
+    return (_RECORD_HEADER.pack(*(len(part) for part in parts)), *parts)
+
+
+def decode_delivery(payload):
+    """
+    Ricostruisce una consegna da un record del buffer circolare.
+    I campi vengono letti direttamente dalla memoryview; solo il corpo viene copiato,
+    perché resta memorizzato con il messaggio.
+
+    Args:
+        payload (memoryview): Record come passato da SharedRing.read
+
+    Returns:
+        tuple: (queue_name, fields, body)
+    """
+    lengths = _RECORD_HEADER.unpack_from(payload)
+    offsets = [_RECORD_HEADER.size]
+    for length in lengths:
+        offsets.append(offsets[-1] + length)
+    values = [payload[offsets[index]:offsets[index + 1]] for index in range(len(lengths))]
+
+    queue_name, exchange, routing_key, content_type, content_encoding, properties_text = (
+        str(value, "utf-8") for value in values[:6]
+    )
+    meta = json.loads(str(values[6], "utf-8"))
+    body = bytes(values[7])
+    for value in values:
+        value.release()
+
+    fields = {
+        "exchange": exchange,
+        "routing_key": routing_key,
+        "content_type": content_type or None,
+        "content_encoding": content_encoding or None,
+        "headers": decode_value(meta["headers"]) or {},
+        "properties": properties_text,
+        "raw_properties": decode_value(meta["properties"]),
+    }
+    return queue_name, fields, body
+
+
+def _handle_record(payload):
+    queue_name, fields, body = decode_delivery(payload)
+    ingest_delivery(queue_name, fields, body)
+
+
+def _ingest_main(connection_config, ring_name, consumable_queues, stop_event, status, connection_attempts):
+    """Processo figlio: connessione pika, sottoscrizioni e scrittura delle consegne nel buffer"""
+    ring = SharedRing.attach(ring_name)
+    try:
+        import pika
+
+        credentials = pika.PlainCredentials(connection_config['user'], connection_config['password'])
+        parameters = pika.ConnectionParameters(
+            host=connection_config['host'],
+            virtual_host=connection_config['vhost'],
+            credentials=credentials,
+            heartbeat=15,
+            blocked_connection_timeout=30,
+            connection_attempts=connection_attempts
+        )
+        rmq_connection = pika.BlockingConnection(parameters)
+        channel = rmq_connection.channel()
+    except Exception as e:
+        status.send(f"Connessione AMQP fallita: {e}")
+        ring.close()
+        return
+
+    def write_delivery(queue_name, method, properties, body, traced):
+        ring.write(*encode_delivery(queue_name, delivery_fields(method, properties, traced), body))
+
+    def on_tick():
+        ring.tick()
+        if rmq_connection.is_open:
+            rmq_connection.call_later(HEALTH_TICK_INTERVAL, on_tick)
+
+    def check_stop():
+        if stop_event.is_set():
+            channel.stop_consuming()
+        elif rmq_connection.is_open:
+            rmq_connection.call_later(_STOP_CHECK_INTERVAL, check_stop)
+
+    set_delivery_sink(write_delivery)
+    rmq_connection.add_on_connection_blocked_callback(lambda *_: ring.set_flag(FLAG_BLOCKED, True))
+    rmq_connection.add_on_connection_unblocked_callback(lambda *_: ring.set_flag(FLAG_BLOCKED, False))
+    rmq_connection.call_later(HEALTH_TICK_INTERVAL, on_tick)
+    rmq_connection.call_later(_STOP_CHECK_INTERVAL, check_stop)
+
+    stopped = threading.Event()
+    if not setup_consumer(rmq_connection, channel, consumable_queues, connection_config, on_stopped=stopped.set):
+        status.send("Configurazione consumer fallita")
+    else:
+        status.send(None)
+        stopped.wait()
+
+    try:
+        if rmq_connection.is_open:
+            rmq_connection.close()
+    except Exception:
+        pass
+    ring.close()
+
+
+def _drain_loop(connection, ring, process, on_stopped):
+    """Thread del processo principale: legge il buffer e segue lo stato del processo figlio"""
+    last_ticks = 0
+    last_dropped = 0
+    blocked = False
+    try:
+        while True:
+            count = ring.read(_handle_record)
+
+            stats = ring.stats()
+            if stats['ticks'] != last_ticks:
+                last_ticks = stats['ticks']
+                record_io_tick(connection)
+            if bool(stats['flags'] & FLAG_BLOCKED) != blocked:
+                blocked = not blocked
+                if blocked:
+                    mark_blocked(connection, "segnalato dal processo di ingest")
+                else:
+                    mark_unblocked(connection)
+            if stats['dropped'] != last_dropped:
+                log_error(f"Buffer di ingest pieno: {stats['dropped'] - last_dropped} consegne scartate")
+                last_dropped = stats['dropped']
+
+            if count == 0:
+                if not process.is_alive():
+                    # Ultimi record scritti prima dell'uscita del processo
+                    ring.read(_handle_record)
+                    break
+                time.sleep(INGEST_POLL_INTERVAL)
+    except Exception as e:
+        log_error(f"Errore nella lettura del buffer di ingest: {e}")
+    finally:
+        process.join(1)
+        ring.close()
+        if on_stopped:
+            on_stopped()
+
+
+def start_ingest_process(connection, consumable_queues, on_stopped=None, connection_attempts=3):
+    """
+    Avvia il processo di ingest per la connessione e il thread che ne legge il buffer.
+
+    Args:
+        connection (dict): Configurazione di connessione
+        consumable_queues (list): Nomi delle code da consumare
+        on_stopped (callable, optional): Chiamata quando il processo di ingest termina
+        connection_attempts (int): Tentativi di connessione delegati a pika
+
+    Returns:
+        bool: True se il processo è connesso e ha sottoscritto le code
+    """
+    # Filtro, campionamento e decodifica restano nel processo principale
+    configure_processing(connection)
+
+    ring = SharedRing.create(INGEST_RING_BYTES)
+    context = multiprocessing.get_context("spawn")
+    stop_event = context.Event()
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(
+        target=_ingest_main,
+        args=(persisted_view(connection), ring.name, list(consumable_queues), stop_event, sender,
+              connection_attempts),
+        name="ingest",
+        daemon=True,
+    )
+    process.start()
+    sender.close()
+
+    error = "Timeout nell'avvio del processo di ingest"
+    try:
+        if receiver.poll(_START_TIMEOUT):
+            error = receiver.recv()
+    except EOFError:
+        error = "Processo di ingest terminato durante l'avvio"
+    finally:
+        receiver.close()
+
+    if error is not None:
+        log_error(error)
+        stop_event.set()
+        process.join(5)
+        if process.is_alive():
+            process.terminate()
+        ring.close()
+        return False
+
+    connection['ingest_worker'] = process
+    connection['ingest_stop'] = stop_event
+    mark_open(connection)
+
+    drain_thread = threading.Thread(
+        target=_drain_loop, args=(connection, ring, process, on_stopped), name="ingest-reader", daemon=True
+    )
+    drain_thread.start()
+    connection['consumer_thread'] = drain_thread
+    return True
+
+
+def stop_ingest_process(connection):
+    """
+    Chiede al processo di ingest di chiudere la connessione e terminare.
+
+    Args:
+        connection (dict): Configurazione di connessione
+
+    Returns:
+        bool: True se la connessione usava un processo di ingest
+    """
+    stop_event = connection.get('ingest_stop')
+    if stop_event is None:
+        return False
+    stop_event.set()
+    return True
@@ -0,0 +1,270 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Consumo consapevole dei leader: una connessione AMQP per nodo del cluster e ogni coda
+consumata dal nodo che la ospita (leader delle quorum queue, nodo delle classic queue),
+così le consegne non vengono inoltrate tra i nodi prima di raggiungere il consumer.
+
+Il nome del nodo (es. "rabbit@node3") viene risolto nell'host dopo la '@', oppure tramite
+il campo 'node_hosts' della connessione ({"rabbit@node3": "10.0.0.3:5672"}), utile con
+NAT o con un cluster locale di prova su porte diverse.
+"""
+from datetime import datetime
+
+from config.connections import new_runtime_connection
+from utils.logger import log_message, log_error
+from rabbitmq.api_client import get_nodes_from_api, queue_leader, filter_consumable_queues
+from rabbitmq.consumer import setup_consumer
+from rabbitmq.health import attach_health_callbacks
+from rabbitmq.queue_filter import get_queue_filter
+
+DEFAULT_NODE = None  # Gruppo delle code senza leader raggiungibile: connessione a connection['host']
+AMQP_PORT = 5672
+
+_default_enabled = False
+
+
+def set_leader_aware_default(enabled):
+    """
+    Imposta il consumo per leader per le connessioni che non lo specificano.
+
+    Args:
+        enabled (bool): True per aprire una connessione per nodo
+    """
+    global _default_enabled
+    _default_enabled = bool(enabled)
+
+
+def uses_leader_consumers(connection):
+    """Verifica se la connessione va consumata con una connessione per nodo leader"""
+    return bool(connection.get('leader_aware', _default_enabled))
+
+
+def node_address(connection, node):
+    """
+    Risolve l'indirizzo AMQP di un nodo.
+
+    Args:
+        connection (dict): Configurazione di connessione
+        node (str): Nome del nodo, o DEFAULT_NODE per l'host della connessione
+
+    Returns:
+        tuple: (host, porta)
+    """
+    if node is DEFAULT_NODE:
+        address = connection['host']
+    else:
+        address = (connection.get('node_hosts') or {}).get(node) or node.split('@', 1)[-1]
+    host, _, port = str(address).partition(':')
+    return host, int(port) if port else AMQP_PORT
+
+
+def get_running_nodes(connection):
+    """Nomi dei nodi del cluster in esecuzione secondo l'API Management"""
+    return {node['name'] for node in get_nodes_from_api(connection) if node.get('running', True)}
+
+
+def group_queues_by_leader(queues_data, queue_names, running_nodes):
+    """
+    Raggruppa le code per nodo leader.
+
+    Args:
+        queues_data (list): Snapshot delle code dall'API Management
+        queue_names (list): Code da consumare
+        running_nodes (set): Nodi raggiungibili
+
+    Returns:
+        dict: Nodo (o DEFAULT_NODE) -> lista di code
+    """
+    leaders = {queue.get("name"): queue_leader(queue) for queue in queues_data}
+    groups = {}
+    for queue_name in queue_names:
+        node = leaders.get(queue_name)
+        if node not in running_nodes:
+            node = DEFAULT_NODE
+        groups.setdefault(node, []).append(queue_name)
+    return groups
+
+
+def _open_node_connection(connection, node, connection_attempts):
+    import pika  # Importato al primo utilizzo per non rallentare l'avvio
+
+    host, port = node_address(connection, node)
+    credentials = pika.PlainCredentials(connection['user'], connection['password'])
+    parameters = pika.ConnectionParameters(
+        host=host,
+        port=port,
+        virtual_host=connection['vhost'],
+        credentials=credentials,
+        heartbeat=15,  # Seconds
+        blocked_connection_timeout=30,
+        connection_attempts=connection_attempts
+    )
+    rmq_connection = pika.BlockingConnection(parameters)
+    attach_health_callbacks(connection, rmq_connection)
+    return rmq_connection
+
+
+def open_leader_consumers(connection, consumable_queues, on_lost, connection_attempts=3,
+                          running_nodes=None, connect=None):
+    """
+    Apre una connessione per ogni nodo leader e sottoscrive su ognuna le code che ospita.
+    Le code dei nodi non raggiungibili vengono consumate dalla connessione all'host configurato.
+
+    Args:
+        connection (dict): Configurazione di connessione (con 'queues_data' già popolato)
+        consumable_queues (list): Code da consumare
+        on_lost (callable): Chiamata quando il consumer di un nodo si arresta
+        connection_attempts (int): Tentativi di connessione delegati a pika
+        running_nodes (set, optional): Nodi raggiungibili (default: da /api/nodes)
+        connect (callable, optional): Funzione node -> connessione (default: pika verso node_address)
+
+    Returns:
+        bool: True se tutti i consumer sono stati configurati
+    """
+    close_leader_consumers(connection)
+    if running_nodes is None:
+        running_nodes = get_running_nodes(connection)
+    if connect is None:
+        connect = lambda node: _open_node_connection(connection, node, connection_attempts)
+
+    groups = group_queues_by_leader(connection.get('queues_data', []), consumable_queues, running_nodes)
+    fallback = groups.pop(DEFAULT_NODE, [])
+    node_consumers = {}
+    connection['node_consumers'] = node_consumers
+
+    def open_group(node, queue_names):
+        node_config = new_runtime_connection(connection)
+        node_config['node'] = node
+        rmq_connection = connect(node)
+
+        def on_stopped():
+            # I consumer sostituiti da una riconnessione non devono avviarne un'altra
+            if connection.get('node_consumers', {}).get(node) is node_config:
+                on_lost()
+
+        try:
+            channel = rmq_connection.channel()
+            node_config['rmq_connection'] = rmq_connection
+            node_config['channel'] = channel
+            node_consumers[node] = node_config
+            consumer_setup = setup_consumer(rmq_connection, channel, queue_names, node_config,
+                                            on_stopped=on_stopped)
+        except Exception:
+            node_consumers.pop(node, None)
+            _close_node_connection(node, rmq_connection)
+            raise
+        if not consumer_setup:
+            node_consumers.pop(node, None)
+            _close_node_connection(node, rmq_connection)
+        return consumer_setup
+
+    for node, queue_names in groups.items():
+        try:
+            if open_group(node, queue_names):
+                continue
+            log_error(f"Consumer sul nodo {node} non configurato, code consumate tramite {connection['host']}")
+        except Exception as e:
+            # Nodo irraggiungibile: le sue code passano dalla connessione principale
+            log_error(f"Connessione al nodo {node} fallita, code consumate tramite {connection['host']}: {e}")
+        fallback.extend(queue_names)
+
+    if fallback or not node_consumers:
+        try:
+            consumer_setup = open_group(DEFAULT_NODE, fallback)
+        except Exception:
+            close_leader_consumers(connection)
+            raise
+        if not consumer_setup:
+            close_leader_consumers(connection)
+            return False
+
+    log_message({
+        'queue': 'system',
+        'body': "Consumo per leader: " + ", ".join(
+            f"{node or connection['host']} ({len(config.get('subscriptions', {}))} code)"
+            for node, config in node_consumers.items()
+        ),
+        'timestamp': datetime.now().isoformat()
+    })
+    return True
+
+
+def close_leader_consumers(connection):
+    """
+    Chiude tutte le connessioni per nodo.
+
+    Args:
+        connection (dict): Configurazione di connessione
+    """
+    node_consumers = connection.pop('node_consumers', None) or {}
+    for node, node_config in node_consumers.items():
+        _close_node_connection(node, node_config.get('rmq_connection'))
+
+
+def _close_node_connection(node, rmq_connection):
+    try:
+        if rmq_connection is not None and rmq_connection.is_open:
+            rmq_connection.close()
+    except Exception as e:
+        log_error(f"Errore nella chiusura della connessione al nodo {node}: {e}")
+
+
+def rebalance_leader_consumers(connection, queues_data):
+    """
+    Allinea le sottoscrizioni per nodo allo snapshot: nuove code sul loro leader,
+    code rimosse annullate e code il cui leader è cambiato spostate sulla connessione giusta.
+
+    Args:
+        connection (dict): Configurazione di connessione
+        queues_data (list): Snapshot delle code
+
+    Returns:
+        tuple: (code aggiunte, code rimosse), spostamenti inclusi
+    """
+    from rabbitmq.discovery import apply_queue_changes  # Import ritardato per evitare import circolari
+
+    node_consumers = connection.get('node_consumers') or {}
+    if not node_consumers:
+        return [], []
+
+    subscribed = {
+        queue_name: node
+        for node, node_config in node_consumers.items()
+        for queue_name in node_config.get('subscriptions', {})
+    }
+    consumable = filter_consumable_queues(queues_data, get_queue_filter(connection))
+    leaders = {queue.get("name"): queue_leader(queue) for queue in queues_data}
+    default_node = DEFAULT_NODE if DEFAULT_NODE in node_consumers else next(iter(node_consumers))
+
+    changes = {}  # nodo -> (code da aggiungere, code da rimuovere)
+    for queue_name in consumable:
+        target = leaders.get(queue_name)
+        if target not in node_consumers:
+            # Leader senza connessione (nodo nuovo o irraggiungibile): la coda resta dov'è
+            target = subscribed.get(queue_name, default_node)
+        current = subscribed.get(queue_name)
+        if current == target and queue_name in subscribed:
+            continue
+        changes.setdefault(target, ([], []))[0].append(queue_name)
+        if queue_name in subscribed:
+            changes.setdefault(current, ([], []))[1].append(queue_name)
+
+    consumable = set(consumable)
+    for queue_name, node in subscribed.items():
+        if queue_name not in consumable:
+            changes.setdefault(node, ([], []))[1].append(queue_name)
+
+    all_added, all_removed = [], []
+    for node, (added, removed) in changes.items():
+        node_config = node_consumers[node]
+        rmq_connection = node_config.get('rmq_connection')
+        if rmq_connection is None or not rmq_connection.is_open:
+            continue
+        rmq_connection.add_callback_threadsafe(
+            lambda node_config=node_config, added=added, removed=removed:
+                apply_queue_changes(node_config, added, removed)
+        )
+        all_added.extend(added)
+        all_removed.extend(removed)
+    return sorted(all_added), sorted(all_removed)
@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Broker in-process minimale con la stessa interfaccia di BlockingConnection/BlockingChannel usata dal consumer.
+Serve al benchmark per misurare i limiti di ingestione dell'explorer senza un broker reale;
+più istanze simulano i nodi di un cluster per il consumo per leader.
+Supporta solo il default exchange (routing key = nome della coda).
+"""
+import itertools
+import queue
+import threading
+from types import SimpleNamespace
+
+from rabbitmq.replay import PROPERTY_NAMES
+
+
+class BasicProperties:
+    """Proprietà del messaggio con gli stessi attributi di pika.BasicProperties"""
+
+    def __init__(self, **kwargs):
+        for name in PROPERTY_NAMES:
+            setattr(self, name, kwargs.get(name))
+
+    def __repr__(self):
+        values = ", ".join(f"{name}={getattr(self, name)!r}" for name in PROPERTY_NAMES
+                           if getattr(self, name) is not None)
+        return f"<BasicProperties({values})>"
+
+
+class LoopbackBroker:
+    """Registro delle code: nome coda -> (connessione del consumer, callback)"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.consumers = {}
+        self.consumer_tags = {}  # consumer tag -> nome coda
+        self.queue_ids = itertools.count(1)
+        self.tags = itertools.count(1)
+
+    def connect(self):
+        return LoopbackConnection(self)
+
+    def route(self, exchange, routing_key, body, properties):
+        with self.lock:
+            consumer = self.consumers.get(routing_key) if not exchange else None
+        if consumer is None:
+            return False
+        connection, callback = consumer
+        method = SimpleNamespace(exchange=exchange, routing_key=routing_key,
+                                 delivery_tag=next(self.tags), redelivered=False)
+        connection.inbox.put((callback, method, properties, body))
+        return True
+
+
+class LoopbackConnection:
+    def __init__(self, broker):
+        self.broker = broker
+        self.inbox = queue.Queue()
+        self.is_open = True
+
+    def channel(self):
+        return LoopbackChannel(self)
+
+    def add_callback_threadsafe(self, callback):
+        self.inbox.put(callback)
+
+    def process_data_events(self, time_limit=0):
+        try:
+            item = self.inbox.get(timeout=time_limit)
+        except queue.Empty:
+            return
+        if callable(item):
+            item()
+
+    def close(self):
+        self.is_open = False
+        self.inbox.put(None)
+
+
+class LoopbackChannel:
+    def __init__(self, connection):
+        self.connection = connection
+        self.broker = connection.broker
+        self.consuming = False
+
+    def queue_declare(self, queue='', **kwargs):
+        name = queue or f"loopback.gen-{next(self.broker.queue_ids)}"
+        return SimpleNamespace(method=SimpleNamespace(queue=name, message_count=0, consumer_count=0))
+
+    def queue_bind(self, **kwargs):
+        pass
+
+    def queue_delete(self, queue):
+        with self.broker.lock:
+            self.broker.consumers.pop(queue, None)
+
+    def confirm_delivery(self):
+        pass
+
+    @property
+    def is_open(self):
+        return self.connection.is_open
+
+    def basic_consume(self, queue, on_message_callback, auto_ack=False):
+        consumer_tag = f"loopback.ctag-{next(self.broker.tags)}"
+        with self.broker.lock:
+            self.broker.consumers[queue] = (self.connection, on_message_callback)
+            self.broker.consumer_tags[consumer_tag] = queue
+        return consumer_tag
+
+    def basic_cancel(self, consumer_tag):
+        with self.broker.lock:
+            queue = self.broker.consumer_tags.pop(consumer_tag, None)
+            consumer = self.broker.consumers.get(queue)
+            if consumer is not None and consumer[0] is self.connection:
+                del self.broker.consumers[queue]
+
+    def basic_publish(self, exchange, routing_key, body, properties=None, mandatory=False):
+        self.broker.route(exchange, routing_key, body, properties or BasicProperties())
+
+    def start_consuming(self):
+        self.consuming = True
+        while self.consuming and self.connection.is_open:
+            item = self.connection.inbox.get()
+            if item is None:
+                break
+            if callable(item):
+                item()
+                continue
+            callback, method, properties, body = item
+            callback(self, method, properties, body)
+
+    def stop_consuming(self):
+        self.consuming = False
@@ -0,0 +1,290 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Filtri sui messaggi valutati al momento della ricezione, prima di memorizzarli o registrarli.
+
+Sintassi:
+    rk ~ orders.*.failed and header.tenant = 42
+    json.status = "failed" or (queue = billing and not json.retry)
+
+Campi: rk (routing key), exchange, queue, header.<nome>, json.<percorso.separato.da.punti>
+Operatori: = != ~ (glob) !~ > < >= <=; un campo senza operatore verifica la presenza.
+Combinatori: and, or, not, parentesi.
+"""
+import fnmatch
+import re
+import threading
+
+from rabbitmq.decoders import loads_json
+from utils.state import bump_version
+
+_TOKEN_RE = re.compile(
+    r'\s*(?:(?P<lparen>\()|(?P<rparen>\))|(?P<op>!=|>=|<=|!~|=|~|>|<)'
+    r'|"(?P<dquoted>(?:[^"\\]|\\.)*)"|\'(?P<squoted>(?:[^\'\\]|\\.)*)\''
+    r'|(?P<word>[^\s()=!~<>"\']+))'
+)
+_KEYWORDS = ("and", "or", "not")
+_SIMPLE_FIELDS = {"rk": "routing_key", "routing_key": "routing_key", "exchange": "exchange", "queue": "queue"}
+
+_lock = threading.Lock()
+_active_expression = ""
+_active_filter = None
+_filter_error = None  # Errore del filtro salvato che non è stato possibile applicare
+
+
+def _tokenize(expression):
+    tokens = []
+    position = 0
+    expression = expression.strip()
+    while position < len(expression):
+        match = _TOKEN_RE.match(expression, position)
+        if not match or match.end() == position:
+            raise ValueError(f"Carattere non valido alla posizione {position}: {expression[position:]!r}")
+        position = match.end()
+        kind = match.lastgroup
+        if kind in ("dquoted", "squoted"):
+            tokens.append(("value", match.group(kind).replace('\\"', '"').replace("\\'", "'")))
+        elif kind == "word" and match.group(kind).lower() in _KEYWORDS:
+            tokens.append((match.group(kind).lower(), None))
+        else:
+            tokens.append((kind, match.group(kind)))
+    return tokens
+
+
+def _json_lookup(document, path):
+    for part in path:
+        if isinstance(document, dict):
+            if part not in document:
+                return None
+            document = document[part]
+        elif isinstance(document, list) and part.isdigit() and int(part) < len(document):
+            document = document[int(part)]
+        else:
+            return None
+    return document
+
+
+def _to_text(value):
+    if isinstance(value, bytes):
+        return value.decode("utf-8", errors="replace")
+    return str(value)
+
+
+def _compare(actual, op, expected):
+    if actual is None:
+        return op in ("!=", "!~")
+    if op in ("~", "!~"):
+        matched = fnmatch.fnmatchcase(_to_text(actual), expected)
+        return matched if op == "~" else not matched
+    if op in (">", "<", ">=", "<="):
+        try:
+            left, right = float(actual), float(expected)
+        except (TypeError, ValueError):
+            return False
+        return {">": left > right, "<": left < right, ">=": left >= right, "<=": left <= right}[op]
+
+    if isinstance(actual, bool):
+        equal = _to_text(actual).lower() == expected.lower()
+    elif isinstance(actual, (int, float)):
+        try:
+            equal = float(actual) == float(expected)
+        except ValueError:
+            equal = False
+    else:
+        equal = _to_text(actual) == expected
+    return equal if op == "=" else not equal
+
+
+def _make_getter(field):
+    """Ritorna (getter, usa_json) per un campo del filtro"""
+    if field in _SIMPLE_FIELDS:
+        key = _SIMPLE_FIELDS[field]
+        return (lambda message: message[key]), False
+    if field.startswith("header.") and len(field) > 7:
+        name = field[7:]
+        return (lambda message: message["headers"].get(name)), False
+    if field.startswith("json.") and len(field) > 5:
+        path = field[5:].split(".")
+        return (lambda message: _json_lookup(message["json"](), path)), True
+    raise ValueError(f"Campo sconosciuto: {field}")
+
+
+class _Parser:
+    """Parser a discesa ricorsiva che produce un predicato sul contesto del messaggio"""
+
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.position = 0
+        self.uses_json = False
+
+    def peek(self):
+        return self.tokens[self.position][0] if self.position < len(self.tokens) else None
+
+    def take(self, kind=None):
+        if self.position >= len(self.tokens):
+            raise ValueError("Espressione incompleta")
+        token = self.tokens[self.position]
+        if kind is not None and token[0] != kind:
+            raise ValueError(f"Atteso {kind}, trovato {token[1] or token[0]!r}")
+        self.position += 1
+        return token
+
+    def parse(self):
+        predicate = self.parse_or()
+        if self.position != len(self.tokens):
+            raise ValueError(f"Token inatteso: {self.tokens[self.position][1] or self.tokens[self.position][0]!r}")
+        return predicate
+
+    def parse_or(self):
+        terms = [self.parse_and()]
+        while self.peek() == "or":
+            self.take()
+            terms.append(self.parse_and())
+        if len(terms) == 1:
+            return terms[0]
+        return lambda message: any(term(message) for term in terms)
+
+    def parse_and(self):
+        terms = [self.parse_not()]
+        while self.peek() == "and":
+            self.take()
+            terms.append(self.parse_not())
+        if len(terms) == 1:
+            return terms[0]
+        return lambda message: all(term(message) for term in terms)
+
+    def parse_not(self):
+        if self.peek() == "not":
+            self.take()
+            inner = self.parse_not()
+            return lambda message: not inner(message)
+        return self.parse_atom()
+
+    def parse_atom(self):
+        if self.peek() == "lparen":
+            self.take()
+            inner = self.parse_or()
+            self.take("rparen")
+            return inner
+
+        field = self.take("word")[1]
+        getter, uses_json = _make_getter(field)
+        self.uses_json = self.uses_json or uses_json
+
+        if self.peek() != "op":
+            return lambda message: getter(message) not in (None, "", False)
+
+        op = self.take("op")[1]
+        kind, expected = self.take()
+        if kind not in ("word", "value"):
+            raise ValueError(f"Valore mancante dopo {op}")
+        return lambda message: _compare(getter(message), op, expected)
+
+
+def compile_message_filter(expression):
+    """
+    Compila un'espressione di filtro.
+
+    Args:
+        expression (str): Espressione (vuota = nessun filtro)
+
+    Returns:
+        callable: Funzione (queue, exchange, routing_key, headers, body) -> bool, o None se vuota
+
+    Raises:
+        ValueError: Se l'espressione non è valida
+    """
+    if not expression or not expression.strip():
+        return None
+
+    parser = _Parser(_tokenize(expression))
+    predicate = parser.parse()
+    uses_json = parser.uses_json
+
+    def evaluate(queue, exchange, routing_key, headers, body):
+        parsed = []
+
+        def load_json():
+            # Il corpo viene interpretato al più una volta per messaggio, e solo se serve
+            if not parsed:
+                try:
+                    parsed.append(loads_json(body))
+                except (ValueError, TypeError):
+                    parsed.append(None)
+            return parsed[0]
+
+        message = {
+            "queue": queue,
+            "exchange": exchange,
+            "routing_key": routing_key,
+            "headers": headers or {},
+            "json": load_json if uses_json else (lambda: None),
+        }
+        try:
+            return bool(predicate(message))
+        except Exception:
+            return False
+
+    return evaluate
+
+
+def set_message_filter(expression):
+    """
+    Imposta il filtro attivo. In caso di errore il filtro precedente resta invariato.
+
+    Args:
+        expression (str): Espressione del filtro (vuota per disattivarlo)
+
+    Raises:
+        ValueError: Se l'espressione non è valida
+    """
+    global _active_expression, _active_filter, _filter_error
+    compiled = compile_message_filter(expression)
+    with _lock:
+        _active_expression = (expression or "").strip()
+        _active_filter = compiled
+        _filter_error = None
+    bump_version('filter')
+
+
+def reset_message_filter(error=None):
+    """
+    Disattiva il filtro, ad esempio quando quello salvato con una connessione non è valido.
+
+    Args:
+        error (str, optional): Motivo, mostrato nell'intestazione finché non si imposta un filtro
+    """
+    global _active_expression, _active_filter, _filter_error
+    with _lock:
+        _active_expression = ""
+        _active_filter = None
+        _filter_error = error
+    bump_version('filter')
+
+
+def get_message_filter_error():
+    """Ritorna l'errore del filtro salvato non applicato, o None"""
+    return _filter_error
+
+
+def get_message_filter_expression():
+    """Ritorna l'espressione del filtro attivo ("" se nessuno)"""
+    return _active_expression
+
+
+def has_message_filter():
+    """Ritorna True se è attivo un filtro sui messaggi"""
+    return _active_filter is not None
+
+
+def message_passes_filter(queue, exchange, routing_key, headers, body):
+    """
+    Valuta il filtro attivo su un messaggio.
+
+    Returns:
+        bool: True se il messaggio va elaborato (sempre True senza filtro)
+    """
+    active_filter = _active_filter
+    if active_filter is None:
+        return True
+    return active_filter(queue, exchange, routing_key, headers, body)
@@ -0,0 +1,173 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Lettura non distruttiva dei primi N messaggi di una coda (es. una DLQ) senza sottoscriverla.
+
+Un consumer di breve durata con prefetch pari ai messaggi attesi riceve l'intero blocco in un
+solo round trip (basic_get richiederebbe un round trip per messaggio con la BlockingConnection);
+dopo l'annullamento del consumer un unico basic_nack(multiple=True, requeue=True) rimette in
+coda tutti i messaggi letti. I messaggi tornano in coda con redelivered=True e, nelle quorum
+queue, con il contatore di consegne incrementato.
+"""
+import time
+from datetime import datetime
+
+from utils.constants import (
+    PEEK_DEFAULT_COUNT,
+    PEEK_MAX_COUNT,
+    PEEK_INACTIVITY_TIMEOUT,
+    SPILL_THRESHOLD,
+    SPILL_PREVIEW_BYTES,
+)
+from utils.logger import log_error
+from utils.spill import spill_body, spill_preview
+from rabbitmq.consumer import delivery_fields
+from rabbitmq.decoders import decode_body
+
+_POLL_INTERVAL = 0.05  # Secondi massimi per ogni process_data_events
+
+
+def peek_messages(rmq_connection, channel, queue_name, count, inactivity_timeout=PEEK_INACTIVITY_TIMEOUT):
+    """
+    Legge fino a count messaggi dalla testa della coda e li rimette in coda.
+    Va chiamata sul thread che possiede la connessione.
+
+    Args:
+        rmq_connection: Connessione pika (BlockingConnection)
+        channel: Canale dedicato alla lettura
+        queue_name (str): Coda da ispezionare
+        count (int): Numero massimo di messaggi
+        inactivity_timeout (float): Secondi senza consegne dopo i quali la lettura si ferma
+
+    Returns:
+        tuple: (lista di (method, properties, body) in ordine di coda, messaggi pronti nella coda)
+    """
+    declared = channel.queue_declare(queue=queue_name, passive=True)
+    available = declared.method.message_count
+    expected = min(count, available)
+    if expected <= 0:
+        return [], available
+
+    deliveries = []
+
+    def on_message(_channel, method, properties, body):
+        deliveries.append((method, properties, body))
+
+    # Il prefetch limita i messaggi non confermati a quelli attesi: il broker non ne invia altri
+    channel.basic_qos(prefetch_count=expected)
+    consumer_tag = channel.basic_consume(queue=queue_name, on_message_callback=on_message, auto_ack=False)
+    try:
+        received = 0
+        last_delivery = time.monotonic()
+        while len(deliveries) < expected:
+            rmq_connection.process_data_events(time_limit=_POLL_INTERVAL)
+            now = time.monotonic()
+            if len(deliveries) > received:
+                received = len(deliveries)
+                last_delivery = now
+            elif now - last_delivery > inactivity_timeout:
+                # Altri consumer possono aver preso parte dei messaggi contati dal declare
+                break
+    finally:
+        channel.basic_cancel(consumer_tag)
+        if deliveries:
+            try:
+                channel.basic_nack(delivery_tag=deliveries[-1][0].delivery_tag, multiple=True, requeue=True)
+            except Exception as e:
+                # Alla chiusura del canale il broker rimette comunque in coda i messaggi non confermati
+                log_error(f"Errore nel nack cumulativo dei messaggi letti da {queue_name}: {e}")
+    return deliveries, available
+
+
+def peek_message(queue_name, method, properties, body):
+    """
+    Converte un messaggio letto in un dizionario come quelli trattenuti dal consumer.
+
+    Args:
+        queue_name (str): Coda di provenienza
+        method: Metodo di consegna
+        properties: Proprietà del messaggio
+        body (bytes): Corpo del messaggio
+
+    Returns:
+        dict: Messaggio con corpo decodificato (anteprima se scaricato su disco)
+    """
+    fields = delivery_fields(method, properties)
+    size = len(body)
+    if size > SPILL_THRESHOLD:
+        raw_body = spill_body(body)
+        body_text = spill_preview(body, fields["content_encoding"], SPILL_PREVIEW_BYTES)
+    else:
+        raw_body = body
+        body_text = decode_body(body, fields["content_type"], fields["content_encoding"])
+    return {
+        "queue": queue_name,
+        "exchange": fields["exchange"],
+        "routing_key": fields["routing_key"],
+        "properties": fields["properties"],
+        "headers": fields["headers"],
+        "body": body_text,
+        "size": size,
+        "timestamp": datetime.now().isoformat(),
+        "raw_body": raw_body,
+        "raw_properties": fields["raw_properties"],
+        "redelivered": method.redelivered,
+    }
+
+
+def peek_queue(connection_config, queue_name, count=PEEK_DEFAULT_COUNT):
+    """
+    Ispeziona una coda su una connessione dedicata, senza toccare il consumer attivo.
+
+    Args:
+        connection_config (dict): Configurazione di connessione
+        queue_name (str): Coda da ispezionare
+        count (int): Numero massimo di messaggi (limitato a PEEK_MAX_COUNT)
+
+    Returns:
+        dict: queue, messages (dal più recente, come i risultati di ricerca), requested,
+              available, connect_time, peek_time, elapsed
+    """
+    import pika  # Importato al primo utilizzo per non rallentare l'avvio
+
+    count = max(1, min(int(count), PEEK_MAX_COUNT))
+    started = time.perf_counter()
+    credentials = pika.PlainCredentials(connection_config['user'], connection_config['password'])
+    parameters = pika.ConnectionParameters(
+        host=connection_config['host'],
+        virtual_host=connection_config['vhost'],
+        credentials=credentials,
+        heartbeat=15,  # Seconds
+        blocked_connection_timeout=30,
+        connection_attempts=1
+    )
+    rmq_connection = pika.BlockingConnection(parameters)
+    try:
+        channel = rmq_connection.channel()
+        connected = time.perf_counter()
+        deliveries, available = peek_messages(rmq_connection, channel, queue_name, count)
+        peeked = time.perf_counter()
+    finally:
+        if rmq_connection.is_open:
+            rmq_connection.close()
+
+    messages = [peek_message(queue_name, method, properties, body) for method, properties, body in deliveries]
+    messages.reverse()
+    return {
+        'queue': queue_name,
+        'messages': messages,
+        'requested': count,
+        'available': available,
+        'connect_time': connected - started,
+        'peek_time': peeked - connected,
+        'elapsed': time.perf_counter() - started,
+    }
+
+
+def format_peek_stats(stats):
+    """Riepilogo testuale di un peek"""
+    return (
+        f"Peek di {stats['queue']}: {len(stats['messages'])}/{stats['requested']} messaggi letti "
+        f"({stats['available']} in coda) in {stats['peek_time'] * 1000:.0f} ms "
+        f"(connessione {stats['connect_time'] * 1000:.0f} ms), rimessi in coda"
+    )
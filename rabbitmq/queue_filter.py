@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Selezione delle code da consumare tramite pattern di inclusione/esclusione.
+I pattern sono glob (es. "orders.*") oppure regex con prefisso "re:" (es. "re:rpc\\."),
+ancorate all'inizio del nome della coda.
+"""
+import fnmatch
+import re
+
+
+def _pattern_to_regex(pattern):
+    if pattern.startswith("re:"):
+        return f"(?:{pattern[3:]})"
+    return f"(?:{fnmatch.translate(pattern)})"
+
+
+def compile_patterns(patterns):
+    """
+    Compila una lista di pattern in un'unica regex alternativa.
+
+    Args:
+        patterns (list|str): Pattern glob o "re:" (stringa separata da virgole o lista)
+
+    Returns:
+        re.Pattern: Regex compilata, o None se la lista è vuota
+    """
+    if isinstance(patterns, str):
+        patterns = [p.strip() for p in patterns.split(",")]
+    patterns = [p for p in (patterns or []) if p]
+    if not patterns:
+        return None
+    return re.compile("|".join(_pattern_to_regex(p) for p in patterns))
+
+
+def compile_queue_filter(include=None, exclude=None, types=None, arguments=None):
+    """
+    Compila i filtri di selezione in un unico predicato.
+
+    Args:
+        include (list|str, optional): Pattern delle code da includere (tutte se vuoto)
+        exclude (list|str, optional): Pattern delle code da escludere
+        types (list, optional): Tipi di coda ammessi (classic, quorum, stream)
+        arguments (dict, optional): Argomenti richiesti; valore None = solo presenza
+
+    Returns:
+        callable: Funzione queue (dict dell'API) -> bool
+    """
+    include_re = compile_patterns(include)
+    exclude_re = compile_patterns(exclude)
+    allowed_types = frozenset(types) if types else None
+    required_arguments = dict(arguments) if arguments else None
+
+    def matches(queue):
+        name = queue.get("name", "")
+        if include_re is not None and not include_re.match(name):
+            return False
+        if exclude_re is not None and exclude_re.match(name):
+            return False
+        if allowed_types is not None and queue.get("type", "classic") not in allowed_types:
+            return False
+        if required_arguments is not None:
+            queue_arguments = queue.get("arguments") or {}
+            for key, value in required_arguments.items():
+                if key not in queue_arguments:
+                    return False
+                if value is not None and queue_arguments[key] != value:
+                    return False
+        return True
+
+    return matches
+
+
+def get_queue_filter(connection_config):
+    """
+    Ritorna il filtro compilato per la connessione, compilandolo solo la prima volta.
+
+    Args:
+        connection_config (dict): Configurazione di connessione
+
+    Returns:
+        callable: Predicato sulle code
+    """
+    queue_filter = connection_config.get('queue_filter')
+    if queue_filter is None:
+        queue_filter = compile_queue_filter(
+            include=connection_config.get('include_queues'),
+            exclude=connection_config.get('exclude_queues'),
+            types=connection_config.get('include_types'),
+            arguments=connection_config.get('require_arguments'),
+        )
+        connection_config['queue_filter'] = queue_filter
+    return queue_filter
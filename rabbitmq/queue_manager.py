@@ -6,6 +6,7 @@ Gestione delle code RabbitMQ utilizzando l'API Management
 from rich.panel import Panel
 from rich.console import Console
 from utils.logger import log_message, log_error
+from utils.state import bump_version
 
 # Import the API client functions
 from rabbitmq.api_client import get_queues_from_api, filter_consumable_queues
@@ -27,10 +28,12 @@ def get_queues(config):
         queues_data = config['queues_data']
     else:
         # Get fresh data from API
-        queues_data = get_queues_from_api(config)
+        # Chiamata durante il rendering: un pannello di errore si sovrapporrebbe all'interfaccia Live
+        queues_data = get_queues_from_api(config, quiet=True)
         if queues_data:
             config['queues_data'] = queues_data
             config['api_connected'] = True
+            bump_version('queues')
     
     # Format data for display
     formatted_queues = []
@@ -0,0 +1,225 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Ripubblicazione dei messaggi catturati a ritmo controllato, con publisher confirms in pipeline.
+Usa una SelectConnection dedicata: la BlockingConnection attende ogni conferma singolarmente.
+"""
+import time
+
+from utils.constants import REPLAY_MAX_IN_FLIGHT, REPLAY_CONFIRM_TIMEOUT
+from utils.logger import log_error
+from utils.spill import body_bytes
+
+# Proprietà AMQP conservate nella cattura e ripristinate alla ripubblicazione
+PROPERTY_NAMES = (
+    "content_type", "content_encoding", "headers", "delivery_mode", "priority",
+    "correlation_id", "reply_to", "expiration", "message_id", "timestamp",
+    "type", "user_id", "app_id", "cluster_id",
+)
+
+
+def properties_to_dict(properties, traced=False):
+    """
+    Estrae le proprietà AMQP di un messaggio in un dizionario serializzabile.
+
+    Args:
+        properties: Proprietà pika del messaggio
+        traced (bool): True se il messaggio proviene dal firehose (proprietà originali negli header)
+
+    Returns:
+        dict: Nome proprietà -> valore (solo quelle valorizzate)
+    """
+    if traced:
+        headers = getattr(properties, 'headers', None) or {}
+        source = headers.get('properties') or {}
+        values = {name: source.get(name) for name in PROPERTY_NAMES}
+    else:
+        values = {name: getattr(properties, name, None) for name in PROPERTY_NAMES}
+    return {name: value for name, value in values.items() if value is not None}
+
+
+def _replay_target(message, exchange, routing_key):
+    if exchange is None:
+        exchange = message.get("exchange") or ""
+        if exchange == "default":
+            exchange = ""
+    if routing_key is None:
+        routing_key = message.get("routing_key") or ""
+    return exchange, routing_key
+
+
+class _ReplayPublisher:
+    """Macchina a stati sull'I/O loop di pika: pubblica, limita il ritmo e conta le conferme"""
+
+    def __init__(self, pika, parameters, messages, exchange, routing_key, rate, max_in_flight):
+        self.pika = pika
+        self.parameters = parameters
+        self.messages = iter(messages)
+        self.exchange = exchange
+        self.routing_key = routing_key
+        self.rate = rate
+        self.max_in_flight = max(1, max_in_flight)
+
+        self.connection = None
+        self.channel = None
+        self.error = None
+        self.exhausted = False
+        self.timer_pending = False
+        self.pending = set()
+        self.next_tag = 0
+        self.started = None
+        self.finished = None
+        self.stats = {'published': 0, 'acked': 0, 'nacked': 0, 'returned': 0, 'skipped': 0}
+
+    def run(self):
+        self.connection = self.pika.SelectConnection(
+            self.parameters,
+            on_open_callback=self.on_connection_open,
+            on_open_error_callback=self.on_connection_error,
+            on_close_callback=self.on_connection_closed,
+        )
+        self.connection.ioloop.start()
+        if self.error is not None:
+            raise RuntimeError(self.error)
+        return self.stats
+
+    def on_connection_open(self, connection):
+        connection.channel(on_open_callback=self.on_channel_open)
+
+    def on_connection_error(self, connection, error):
+        self.error = f"Connessione fallita: {error}"
+        connection.ioloop.stop()
+
+    def on_connection_closed(self, connection, reason):
+        if self.finished is None:
+            self.finished = time.monotonic()
+            self.error = self.error or f"Connessione chiusa durante il replay: {reason}"
+        connection.ioloop.stop()
+
+    def on_channel_open(self, channel):
+        self.channel = channel
+        channel.add_on_close_callback(self.on_channel_closed)
+        channel.add_on_return_callback(self.on_return)
+        channel.confirm_delivery(self.on_confirm)
+        self.started = time.monotonic()
+        self.publish_more()
+
+    def on_channel_closed(self, channel, reason):
+        # Ad esempio exchange inesistente (404): il replay non può proseguire
+        if self.finished is None:
+            self.error = f"Canale chiuso durante il replay: {reason}"
+            self.finished = time.monotonic()
+            self.connection.close()
+
+    def on_return(self, channel, method, properties, body):
+        # Messaggio pubblicato con mandatory=True ma non instradato verso nessuna coda
+        self.stats['returned'] += 1
+
+    def on_confirm(self, frame):
+        method = frame.method
+        if method.multiple:
+            confirmed = [tag for tag in self.pending if tag <= method.delivery_tag]
+        else:
+            confirmed = [method.delivery_tag] if method.delivery_tag in self.pending else []
+        self.pending.difference_update(confirmed)
+        key = 'acked' if isinstance(method, self.pika.spec.Basic.Ack) else 'nacked'
+        self.stats[key] += len(confirmed)
+        self.publish_more()
+
+    def on_timer(self):
+        self.timer_pending = False
+        self.publish_more()
+
+    def publish_more(self):
+        while not self.exhausted and len(self.pending) < self.max_in_flight:
+            if self.rate:
+                # Ritmo obiettivo: il messaggio n parte a started + n / rate
+                due = self.started + self.stats['published'] / self.rate
+                delay = due - time.monotonic()
+                if delay > 0:
+                    if not self.timer_pending:
+                        self.timer_pending = True
+                        self.connection.ioloop.call_later(delay, self.on_timer)
+                    return
+
+            message = next(self.messages, None)
+            if message is None:
+                self.exhausted = True
+                break
+            if message.get("raw_body") is None:
+                # Messaggi senza corpo originale (es. letti dal log testuale) non sono ripubblicabili
+                self.stats['skipped'] += 1
+                continue
+
+            exchange, routing_key = _replay_target(message, self.exchange, self.routing_key)
+            properties = self.pika.BasicProperties(**(message.get("raw_properties") or {}))
+            body = body_bytes(message["raw_body"])
+            self.channel.basic_publish(exchange, routing_key, body, properties, mandatory=True)
+            self.next_tag += 1
+            self.pending.add(self.next_tag)
+            self.stats['published'] += 1
+
+        if self.exhausted:
+            if not self.pending:
+                self.finish()
+            elif not self.timer_pending:
+                self.timer_pending = True
+                self.connection.ioloop.call_later(REPLAY_CONFIRM_TIMEOUT, self.on_confirm_timeout)
+
+    def on_confirm_timeout(self):
+        self.timer_pending = False
+        if self.finished is None:
+            log_error(f"Replay: {len(self.pending)} conferme non ricevute entro {REPLAY_CONFIRM_TIMEOUT}s")
+            self.finish()
+
+    def finish(self):
+        if self.finished is not None:
+            return
+        self.finished = time.monotonic()
+        self.connection.close()
+
+
+def replay_messages(connection_config, messages, exchange=None, routing_key=None, rate=0,
+                    max_in_flight=REPLAY_MAX_IN_FLIGHT):
+    """
+    Ripubblica i messaggi preservandone le proprietà, con ritmo obiettivo e conferme del broker.
+
+    Args:
+        connection_config (dict): Configurazione di connessione (host, vhost, user, password)
+        messages (iterable): Messaggi con 'raw_body' e 'raw_properties' (memoria o file di cattura)
+        exchange (str, optional): Exchange di destinazione (default: quello originale)
+        routing_key (str, optional): Routing key di destinazione (default: quella originale)
+        rate (float): Messaggi al secondo (0 = il più veloce possibile)
+        max_in_flight (int): Pubblicazioni non ancora confermate ammesse
+
+    Returns:
+        dict: {'published', 'acked', 'nacked', 'returned', 'skipped', 'unconfirmed', 'elapsed', 'throughput'}
+
+    Raises:
+        RuntimeError: Se la connessione fallisce o si chiude durante il replay
+    """
+    import pika  # Importato al primo utilizzo per non rallentare l'avvio
+
+    credentials = pika.PlainCredentials(connection_config['user'], connection_config['password'])
+    parameters = pika.ConnectionParameters(
+        host=connection_config['host'],
+        virtual_host=connection_config['vhost'],
+        credentials=credentials,
+        heartbeat=15,
+    )
+    publisher = _ReplayPublisher(pika, parameters, messages, exchange, routing_key, rate, max_in_flight)
+    stats = publisher.run()
+
+    elapsed = (publisher.finished or time.monotonic()) - (publisher.started or time.monotonic())
+    stats['unconfirmed'] = len(publisher.pending)
+    stats['elapsed'] = elapsed
+    stats['throughput'] = stats['acked'] / elapsed if elapsed > 0 else 0.0
+    return stats
+
+
+def format_replay_stats(stats):
+    """Riepilogo leggibile di un replay"""
+    return (f"Replay: {stats['published']} pubblicati, {stats['acked']} confermati, "
+            f"{stats['nacked']} nack, {stats['returned']} non instradati, "
+            f"{stats['unconfirmed']} senza conferma, {stats['skipped']} saltati "
+            f"in {stats['elapsed']:.2f}s ({stats['throughput']:.0f} msg/s)")
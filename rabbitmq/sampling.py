@@ -0,0 +1,286 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Campionamento adattivo dei messaggi ricevuti (load shedding).
+I contatori dei messaggi visti restano esatti anche quando solo una parte viene elaborata.
+"""
+import math
+import random
+import threading
+import time
+
+from utils.constants import (
+    SAMPLING_MODE_ALL,
+    SAMPLING_MODE_NTH,
+    SAMPLING_MODE_RESERVOIR,
+    DEFAULT_SAMPLING_MODE,
+    DEFAULT_SAMPLING_RATE,
+    DEFAULT_SAMPLING_WINDOW,
+    SAMPLING_TARGET_UTILIZATION,
+    SAMPLING_MAX_RATE,
+    SAMPLING_DECODE_BACKLOG_HIGH,
+    SIZE_HISTOGRAM_BUCKETS,
+    DECODE_MAX_IN_FLIGHT,
+)
+from utils.state import bump_version
+from rabbitmq.decoders import get_decode_backlog
+
+_lock = threading.Lock()
+_random = random.Random()
+
+# Configurazione corrente
+_mode = DEFAULT_SAMPLING_MODE
+_base_rate = DEFAULT_SAMPLING_RATE
+_window = DEFAULT_SAMPLING_WINDOW
+_adaptive = True
+
+# Stato del campionamento
+_current_rate = DEFAULT_SAMPLING_RATE
+_window_start = time.monotonic()
+_window_arrivals = 0
+_avg_process_time = 0.0
+_reservoir = []
+_reservoir_seen = 0
+_stats = {}
+
+
+def configure_sampling(connection_config):
+    """
+    Configura il campionamento a partire dalla configurazione di connessione.
+
+    Args:
+        connection_config (dict): Configurazione di connessione (chiavi sampling_*)
+    """
+    global _mode, _base_rate, _window, _adaptive, _current_rate
+    mode = connection_config.get('sampling_mode', DEFAULT_SAMPLING_MODE)
+    if mode not in (SAMPLING_MODE_ALL, SAMPLING_MODE_NTH, SAMPLING_MODE_RESERVOIR):
+        mode = DEFAULT_SAMPLING_MODE
+
+    with _lock:
+        _mode = mode
+        _base_rate = max(1, int(connection_config.get('sampling_rate', DEFAULT_SAMPLING_RATE)))
+        _window = max(0.1, float(connection_config.get('sampling_window', DEFAULT_SAMPLING_WINDOW)))
+        _adaptive = bool(connection_config.get('sampling_adaptive', True))
+        _current_rate = _base_rate
+    reset_sampling_stats()
+
+
+def reset_sampling_stats():
+    """Azzera i contatori e lo stato della finestra corrente"""
+    global _window_start, _window_arrivals, _reservoir, _reservoir_seen, _stats
+    with _lock:
+        _window_start = time.monotonic()
+        _window_arrivals = 0
+        _reservoir = []
+        _reservoir_seen = 0
+        _stats = {}
+    bump_version('sampling')
+
+
+def _queue_stats(queue_name):
+    stats = _stats.get(queue_name)
+    if stats is None:
+        # 'sampled' conta solo le consegne arrivate al campionamento (non quelle scartate dal filtro)
+        stats = {'seen': 0, 'sampled': 0, 'kept': 0, 'filtered': 0, 'seen_bytes': 0, 'kept_bytes': 0,
+                 'max_size': 0, 'size_histogram': [0] * SIZE_HISTOGRAM_BUCKETS}
+        _stats[queue_name] = stats
+    return stats
+
+
+def _mark_seen(stats, size):
+    stats['seen'] += 1
+    stats['seen_bytes'] += size
+    # Istogramma logaritmico: il bucket i conta le dimensioni in [2**(i-1), 2**i)
+    stats['size_histogram'][min(size.bit_length(), SIZE_HISTOGRAM_BUCKETS - 1)] += 1
+    if size > stats['max_size']:
+        stats['max_size'] = size
+
+
+def histogram_percentile(histogram, fraction):
+    """
+    Stima un percentile da un istogramma logaritmico delle dimensioni.
+
+    Args:
+        histogram (list): Conteggi per bucket (vedi SIZE_HISTOGRAM_BUCKETS)
+        fraction (float): Percentile in [0, 1]
+
+    Returns:
+        int: Limite superiore del bucket che contiene il percentile (0 se vuoto)
+    """
+    total = sum(histogram)
+    if not total:
+        return 0
+    rank = max(1, math.ceil(fraction * total))
+    cumulative = 0
+    for index, count in enumerate(histogram):
+        cumulative += count
+        if cumulative >= rank:
+            return (1 << index) - 1 if index else 0
+    return (1 << (len(histogram) - 1)) - 1
+
+
+def _mark_kept(queue_name, size):
+    stats = _queue_stats(queue_name)
+    stats['kept'] += 1
+    stats['kept_bytes'] += size
+
+
+def _adapt_rate(elapsed):
+    """Ricalcola N in base al ritmo di arrivo, al costo medio di elaborazione e alle decodifiche in sospeso"""
+    global _current_rate
+    if not _adaptive or _avg_process_time <= 0 or elapsed <= 0:
+        _current_rate = _base_rate
+        return
+
+    # Numero di messaggi al secondo elaborabili restando sotto l'utilizzo obiettivo
+    budget = SAMPLING_TARGET_UTILIZATION / _avg_process_time
+    arrivals_per_second = _window_arrivals / elapsed
+    # Il tempo di elaborazione non comprende le decodifiche sul pool: se il pool resta indietro
+    # si dimezzano i messaggi tenuti a ogni finestra, e finché non si svuota non si torna indietro
+    backlog = get_decode_backlog()
+    falling_behind = backlog >= SAMPLING_DECODE_BACKLOG_HIGH * DECODE_MAX_IN_FLIGHT
+
+    if _mode == SAMPLING_MODE_RESERVOIR:
+        size = int(budget * _window)
+        if falling_behind:
+            size = min(size, _current_rate // 2)
+        elif backlog:
+            size = min(size, _current_rate)
+        _current_rate = max(1, min(_base_rate, size))
+    else:
+        rate = math.ceil(arrivals_per_second / budget)
+        if falling_behind:
+            rate = max(rate, _current_rate * 2)
+        elif backlog:
+            rate = max(rate, _current_rate)
+        _current_rate = max(_base_rate, min(SAMPLING_MAX_RATE, rate))
+
+
+def _roll_window(now):
+    """Chiude la finestra corrente se scaduta. Ritorna il contenuto del reservoir."""
+    global _window_start, _window_arrivals, _reservoir, _reservoir_seen
+    elapsed = now - _window_start
+    if elapsed < _window:
+        return []
+
+    released = _reservoir
+    for queue_name, size, _ in released:
+        _mark_kept(queue_name, size)
+
+    _adapt_rate(elapsed)
+    _window_start = now
+    _window_arrivals = 0
+    _reservoir = []
+    _reservoir_seen = 0
+    return [delivery for _, _, delivery in released]
+
+
+def sample_delivery(queue_name, size, delivery):
+    """
+    Registra una consegna e decide se elaborarla.
+
+    Args:
+        queue_name (str): Nome della coda di provenienza
+        size (int): Dimensione del corpo in byte
+        delivery: Dati opachi della consegna, restituiti se da elaborare
+
+    Returns:
+        list: Consegne da elaborare ora (vuota se scartata o trattenuta nel reservoir)
+    """
+    global _reservoir_seen, _window_arrivals
+    now = time.monotonic()
+    with _lock:
+        stats = _queue_stats(queue_name)
+        _mark_seen(stats, size)
+
+        released = _roll_window(now)
+        _window_arrivals += 1
+
+        if _mode == SAMPLING_MODE_ALL:
+            _mark_kept(queue_name, size)
+            released.append(delivery)
+        elif _mode == SAMPLING_MODE_RESERVOIR:
+            # Algorithm R: ogni consegna della finestra ha la stessa probabilità di essere tenuta
+            _reservoir_seen += 1
+            if len(_reservoir) < _current_rate:
+                _reservoir.append((queue_name, size, delivery))
+            else:
+                slot = _random.randrange(_reservoir_seen)
+                if slot < _current_rate:
+                    _reservoir[slot] = (queue_name, size, delivery)
+        else:
+            # Contatore per coda: le code a basso traffico non vengono mai oscurate
+            stats['sampled'] += 1
+            if (stats['sampled'] - 1) % _current_rate == 0:
+                _mark_kept(queue_name, size)
+                released.append(delivery)
+
+    bump_version('sampling')
+    return released
+
+
+def record_filtered(queue_name, size):
+    """
+    Conta una consegna scartata dal filtro sui messaggi.
+
+    Args:
+        queue_name (str): Nome della coda di provenienza
+        size (int): Dimensione del corpo in byte
+    """
+    with _lock:
+        stats = _queue_stats(queue_name)
+        _mark_seen(stats, size)
+        stats['filtered'] += 1
+    bump_version('sampling')
+
+
+def flush_expired_window():
+    """
+    Rilascia il reservoir se la finestra corrente è scaduta.
+    Da chiamare periodicamente quando il traffico si interrompe.
+
+    Returns:
+        list: Consegne da elaborare
+    """
+    with _lock:
+        return _roll_window(time.monotonic())
+
+
+def record_processing_time(seconds):
+    """
+    Aggiorna la media mobile del tempo di elaborazione di un messaggio tenuto.
+
+    Args:
+        seconds (float): Durata dell'elaborazione
+    """
+    global _avg_process_time
+    with _lock:
+        if _avg_process_time <= 0:
+            _avg_process_time = seconds
+        else:
+            _avg_process_time = 0.9 * _avg_process_time + 0.1 * seconds
+
+
+def get_sampling_rate():
+    """Ritorna N corrente (o la dimensione del reservoir)"""
+    return _current_rate
+
+
+def get_sampling_mode():
+    """Ritorna la modalità di campionamento corrente"""
+    return _mode
+
+
+def get_sampling_stats():
+    """
+    Ritorna una copia dei contatori per coda.
+
+    Returns:
+        dict: Nome coda -> {'seen', 'sampled', 'kept', 'filtered', 'seen_bytes', 'kept_bytes', 'max_size',
+              'size_histogram'}
+    """
+    with _lock:
+        return {
+            queue_name: dict(stats, size_histogram=list(stats['size_histogram']))
+            for queue_name, stats in _stats.items()
+        }
@@ -0,0 +1,206 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Modalità "tap": osservazione non distruttiva del traffico tramite code specchio
+esclusive o tramite il firehose tracer di RabbitMQ
+"""
+from datetime import datetime
+
+from utils.constants import TAP_MAX_LENGTH, TAP_OVERFLOW
+from utils.logger import log_message, log_error
+from rabbitmq.api_client import get_vhost_bindings
+
+FIREHOSE_EXCHANGE = "amq.rabbitmq.trace"
+FIREHOSE_LABEL = "firehose"
+
+
+def mirror_queue_arguments(connection_config):
+    """
+    Costruisce gli argomenti di dichiarazione di una coda specchio.
+
+    Args:
+        connection_config (dict): Configurazione di connessione
+
+    Returns:
+        dict: Argomenti x-max-length/x-overflow per la coda specchio
+    """
+    return {
+        'x-max-length': int(connection_config.get('tap_max_length', TAP_MAX_LENGTH)),
+        'x-overflow': TAP_OVERFLOW,
+    }
+
+
+def group_bindings_by_queue(bindings, queue_names):
+    """
+    Raggruppa i binding del vhost per coda di destinazione.
+    I binding sul default exchange vengono scartati perché non replicabili.
+
+    Args:
+        bindings (list): Binding restituiti dall'API Management
+        queue_names (list): Code di interesse
+
+    Returns:
+        dict: Nome coda -> lista di binding replicabili
+    """
+    wanted = set(queue_names)
+    grouped = {name: [] for name in queue_names}
+    for binding in bindings:
+        if binding.get('destination_type') != 'queue':
+            continue
+        destination = binding.get('destination')
+        if destination not in wanted or not binding.get('source'):
+            continue
+        grouped[destination].append(binding)
+    return grouped
+
+
+def setup_tap_queues(channel, queue_names, connection_config):
+    """
+    Dichiara una coda specchio esclusiva e auto-delete per ogni coda di interesse
+    e la collega con gli stessi binding della coda originale.
+
+    Args:
+        channel: Canale RabbitMQ
+        queue_names (list): Nomi delle code da osservare
+        connection_config (dict): Configurazione di connessione
+
+    Returns:
+        list: Lista di tuple (coda specchio, nome coda originale)
+    """
+    # La topologia resta in cache sulla connessione per le riconnessioni
+    if connection_config.get('bindings_data') is None:
+        bindings_data = get_vhost_bindings(connection_config)
+        if bindings_data is None:
+            # Errore dell'API, non assenza di binding: le code non vanno ignorate e verranno
+            # riprovate dalla scoperta o alla prossima riconnessione
+            log_error(f"Tap: binding non disponibili, {len(queue_names)} code non osservate")
+            return []
+        connection_config['bindings_data'] = bindings_data
+    bindings = group_bindings_by_queue(connection_config['bindings_data'], queue_names)
+    arguments = mirror_queue_arguments(connection_config)
+    subscriptions = []
+    # Code senza binding replicabili: la scoperta non deve riproporle a ogni snapshot
+    ignored = connection_config.setdefault('tap_ignored', set())
+
+    for queue_name in queue_names:
+        queue_bindings = bindings.get(queue_name, [])
+        if not queue_bindings:
+            ignored.add(queue_name)
+            log_message({
+                'queue': 'system',
+                'body': f"Tap: nessun binding replicabile per {queue_name}, coda ignorata",
+                'timestamp': datetime.now().isoformat()
+            })
+            continue
+
+        try:
+            result = channel.queue_declare(
+                queue='',
+                exclusive=True,
+                auto_delete=True,
+                arguments=arguments
+            )
+            mirror_queue = result.method.queue
+
+            for binding in queue_bindings:
+                channel.queue_bind(
+                    queue=mirror_queue,
+                    exchange=binding['source'],
+                    routing_key=binding.get('routing_key', ''),
+                    arguments=binding.get('arguments') or None
+                )
+
+            subscriptions.append((mirror_queue, queue_name))
+        except Exception as tap_err:
+            log_error(f"Errore nella creazione della coda specchio per {queue_name}: {tap_err}")
+
+    log_message({
+        'queue': 'system',
+        'body': f"Tap: create {len(subscriptions)} code specchio su {len(queue_names)} code",
+        'timestamp': datetime.now().isoformat()
+    })
+
+    return subscriptions
+
+
+def setup_firehose_queue(channel, connection_config):
+    """
+    Dichiara una coda esclusiva collegata al firehose tracer.
+    Il tracer deve essere abilitato sul broker (rabbitmqctl trace_on).
+
+    Args:
+        channel: Canale RabbitMQ
+        connection_config (dict): Configurazione di connessione
+
+    Returns:
+        list: Lista con l'unica tupla (coda firehose, etichetta)
+    """
+    result = channel.queue_declare(
+        queue='',
+        exclusive=True,
+        auto_delete=True,
+        arguments=mirror_queue_arguments(connection_config)
+    )
+    firehose_queue = result.method.queue
+
+    # Solo gli eventi "publish" per non duplicare ogni messaggio con "deliver"
+    channel.queue_bind(queue=firehose_queue, exchange=FIREHOSE_EXCHANGE, routing_key='publish.#')
+
+    log_message({
+        'queue': 'system',
+        'body': f"Firehose: coda {firehose_queue} collegata a {FIREHOSE_EXCHANGE}",
+        'timestamp': datetime.now().isoformat()
+    })
+
+    return [(firehose_queue, FIREHOSE_LABEL)]
+
+
+def unwrap_trace_message(method, properties):
+    """
+    Estrae exchange e routing key originali da un messaggio del firehose.
+
+    Args:
+        method: Metodo di consegna
+        properties: Proprietà del messaggio
+
+    Returns:
+        tuple: (exchange, routing_key) originali
+    """
+    headers = getattr(properties, 'headers', None) or {}
+    exchange = headers.get('exchange_name') or "default"
+    routing_keys = headers.get('routing_keys') or []
+    if routing_keys:
+        routing_key = ", ".join(str(key) for key in routing_keys)
+    else:
+        routing_key = method.routing_key
+    return exchange, routing_key
+
+
+def unwrap_trace_headers(properties):
+    """
+    Estrae gli header del messaggio originale da un messaggio del firehose.
+
+    Args:
+        properties: Proprietà del messaggio del firehose
+
+    Returns:
+        dict: Header del messaggio pubblicato
+    """
+    headers = getattr(properties, 'headers', None) or {}
+    original_properties = headers.get('properties') or {}
+    return original_properties.get('headers') or {}
+
+
+def unwrap_trace_content(properties):
+    """
+    Estrae content_type e content_encoding del messaggio originale da un messaggio del firehose.
+
+    Args:
+        properties: Proprietà del messaggio del firehose
+
+    Returns:
+        tuple: (content_type, content_encoding)
+    """
+    headers = getattr(properties, 'headers', None) or {}
+    original_properties = headers.get('properties') or {}
+    return original_properties.get('content_type'), original_properties.get('content_encoding')
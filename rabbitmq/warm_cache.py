@@ -0,0 +1,238 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Cache LRU di connessioni "calde": quando si passa a un altro broker la connessione AMQP
+precedente non viene chiusa ma messa in pausa (consumer annullati), insieme alla topologia
+e alle statistiche già scaricate. Tornando su quel broker basta risottoscrivere le code.
+
+Ogni connessione in cache ha un thread che ne serve l'I/O loop (heartbeat) e che la chiude
+quando resta inutilizzata oltre WARM_IDLE_TIMEOUT o viene scartata dalla LRU: la connessione
+pika viene così usata sempre da un solo thread alla volta.
+"""
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+from utils.constants import (
+    WARM_CONNECTIONS_MAX,
+    WARM_IDLE_TIMEOUT,
+    WARM_KEEPALIVE_INTERVAL,
+    WARM_PARK_TIMEOUT,
+)
+from utils.state import get_active_connection, bump_version
+from utils.logger import log_message, log_error
+from config.connections import persisted_view
+
+_lock = threading.Lock()
+_warm = OrderedDict()  # id connessione -> dizionario di runtime, dal meno al più recente
+
+
+def _settings(connection):
+    # last_used cambia a ogni utilizzo e non invalida la connessione in cache
+    settings = persisted_view(connection)
+    settings.pop('last_used', None)
+    return settings
+
+
+def is_parkable(connection):
+    """Verifica se la connessione può essere tenuta calda (una sola connessione pika, sana)"""
+    rmq_connection = connection.get('rmq_connection')
+    return (
+        rmq_connection is not None
+        and rmq_connection.is_open
+        and not connection.get('node_consumers')
+        and not connection.get('ingest_worker')
+        and not connection.get('reconnecting')
+        and not connection.get('connection_lost')
+    )
+
+
+def park_connection(connection):
+    """
+    Ferma il consumo della connessione e la mette in cache.
+    Va chiamata dal thread che cambia connessione, non dal thread consumer.
+
+    Args:
+        connection (dict): Connessione di runtime da mettere in pausa
+
+    Returns:
+        bool: True se la connessione è in cache, False se va chiusa dal chiamante
+    """
+    if not is_parkable(connection):
+        return False
+    from rabbitmq.consumer import unsubscribe_queues  # Import ritardato per evitare import circolari
+
+    rmq_connection = connection['rmq_connection']
+    channel = connection['channel']
+    consumer_thread = connection.get('consumer_thread')
+    # Il consumer che si ferma non deve avviare la riconnessione automatica
+    connection['parked_at'] = time.monotonic()
+
+    def stop_consuming():
+        try:
+            unsubscribe_queues(channel, list(connection.get('subscriptions', {})), connection)
+            temp_queue = connection.pop('temp_queue', None)
+            if temp_queue:
+                # La coda temporanea non è auto-delete: in pausa accumulerebbe tutto il traffico
+                channel.queue_delete(queue=temp_queue)
+        except Exception as e:
+            log_error(f"Errore nella sospensione dei consumer: {e}")
+        finally:
+            channel.stop_consuming()
+
+    try:
+        rmq_connection.add_callback_threadsafe(stop_consuming)
+    except Exception as e:
+        log_error(f"Impossibile sospendere la connessione a {connection['host']}: {e}")
+        connection.pop('parked_at', None)
+        return False
+
+    if consumer_thread is not None:
+        consumer_thread.join(WARM_PARK_TIMEOUT)
+        if consumer_thread.is_alive():
+            connection.pop('parked_at', None)
+            return False
+
+    store_warm_connection(connection)
+    return True
+
+
+def store_warm_connection(connection):
+    """
+    Inserisce in cache una connessione aperta e senza consumer attivi, avviandone il keep-alive.
+    Le connessioni oltre WARM_CONNECTIONS_MAX vengono chiuse partendo dalla meno recente.
+
+    Args:
+        connection (dict): Connessione di runtime con 'rmq_connection' e 'channel'
+    """
+    key = connection.get('id')
+    active_connection = get_active_connection()
+    connection.setdefault('parked_at', time.monotonic())
+    stop_event = threading.Event()
+    connection['warm_stop'] = stop_event
+
+    with _lock:
+        duplicate = key in _warm or (
+            active_connection is not None
+            and active_connection is not connection
+            and active_connection.get('id') == key
+        )
+        if not duplicate:
+            _warm[key] = connection
+            evicted = []
+            while len(_warm) > WARM_CONNECTIONS_MAX:
+                evicted.append(_warm.popitem(last=False)[1])
+
+    if duplicate:
+        # Es. prefetch concluso dopo che l'utente si è già connesso a quel broker
+        connection['warm_evicted'] = True
+        _close(connection)
+        return
+
+    for old in evicted:
+        _evict(old)
+
+    thread = threading.Thread(target=_keep_alive, args=(connection, stop_event), daemon=True)
+    connection['warm_thread'] = thread
+    thread.start()
+    bump_version('warm')
+
+
+def _keep_alive(connection, stop_event):
+    rmq_connection = connection['rmq_connection']
+    try:
+        while not stop_event.is_set() and rmq_connection.is_open:
+            if time.monotonic() - connection['parked_at'] > WARM_IDLE_TIMEOUT:
+                with _lock:
+                    if _warm.get(connection.get('id')) is connection:
+                        del _warm[connection.get('id')]
+                connection['warm_evicted'] = True
+                bump_version('warm')
+                break
+            rmq_connection.process_data_events(time_limit=WARM_KEEPALIVE_INTERVAL)
+    except Exception as e:
+        log_error(f"Connessione in cache a {connection['host']} persa: {e}")
+        connection['warm_evicted'] = True
+    if connection.get('warm_evicted'):
+        _close(connection)
+
+
+def _stop_keep_alive(connection):
+    connection['warm_stop'].set()
+    try:
+        # Una callback vuota fa tornare subito process_data_events
+        connection['rmq_connection'].add_callback_threadsafe(lambda: None)
+    except Exception:
+        pass
+
+
+def _evict(connection):
+    # La chiusura avviene sul thread di keep-alive, l'unico che usa la connessione
+    connection['warm_evicted'] = True
+    _stop_keep_alive(connection)
+
+
+def _close(connection):
+    rmq_connection = connection.get('rmq_connection')
+    try:
+        if rmq_connection is not None and rmq_connection.is_open:
+            rmq_connection.close()
+            log_message({
+                'queue': 'system',
+                'body': f"Connessione in cache a {connection['host']}/{connection['vhost']} chiusa",
+                'timestamp': datetime.now().isoformat()
+            })
+    except Exception as e:
+        log_error(f"Errore nella chiusura della connessione in cache: {e}")
+
+
+def take_warm_connection(connection):
+    """
+    Estrae dalla cache la connessione calda per le impostazioni indicate.
+
+    Args:
+        connection (dict): Impostazioni salvate della connessione
+
+    Returns:
+        dict: Connessione di runtime pronta per setup_consumer, o None se non disponibile
+    """
+    with _lock:
+        warm = _warm.pop(connection.get('id'), None)
+    if warm is None:
+        return None
+    bump_version('warm')
+
+    _stop_keep_alive(warm)
+    warm['warm_thread'].join(2 * WARM_KEEPALIVE_INTERVAL + 1)
+    if warm['warm_thread'].is_alive() or not warm['rmq_connection'].is_open \
+            or _settings(warm) != _settings(connection):
+        # Connessione persa, thread bloccato o impostazioni modificate nel frattempo
+        if not warm['warm_thread'].is_alive():
+            _close(warm)
+        else:
+            warm['warm_evicted'] = True
+        return None
+
+    for key in ('parked_at', 'warm_stop', 'warm_thread', 'warm_evicted'):
+        warm.pop(key, None)
+    warm['last_used'] = connection.get('last_used')
+    return warm
+
+
+def get_warm_connection_ids():
+    """Ritorna gli id delle connessioni in cache"""
+    with _lock:
+        return set(_warm)
+
+
+def close_warm_connections():
+    """Chiude tutte le connessioni in cache (es. all'uscita)"""
+    with _lock:
+        connections = list(_warm.values())
+        _warm.clear()
+    for connection in connections:
+        _evict(connection)
+    for connection in connections:
+        connection['warm_thread'].join(2 * WARM_KEEPALIVE_INTERVAL + 1)
+    bump_version('warm')
@@ -9,7 +9,7 @@ from rich.panel import Panel
 from rich.live import Live
 from rich.console import Console
 
-from utils.constants import set_live_instance
+from utils.state import set_live_instance
 
 
 def boot_animation(duration=3):
@@ -73,9 +73,11 @@ def show_status_message(message, title="STATUS", style="blue", duration=2):
         style (str): Style to apply
         duration (float): Message duration in seconds
     """
-    from utils.constants import get_live_instance
+    from utils.state import get_live_instance, is_fast_start
     live = get_live_instance()
     if live:
         panel = Panel(message, title=title, style=style)
         live.update(panel)
-        time.sleep(duration)
\ No newline at end of file
+        # In fast start the message stays visible until the next redraw, without blocking
+        if not is_fast_start():
+            time.sleep(duration)
\ No newline at end of file
@@ -3,18 +3,41 @@
 """
 Gestione degli input da tastiera
 """
+import os
+import threading
+import time
+
 import keyboard
 from rich.console import Console
 
 from config.connections import add_new_connection, get_connections_config, get_connections_list
 from rabbitmq.connection import run_consumer_for_connection
 from ui.layouts import create_full_layout
-from utils.constants import set_selected_index, get_selected_index
-from utils.constants import get_active_connection, clear_messages
-from utils.logger import log_message
+from utils.constants import SEARCH_RESULTS_LIMIT, MAIN_VIEW_MESSAGES, PEEK_DEFAULT_COUNT
+from utils.state import set_selected_index, get_selected_index
+from utils.state import get_active_connection, clear_messages
+from utils.state import set_search_results, get_search_results
+from utils.state import set_main_view, get_main_view
+from utils.search_index import search_messages
+from utils.logger import log_message, log_error
+from utils.export import export_messages, iter_retained_messages
+from rabbitmq.message_filter import get_message_filter_expression, set_message_filter
+from rabbitmq.replay import replay_messages, format_replay_stats
+from rabbitmq.peek import peek_queue, format_peek_stats
+from rabbitmq.heavy_hitters import get_dimensions
+from ui.animations import show_status_message
 
 console = Console()
 
+# I tasti digitati in un prompt restano in coda al callback che lo ha aperto e verrebbero
+# poi eseguiti come comandi: gli eventi catturati con un prompt aperto vengono ignorati
+_prompt_state = {'open': False, 'closed_at': 0.0}
+
+
+def is_prompt_open():
+    """Verifica se un prompt testuale è aperto (i comandi da tastiera sono sospesi)"""
+    return _prompt_state['open']
+
 
 def handle_keyboard_events(live, connections, selected_index):
     """
@@ -27,6 +50,43 @@ def handle_keyboard_events(live, connections, selected_index):
     """
     set_selected_index(selected_index)
     
+    def interactive(func, *args):
+        """Esegue un input interattivo fuori dall'interfaccia Live, con i comandi da tastiera sospesi"""
+        live.stop()
+        console.clear()
+        _prompt_state['open'] = True
+        try:
+            return func(*args)
+        finally:
+            _prompt_state['closed_at'] = time.time()
+            _prompt_state['open'] = False
+            console.clear()
+            live.start()
+    
+    def prompt(*questions, intro=()):
+        """
+        Chiede una o più risposte testuali all'utente.
+        
+        Args:
+            *questions (str): Domande, nell'ordine
+            intro (tuple): Righe mostrate prima delle domande
+        
+        Returns:
+            list: Risposte senza spazi iniziali e finali
+        """
+        def ask():
+            for line in intro:
+                console.print(line)
+            return [input(question).strip() for question in questions]
+        return interactive(ask)
+    
+    def hook(key, handler):
+        def guarded(e):
+            if _prompt_state['open'] or getattr(e, 'time', 0) <= _prompt_state['closed_at']:
+                return
+            handler(e)
+        keyboard.hook_key(key, guarded)
+    
     # Registra i callback per gli eventi tastiera
     def on_key_up(e):
         if e.event_type == keyboard.KEY_DOWN:  # Rispondi solo all'evento KEY_DOWN
@@ -61,11 +121,7 @@ def handle_keyboard_events(live, connections, selected_index):
             
             # Se è l'ultima opzione, crea una nuova connessione
             if current_index == len(connections):
-                live.stop()
-                console.clear()
-                new_connection = add_new_connection()
-                console.clear()
-                live.start()
+                new_connection = interactive(add_new_connection)
                 
                 connections = get_connections_config()  # Ricarica le connessioni
                 set_selected_index(len(connections) - 1)  # Seleziona la nuova connessione
@@ -82,11 +138,7 @@ def handle_keyboard_events(live, connections, selected_index):
     def on_new(e):
         if e.event_type == keyboard.KEY_DOWN:  # Rispondi solo all'evento KEY_DOWN
             # Crea una nuova connessione
-            live.stop()
-            console.clear()
-            new_connection = add_new_connection()
-            console.clear()
-            live.start()
+            new_connection = interactive(add_new_connection)
             
             connections = get_connections_config()  # Ricarica le connessioni
             set_selected_index(len(connections) - 1)  # Seleziona la nuova connessione
@@ -95,12 +147,164 @@ def handle_keyboard_events(live, connections, selected_index):
             if new_connection:
                 run_consumer_for_connection(new_connection, live)
     
+    def on_filter(e):
+        if e.event_type == keyboard.KEY_DOWN:  # Rispondi solo all'evento KEY_DOWN
+            # Modifica il filtro sui messaggi a runtime
+            current = get_message_filter_expression()
+            expression, = prompt(
+                "Nuovo filtro (vuoto per disattivarlo): ",
+                intro=(f"Filtro attuale: {current or '(nessuno)'}",
+                       "Esempio: rk ~ orders.*.failed and header.tenant = 42")
+            )
+            
+            try:
+                set_message_filter(expression)
+                log_message({
+                    'queue': 'system',
+                    'body': f"Filtro messaggi impostato: {expression or '(nessuno)'}",
+                    'timestamp': None
+                })
+                live.update(create_full_layout(get_selected_index()))
+            except ValueError as filter_err:
+                show_status_message(f"Filtro non valido: {filter_err}", title="ERRORE", style="red", duration=2)
+                live.update(create_full_layout(get_selected_index()))
+    
+    def on_search(e):
+        if e.event_type == keyboard.KEY_DOWN:  # Rispondi solo all'evento KEY_DOWN
+            # Cerca tra i messaggi trattenuti tramite l'indice invertito
+            query, = prompt("Cerca nei messaggi (vuoto per tornare alla vista normale): ")
+            
+            if query:
+                started = time.perf_counter()
+                results = search_messages(query, limit=SEARCH_RESULTS_LIMIT)
+                set_search_results(query, results, time.perf_counter() - started)
+            else:
+                set_search_results(None, None)
+            live.update(create_full_layout(get_selected_index()))
+    
+    def on_export(e):
+        if e.event_type == keyboard.KEY_DOWN:  # Rispondi solo all'evento KEY_DOWN
+            # Esporta i messaggi trattenuti in memoria
+            path, headers = prompt(
+                "File di esportazione (.csv, .parquet, .arrow) [vuoto per annullare]: ",
+                "Header da esportare come colonne (separati da virgola): "
+            )
+            
+            if not path:
+                live.update(create_full_layout(get_selected_index()))
+                return
+            
+            def run_export():
+                header_names = [name.strip() for name in headers.split(",") if name.strip()]
+                try:
+                    stats = export_messages(iter_retained_messages(), os.path.expanduser(path),
+                                            header_names=header_names)
+                    log_message({
+                        'queue': 'system',
+                        'body': f"Esportati {stats['rows']} messaggi in {stats['path']} ({stats['format']})",
+                        'timestamp': None
+                    })
+                except Exception as export_err:
+                    log_error(f"Esportazione fallita: {export_err}")
+            
+            # L'esportazione avviene in background per non bloccare l'interfaccia
+            threading.Thread(target=run_export, daemon=True).start()
+            live.update(create_full_layout(get_selected_index()))
+    
+    def on_replay(e):
+        if e.event_type == keyboard.KEY_DOWN:  # Rispondi solo all'evento KEY_DOWN
+            # Ripubblica i risultati della ricerca attiva, o tutti i messaggi trattenuti
+            active_connection = get_active_connection()
+            if not active_connection:
+                return
+            search = get_search_results()
+            if search:
+                messages = list(reversed(search['results']))
+            else:
+                messages = list(iter_retained_messages())
+            
+            exchange, routing_key, rate = prompt(
+                "Exchange di destinazione (vuoto = originale, '-' = default): ",
+                "Routing key (vuoto = originale): ",
+                "Messaggi al secondo (vuoto = massimo): ",
+                intro=(f"Replay di {len(messages)} messaggi su {active_connection['host']}/{active_connection['vhost']}",)
+            )
+            
+            try:
+                rate = float(rate) if rate else 0
+            except ValueError:
+                show_status_message("Ritmo non valido", title="ERRORE", style="red", duration=2)
+                live.update(create_full_layout(get_selected_index()))
+                return
+            
+            def run_replay():
+                try:
+                    stats = replay_messages(
+                        active_connection,
+                        messages,
+                        exchange=None if not exchange else ("" if exchange == "-" else exchange),
+                        routing_key=routing_key or None,
+                        rate=rate
+                    )
+                    log_message({'queue': 'system', 'body': format_replay_stats(stats), 'timestamp': None})
+                except Exception as replay_err:
+                    log_error(f"Replay fallito: {replay_err}")
+            
+            # Il replay usa una connessione dedicata in background
+            threading.Thread(target=run_replay, daemon=True).start()
+            live.update(create_full_layout(get_selected_index()))
+    
+    def on_peek(e):
+        if e.event_type == keyboard.KEY_DOWN:  # Rispondi solo all'evento KEY_DOWN
+            # Legge la testa di una coda senza sottoscriverla e rimette in coda i messaggi
+            active_connection = get_active_connection()
+            if not active_connection:
+                return
+            
+            queue_name, count = prompt(
+                "Coda da ispezionare [vuoto per annullare]: ",
+                f"Numero di messaggi (default {PEEK_DEFAULT_COUNT}): "
+            )
+            
+            if not queue_name:
+                live.update(create_full_layout(get_selected_index()))
+                return
+            try:
+                count = int(count) if count else PEEK_DEFAULT_COUNT
+            except ValueError:
+                show_status_message("Numero di messaggi non valido", title="ERRORE", style="red", duration=2)
+                live.update(create_full_layout(get_selected_index()))
+                return
+            
+            def run_peek():
+                try:
+                    stats = peek_queue(active_connection, queue_name, count)
+                    # I messaggi letti sono mostrati come risultati, replay compreso
+                    set_search_results(queue_name, stats['messages'], stats['peek_time'], label="Peek")
+                    log_message({'queue': 'system', 'body': format_peek_stats(stats), 'timestamp': None})
+                except Exception as peek_err:
+                    log_error(f"Peek di {queue_name} fallito: {peek_err}")
+            
+            # Il peek usa una connessione dedicata in background
+            threading.Thread(target=run_peek, daemon=True).start()
+            live.update(create_full_layout(get_selected_index()))
+    
+    def on_keys_view(e):
+        if e.event_type == keyboard.KEY_DOWN:  # Rispondi solo all'evento KEY_DOWN
+            # Alterna messaggi e chiavi dominanti di ogni dimensione tracciata
+            views = (MAIN_VIEW_MESSAGES,) + get_dimensions()
+            current = get_main_view()
+            next_index = (views.index(current) + 1) % len(views) if current in views else 0
+            set_main_view(views[next_index])
+            live.update(create_full_layout(get_selected_index()))
+    
     def on_clear(e):
         if e.event_type == keyboard.KEY_DOWN:  # Rispondi solo all'evento KEY_DOWN
             # Pulisci i messaggi per la connessione attiva
             active_connection = get_active_connection()
             if active_connection:
                 clear_messages()
+                set_search_results(None, None)
                 live.update(create_full_layout(get_selected_index()))
                 log_message({
                     'queue': 'system',
@@ -112,10 +316,16 @@ def handle_keyboard_events(live, connections, selected_index):
     keyboard.unhook_all()
     
     # Registra i callback per gli eventi
-    keyboard.hook_key('up', on_key_up)
-    keyboard.hook_key('down', on_key_down)
-    keyboard.hook_key('enter', on_enter) 
-    keyboard.hook_key('n', on_new)
-    keyboard.hook_key('c', on_clear)
+    hook('up', on_key_up)
+    hook('down', on_key_down)
+    hook('enter', on_enter)
+    hook('n', on_new)
+    hook('c', on_clear)
+    hook('f', on_filter)
+    hook('s', on_search)
+    hook('e', on_export)
+    hook('r', on_replay)
+    hook('k', on_keys_view)
+    hook('p', on_peek)
     
     # Non è necessario registrare 'q' qui poiché verrà gestito direttamente nel loop principale
\ No newline at end of file
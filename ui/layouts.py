@@ -3,6 +3,8 @@
 """
 User interface layout
 """
+import time
+
 from rich.layout import Layout
 from rich.panel import Panel
 
@@ -11,32 +13,100 @@ from ui.panels import (
     make_queue_list_panel, 
     make_messages_panel, 
     make_help_bar, 
-    make_header_panel
+    make_header_panel,
+    make_heavy_hitters_panel
 )
 
-from utils.constants import get_active_connection
+from utils.state import get_active_connection, get_version, get_main_view
+from utils.constants import MAIN_VIEW_MESSAGES, HEAVY_HITTER_BUCKET_SECONDS
 from rabbitmq.queue_manager import get_queues
+from rabbitmq.health import get_health
+
+# Component name -> (key, renderable) of the last build
+_render_cache = {}
 
 
-def make_main_content():
+def cached_renderable(name, key, build):
+    """
+    Returns the cached renderable for a component, rebuilding it only when its key changes.
+    
+    Args:
+        name (str): Component name
+        key (tuple): State versions (and values) the component depends on
+        build (callable): Function that builds the renderable
+    
+    Returns:
+        The renderable for the current key
+    """
+    cached = _render_cache.get(name)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+    renderable = build()
+    _render_cache[name] = (key, renderable)
+    return renderable
+
+
+def _header_key(active_connection):
+    """Header key: besides versions, the health values shown (they also change with time)"""
+    if not active_connection:
+        return (get_version('active'),)
+    health = get_health(active_connection)
+    return (
+        get_version('active'),
+        get_version('filter'),
+        get_version('queues'),
+        health['state'],
+        health['blocked_count'],
+        round(health['blocked_total'], 1),
+        active_connection.get('reconnect_count'),
+        round(active_connection.get('downtime_total', 0.0), 1),
+    )
+
+
+def _build_queues_panel(active_connection):
+    queues_data = get_queues(active_connection) if active_connection else []
+    return make_queue_list_panel(queues_data)
+
+
+def make_main_content(active_connection=None):
     """
     Creates the main content with queue and message information.
+    Each panel is rebuilt only when the state it shows has changed.
+    
+    Args:
+        active_connection (dict, optional): Active connection. Defaults to the current one.
     
     Returns:
         Layout: Layout with the main content
     """
+    if active_connection is None:
+        active_connection = get_active_connection()
+    
     # Informational header
-    header_panel = make_header_panel()
+    header_panel = cached_renderable("header", _header_key(active_connection), make_header_panel)
     
     # Queues panel
-    active_connection = get_active_connection()
-    queues_data = []
-    if active_connection:
-        queues_data = get_queues(active_connection)
-    queues_panel = make_queue_list_panel(queues_data)
+    queues_panel = cached_renderable(
+        "queues",
+        (get_version('active'), get_version('queues'), get_version('sampling')),
+        lambda: _build_queues_panel(active_connection)
+    )
     
-    # Messages panel
-    messages_panel = make_messages_panel()
+    # Messages panel, or the heavy-hitter keys of the selected dimension
+    main_view = get_main_view()
+    if main_view == MAIN_VIEW_MESSAGES:
+        messages_panel = cached_renderable(
+            "messages",
+            (get_version('messages'), get_version('search')),
+            make_messages_panel
+        )
+    else:
+        # Windows slide with time: rebuild at least once per bucket
+        messages_panel = cached_renderable(
+            "heavy_hitters",
+            (main_view, get_version('heavy_hitters'), int(time.time() // HEAVY_HITTER_BUCKET_SECONDS)),
+            lambda: make_heavy_hitters_panel(main_view)
+        )
     
     # Main layout
     main_layout = Layout()
@@ -52,6 +122,7 @@ def make_main_content():
 def create_full_layout(selected_index=None):
     """
     Creates the complete layout with sidebar, main content, and command bar.
+    Unchanged panels are reused from the render cache.
     
     Args:
         selected_index (int, optional): Selected connection index. Defaults to None.
@@ -64,19 +135,25 @@ def create_full_layout(selected_index=None):
     # Split into two parts: main content and help bar
     layout.split_column(
         Layout(name="main_area", ratio=24),
-        Layout(make_help_bar(), size=3, name="help_bar")
+        Layout(cached_renderable("help_bar", (), make_help_bar), size=3, name="help_bar")
     )
     
     # Split the main area into sidebar and content
+    sidebar = cached_renderable(
+        "sidebar",
+        (get_version('connections'), get_version('active'), get_version('warm'), selected_index),
+        lambda: make_sidebar(selected_index)
+    )
     layout["main_area"].split_row(
-        Layout(make_sidebar(selected_index), name="sidebar", size=30),
+        Layout(sidebar, name="sidebar", size=30),
         Layout(name="main")
     )
     
-    if get_active_connection():
-        layout["main_area"]["main"].update(make_main_content())
+    active_connection = get_active_connection()
+    if active_connection:
+        layout["main_area"]["main"].update(make_main_content(active_connection))
     else:
         layout["main_area"]["main"].update(
             Panel("Select a connection with ↑/↓ and press ENTER", title="Welcome", style="cyan"))
     
-    return layout
\ No newline at end of file
+    return layout
@@ -6,10 +6,20 @@ Componenti dell'interfaccia utente (pannelli, tabelle, ecc.)
 from rich.panel import Panel
 from rich.table import Table
 from rich import box
+from rich.markup import escape
 
 from config.connections import get_connections_list
 from rabbitmq.queue_manager import get_queues
-from utils.constants import get_active_connection, get_messages
+from rabbitmq.health import get_health, HEALTH_OPEN
+from rabbitmq.message_filter import get_message_filter_expression, get_message_filter_error
+from rabbitmq.alerts import get_firing_alerts
+from rabbitmq.heavy_hitters import get_top_keys
+from rabbitmq.warm_cache import get_warm_connection_ids
+from rabbitmq.sampling import get_sampling_stats, get_sampling_rate, get_sampling_mode, histogram_percentile
+from utils.constants import DEFAULT_CONSUME_MODE, SAMPLING_MODE_ALL, MESSAGES_PANEL_LIMIT, MESSAGE_RENDER_MAX_CHARS
+from utils.constants import QUEUE_SPARKLINE_WIDTH, QUEUE_SPARKLINE_LEVEL, HEAVY_HITTER_WINDOWS
+from utils.state import get_active_connection, get_recent_messages, get_search_results, get_payload_refs
+from utils.timeseries import get_queue_series, sparkline
 
 def make_sidebar(selected_index=None):
     """
@@ -24,6 +34,7 @@ def make_sidebar(selected_index=None):
     """
     connections = get_connections_list()
     active_connection = get_active_connection()
+    warm_ids = get_warm_connection_ids()
 
     sidebar_table = Table(show_header=True, header_style="bold", box=box.SIMPLE)
     sidebar_table.add_column("#", justify="center", style="dim", width=3)
@@ -32,6 +43,9 @@ def make_sidebar(selected_index=None):
 
     for i, conn in enumerate(connections, 1):
         name = conn.get("name", "Senza nome")
+        if conn.get("id") in warm_ids:
+            # Connessione pronta nella cache: il passaggio è immediato
+            name = f"{name} [green]●[/]"
         host = f"{conn['host']}/{conn['vhost']}"
 
         # Stile predefinito
@@ -91,42 +105,182 @@ def make_queue_list_panel(queues=None):
                     title="Code Scoperte", 
                     style="magenta")
 
+    sampling_stats = get_sampling_stats()
+
     queues_table = Table(box=box.SIMPLE)
     queues_table.add_column("Exchange/Routing Key", justify="left", style="bold white")
     queues_table.add_column("Messaggi", justify="right", style="cyan")
+    queues_table.add_column("Visti", justify="right", style="green")
+    queues_table.add_column("Tenuti", justify="right", style="yellow")
+    queues_table.add_column("Dim. p50/max", justify="right", style="dim")
+    queues_table.add_column("Andamento", justify="left", no_wrap=True)
+
+    firing_alerts = get_firing_alerts()
 
     for queue in queues:
         queue_name = queue.get("name", "Sconosciuta")
         message_count = queue.get("messages", 0)
-        queues_table.add_row(queue_name, str(message_count))
+        stats = sampling_stats.get(queue_name, {})
+        queues_table.add_row(
+            f"[bold red]! {escape(queue_name)}[/]" if queue_name in firing_alerts else queue_name,
+            str(message_count),
+            str(stats.get("seen", 0)),
+            str(stats.get("kept", 0)),
+            make_size_cell(stats),
+            make_trend_cell(queue_name)
+        )
+
+    title = "Code Scoperte"
+    if get_sampling_mode() != SAMPLING_MODE_ALL and get_sampling_rate() > 1:
+        title += f" (campionamento {get_sampling_mode()} N={get_sampling_rate()})"
+
+    return Panel(queues_table, title=title, border_style="magenta", padding=(1, 2))
+
+
+def make_size_cell(stats):
+    """
+    Crea la cella con mediana e massimo delle dimensioni dei messaggi visti su una coda.
+    
+    Args:
+        stats (dict): Contatori della coda (con 'size_histogram' e 'max_size')
+    
+    Returns:
+        str: Testo della cella (vuoto se non sono arrivati messaggi)
+    """
+    histogram = stats.get("size_histogram")
+    if not histogram or not stats.get("seen"):
+        return ""
+    median = min(histogram_percentile(histogram, 0.5), stats.get("max_size", 0))
+    return f"{format_size(median)}/{format_size(stats.get('max_size', 0))}"
+
 
-    return Panel(queues_table, title="Code Scoperte", border_style="magenta", padding=(1, 2))
+def make_trend_cell(queue_name):
+    """
+    Crea la sparkline della profondità di una coda, in rosso se la coda sta crescendo.
+    
+    Args:
+        queue_name (str): Nome della coda
+    
+    Returns:
+        str: Sparkline con markup
+    """
+    values = get_queue_series(queue_name, "messages", QUEUE_SPARKLINE_LEVEL)[-QUEUE_SPARKLINE_WIDTH:]
+    line = sparkline(values, QUEUE_SPARKLINE_WIDTH)
+    if not line:
+        return ""
+    if values[-1] > values[0]:
+        return f"[red]{line}[/]"
+    if values[-1] < values[0]:
+        return f"[green]{line}[/]"
+    return f"[dim]{line}[/]"
 
 
 def make_messages_panel():
     """
-    Crea un pannello con i messaggi ricevuti.
+    Crea un pannello con i messaggi ricevuti, o con i risultati della ricerca attiva.
     
     Returns:
         Panel: Pannello con i messaggi ricevuti
     """
-    messages = get_messages()
-
-    if not messages:
-        return Panel("In attesa di messaggi...", title="Messaggi Ricevuti", style="green")
+    search = get_search_results()
+    if search is not None:
+        messages = search['results']
+        title = f"{search.get('label', 'Ricerca')}: {escape(search['query'])} ({len(messages)} risultati"
+        if search.get('elapsed') is not None:
+            title += f" in {search['elapsed'] * 1000:.1f} ms"
+        title += ")"
+        if not messages:
+            return Panel("Nessun messaggio trovato.", title=title, style="green")
+        # I risultati sono già ordinati dal più recente
+        visible = messages[:MESSAGES_PANEL_LIMIT]
+    else:
+        # Solo gli ultimi messaggi, in cima i più recenti: il buffer può contenerne molti di più
+        visible = get_recent_messages(MESSAGES_PANEL_LIMIT)
+        title = "Messaggi Ricevuti"
+        if not visible:
+            return Panel("In attesa di messaggi...", title=title, style="green")
 
     messages_content = ""
-    for msg in reversed(messages):  # Ultimi messaggi in cima
+    shown_payloads = set()
+    for msg in visible:
         exchange = msg.get("exchange", "default")
         queue_name = msg.get("queue", "Sconosciuta")
         routing_key = msg.get("routing_key", "")
         body = msg.get("body", "")
 
-        messages_content += f"[bold yellow]Da: {exchange}/{routing_key}[/]\n"
-        messages_content += f"{body}\n"
+        # I payload identici trattenuti più volte sono memorizzati una sola volta
+        payload_id = msg.get("payload_id")
+        repeats = get_payload_refs(payload_id) if payload_id is not None else 0
+        messages_content += f"[bold yellow]Da: {escape(str(exchange))}/{escape(str(routing_key))}[/]"
+        if repeats > 1:
+            messages_content += f" [magenta]×{repeats} ripetuto[/]"
+        messages_content += "\n"
+        if payload_id is not None and payload_id in shown_payloads:
+            messages_content += "[dim](corpo identico a un messaggio più recente)[/]\n"
+        else:
+            shown_payloads.add(payload_id)
+            body = str(body)
+            if len(body) > MESSAGE_RENDER_MAX_CHARS:
+                # I corpi lunghi vengono troncati: il rendering non dipende dalla dimensione del messaggio
+                body = f"{body[:MESSAGE_RENDER_MAX_CHARS]}\n[... {len(body) - MESSAGE_RENDER_MAX_CHARS} caratteri omessi]"
+            messages_content += f"{escape(body)}\n"
         messages_content += "[dim]" + "-" * 50 + "[/]\n"
 
-    return Panel(messages_content, title="Messaggi Ricevuti", style="green", padding=(1, 2))
+    return Panel(messages_content, title=title, style="green", padding=(1, 2))
+
+
+def format_size(size):
+    """Dimensione in byte in forma leggibile (B, KB, MB, GB)"""
+    for unit in ("B", "KB", "MB"):
+        if size < 1024:
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GB"
+
+
+def make_top_keys_table(dimension, seconds, by):
+    """
+    Crea la tabella delle chiavi dominanti di una dimensione su una finestra.
+    
+    Args:
+        dimension (str): Dimensione (routing_key, exchange, header:<nome>)
+        seconds (int): Ampiezza della finestra in secondi
+        by (str): Ordinamento, "messages" o "bytes"
+    
+    Returns:
+        Table: Tabella con chiave, messaggi e byte stimati
+    """
+    label = "messaggi" if by == "messages" else "byte"
+    table = Table(box=box.SIMPLE, title=f"Per {label} - ultimi {seconds // 60} min", title_justify="left")
+    table.add_column("Chiave", justify="left", style="bold white", overflow="fold")
+    table.add_column("Messaggi", justify="right", style="cyan" if by == "messages" else "dim")
+    table.add_column("Byte", justify="right", style="cyan" if by == "bytes" else "dim")
+    for key, messages, size in get_top_keys(dimension, seconds, by=by):
+        table.add_row(escape(key) if key else "[dim](vuota)[/]", str(messages), format_size(size))
+    return table
+
+
+def make_heavy_hitters_panel(dimension):
+    """
+    Crea il pannello delle chiavi dominanti per messaggi e per byte, su ogni finestra scorrevole.
+    I conteggi sono stime da sketch a memoria fissa (mai inferiori al valore vero).
+    
+    Args:
+        dimension (str): Dimensione da mostrare
+    
+    Returns:
+        Panel: Pannello con le classifiche
+    """
+    grid = Table.grid(expand=True, padding=(0, 2))
+    grid.add_column(ratio=1)
+    grid.add_column(ratio=1)
+    for seconds in HEAVY_HITTER_WINDOWS:
+        grid.add_row(
+            make_top_keys_table(dimension, seconds, "messages"),
+            make_top_keys_table(dimension, seconds, "bytes"),
+        )
+    title = f"Chiavi dominanti: {escape(dimension)} (K per cambiare vista)"
+    return Panel(grid, title=title, border_style="green", padding=(0, 1))
 
 
 def make_help_bar():
@@ -141,6 +295,12 @@ def make_help_bar():
     help_text += "[yellow]ENTER[/] Seleziona "
     help_text += "[yellow]N[/] Nuova connessione "
     help_text += "[yellow]C[/] Pulisci messaggi "
+    help_text += "[yellow]F[/] Filtro "
+    help_text += "[yellow]S[/] Cerca "
+    help_text += "[yellow]E[/] Esporta "
+    help_text += "[yellow]R[/] Replay "
+    help_text += "[yellow]K[/] Chiavi "
+    help_text += "[yellow]P[/] Peek "
     help_text += "[yellow]Q[/] Esci"
 
     return Panel(help_text, border_style="dim", padding=(0, 0))
@@ -156,7 +316,25 @@ def make_header_panel():
     active_connection = get_active_connection()
     
     if active_connection:
-        header = f"[bold]Host:[/] {active_connection['host']} - [bold]VHost:[/] {active_connection['vhost']} - [bold]Modalità:[/] Scoperta Dinamica"
+        consume_mode = active_connection.get('consume_mode', DEFAULT_CONSUME_MODE)
+        header = f"[bold]Host:[/] {active_connection['host']} - [bold]VHost:[/] {active_connection['vhost']} - [bold]Modalità:[/] {consume_mode}"
+        message_filter = get_message_filter_expression()
+        if message_filter:
+            header += f" - [bold]Filtro:[/] {escape(message_filter)}"
+        filter_error = get_message_filter_error()
+        if filter_error:
+            header += f" - [bold red]Filtro salvato non valido:[/] {escape(filter_error)}"
+        health = get_health(active_connection)
+        health_style = "green" if health['state'] == HEALTH_OPEN else "bold red"
+        header += f" - [bold]Stato:[/] [{health_style}]{health['state']}[/]"
+        if health['blocked_count']:
+            header += f" - [bold]Bloccata:[/] {health['blocked_total']:.1f}s ({health['blocked_count']}x)"
+        firing_alerts = get_firing_alerts()
+        if firing_alerts:
+            header += f" - [bold red]Allarmi: {sum(len(rules) for rules in firing_alerts.values())}[/]"
+        if active_connection.get('reconnect_count'):
+            header += (f" - [bold]Riconnessioni:[/] {active_connection['reconnect_count']}"
+                       f" ({active_connection.get('downtime_total', 0.0):.1f}s offline)")
     else:
         header = "Nessuna connessione attiva"
 
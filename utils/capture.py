@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+File di cattura strutturati (JSON Lines) con corpo originale e proprietà AMQP.
+A differenza del log testuale conservano tutto il necessario per ripubblicare i messaggi.
+"""
+import base64
+import calendar
+import json
+import os
+import threading
+from datetime import datetime, timezone
+from decimal import Decimal
+
+from utils.spill import body_bytes
+
+_lock = threading.Lock()
+_capture_file = None
+_capture_path = None
+
+
+def encode_value(value):
+    """Rende serializzabili in JSON i valori delle tabelle AMQP, in modo reversibile"""
+    if isinstance(value, (bytes, bytearray)):
+        return {"$b64": base64.b64encode(bytes(value)).decode("ascii")}
+    if isinstance(value, datetime):
+        return {"$ts": calendar.timegm(value.utctimetuple())}
+    if isinstance(value, Decimal):
+        return {"$dec": str(value)}
+    if isinstance(value, dict):
+        return {str(key): encode_value(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [encode_value(item) for item in value]
+    return value
+
+
+def decode_value(value):
+    """Inverso di encode_value"""
+    if isinstance(value, dict):
+        if len(value) == 1:
+            if "$b64" in value:
+                return base64.b64decode(value["$b64"])
+            if "$ts" in value:
+                return datetime.fromtimestamp(value["$ts"], timezone.utc).replace(tzinfo=None)
+            if "$dec" in value:
+                return Decimal(value["$dec"])
+        return {key: decode_value(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [decode_value(item) for item in value]
+    return value
+
+
+def capture_record(message_data):
+    """
+    Converte un messaggio memorizzato in un record del file di cattura.
+
+    Args:
+        message_data (dict): Messaggio con 'raw_body' e 'raw_properties'
+
+    Returns:
+        str: Riga JSON (senza terminatore)
+    """
+    record = {
+        "timestamp": message_data.get("timestamp"),
+        "queue": message_data.get("queue"),
+        "exchange": message_data.get("exchange"),
+        "routing_key": message_data.get("routing_key"),
+        "properties": encode_value(message_data.get("raw_properties") or {}),
+        "body": base64.b64encode(body_bytes(message_data.get("raw_body"))).decode("ascii"),
+    }
+    return json.dumps(record, ensure_ascii=False)
+
+
+def parse_capture_record(line):
+    """
+    Ricostruisce un messaggio da una riga del file di cattura.
+
+    Args:
+        line (str): Riga JSON
+
+    Returns:
+        dict: Messaggio con 'raw_body' (bytes) e 'raw_properties' (dict)
+    """
+    record = json.loads(line)
+    raw_body = base64.b64decode(record.get("body") or "")
+    raw_properties = decode_value(record.get("properties") or {})
+    return {
+        "timestamp": record.get("timestamp"),
+        "queue": record.get("queue") or "",
+        "exchange": record.get("exchange") or "",
+        "routing_key": record.get("routing_key") or "",
+        "headers": raw_properties.get("headers") or {},
+        "size": len(raw_body),
+        "body": raw_body.decode("utf-8", errors="replace"),
+        "raw_body": raw_body,
+        "raw_properties": raw_properties,
+    }
+
+
+def iter_capture_messages(paths):
+    """
+    Legge in streaming uno o più file di cattura. Le righe non valide vengono saltate.
+
+    Args:
+        paths (list): File di cattura, nell'ordine
+
+    Yields:
+        dict: Messaggio ricostruito
+    """
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield parse_capture_record(line)
+                except (ValueError, TypeError):
+                    continue
+
+
+def start_capture(path):
+    """
+    Attiva la scrittura dei messaggi elaborati su un file di cattura (in append).
+
+    Args:
+        path (str): File di destinazione
+    """
+    global _capture_file, _capture_path
+    path = os.path.expanduser(path)
+    with _lock:
+        if _capture_file is not None:
+            _capture_file.close()
+        _capture_file = open(path, "a", encoding="utf-8", buffering=1)
+        _capture_path = path
+
+
+def stop_capture():
+    """Chiude il file di cattura attivo"""
+    global _capture_file, _capture_path
+    with _lock:
+        if _capture_file is not None:
+            _capture_file.close()
+        _capture_file = None
+        _capture_path = None
+
+
+def get_capture_path():
+    """Ritorna il file di cattura attivo (None se disattivato)"""
+    return _capture_path
+
+
+def capture_message(message_data):
+    """
+    Aggiunge un messaggio al file di cattura, se attivo.
+
+    Args:
+        message_data (dict): Messaggio con 'raw_body' e 'raw_properties'
+    """
+    if _capture_file is None:
+        return
+    line = capture_record(message_data)
+    with _lock:
+        if _capture_file is not None:
+            _capture_file.write(line + "\n")
@@ -1,74 +1,109 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 """
-Application constants and global variables
+Application constants (the shared mutable state lives in utils/state.py)
 """
 
-# Global variables initialized as None
-ACTIVE_CONNECTION = None
-CURRENT_MESSAGES = []
-MAX_MESSAGES = 100  # Maximum number of messages to keep in memory
-LIVE_INSTANCE = None  # Live instance for UI updates from callbacks
-SELECTED_INDEX = 0  # Global selected index for UI updates
+# Retained messages
+MAX_MESSAGES = 100  # Default number of messages kept in memory
+MESSAGES_PANEL_LIMIT = 50  # Messages rendered in the messages panel
+SEARCH_RESULTS_LIMIT = 1000  # Maximum results returned by a search
+MESSAGE_RENDER_MAX_CHARS = 2000  # Body characters rendered per message in the messages panel
+SPILL_THRESHOLD = 1024 * 1024  # Bytes; larger bodies are written to a temporary file
+SPILL_PREVIEW_BYTES = 4096  # Bytes of a spilled body kept in memory as preview
+SIZE_HISTOGRAM_BUCKETS = 32  # Per-queue message size histogram: bucket i counts sizes below 2**i bytes
+LOG_PAYLOAD_REFS = 10000  # Payloads remembered by the message log to write back-references to repeated bodies
+
+# Consumption modes
+CONSUME_MODE_CONSUME = "consume"  # Competing consumer on the real queues
+CONSUME_MODE_TAP = "tap"  # Exclusive mirror queues with the same bindings
+CONSUME_MODE_FIREHOSE = "firehose"  # Firehose tracer (amq.rabbitmq.trace)
+CONSUME_MODES = (CONSUME_MODE_CONSUME, CONSUME_MODE_TAP, CONSUME_MODE_FIREHOSE)
+DEFAULT_CONSUME_MODE = CONSUME_MODE_CONSUME  # Used for connections saved without a mode
+TAP_MAX_LENGTH = 1000  # Maximum number of messages kept in each mirror queue
+TAP_OVERFLOW = "drop-head"  # Overflow behaviour of the mirror queues
+
+# Sampling / load shedding
+SAMPLING_MODE_ALL = "all"  # Keep every delivery
+SAMPLING_MODE_NTH = "nth"  # Keep 1 delivery every N
+SAMPLING_MODE_RESERVOIR = "reservoir"  # Reservoir sample per time window
+DEFAULT_SAMPLING_MODE = SAMPLING_MODE_NTH
+DEFAULT_SAMPLING_RATE = 1  # Base N for "nth", reservoir size for "reservoir"
+DEFAULT_SAMPLING_WINDOW = 1.0  # Seconds per sampling window
+SAMPLING_TARGET_UTILIZATION = 0.5  # Fraction of consumer time spent processing kept messages
+SAMPLING_MAX_RATE = 10000  # Upper bound for the adaptive N
+SAMPLING_DECODE_BACKLOG_HIGH = 0.5  # Fraction of DECODE_MAX_IN_FLIGHT pending at which the adaptive N doubles
+RENDER_MIN_INTERVAL = 0.25  # Minimum seconds between redraws triggered by deliveries
+
+# Heavy-hitter keys (bounded-memory sketches over sliding windows)
+HEAVY_HITTER_BUCKET_SECONDS = 10  # Granularity of the sliding windows
+HEAVY_HITTER_WINDOWS = (60, 300)  # Windows shown in the panel, in seconds
+HEAVY_HITTER_CAPACITY = 64  # Space-Saving counters per dimension and bucket
+HEAVY_HITTER_SKETCH_WIDTH = 512  # Count-min counters per row
+HEAVY_HITTER_SKETCH_DEPTH = 4  # Count-min rows
+HEAVY_HITTER_TOP_K = 10  # Keys shown per ranking
+MAIN_VIEW_MESSAGES = "messages"  # Lower panel view; any other value is a heavy-hitter dimension
+
+# Queue peek
+PEEK_DEFAULT_COUNT = 100  # Messages pulled when no count is given
+PEEK_MAX_COUNT = 10000  # Upper bound on a single peek (it is also the consumer prefetch)
+PEEK_INACTIVITY_TIMEOUT = 1.0  # Seconds without deliveries before a peek stops waiting
+
+# Automatic reconnection
+RECONNECT_BASE_DELAY = 0.5  # Seconds, first backoff step
+RECONNECT_MAX_DELAY = 30.0  # Seconds, backoff ceiling
+
+# Warm connection cache
+WARM_CONNECTIONS_MAX = 3  # Idle AMQP connections kept open for recently used brokers
+WARM_IDLE_TIMEOUT = 600.0  # Seconds a warm connection may stay unused before it is closed
+WARM_KEEPALIVE_INTERVAL = 1.0  # Seconds per process_data_events call on an idle connection
+WARM_PARK_TIMEOUT = 2.0  # Seconds to wait for the consumer thread when parking a connection
+WARM_PREFETCH_COUNT = 2  # Most recently used brokers connected in the background at startup
+WARM_PREFETCH_API_TIMEOUT = 3.0  # Seconds; Management API timeout for background prefetches
+
+# Payload decoding
+DECODE_INLINE_MAX = 64 * 1024  # Bytes; larger plain payloads are decoded on the worker pool
+DECODE_CACHE_SIZE = 1024  # Decoded payloads kept in the LRU cache
+DECODER_POOL_THREAD = "thread"
+DECODER_POOL_PROCESS = "process"
+DEFAULT_DECODER_POOL = DECODER_POOL_THREAD
+DEFAULT_DECODER_WORKERS = 2
+DECODE_MAX_IN_FLIGHT = 256  # Payloads queued or decoding on the pool; beyond this only a preview is shown
+DECODE_PREVIEW_BYTES = 4096  # Bytes shown when the pool is saturated
+DECODE_MAX_OUTPUT = 16 * 1024 * 1024  # Bytes; decompressed output beyond this is truncated
+
+# Export
+EXPORT_BATCH_SIZE = 5000  # Rows buffered before each columnar write
+
+# Replay
+REPLAY_MAX_IN_FLIGHT = 256  # Unconfirmed publishes allowed before waiting for confirms
+REPLAY_CONFIRM_TIMEOUT = 30.0  # Seconds to wait for outstanding confirms at the end
+
+# Publish benchmark
+BENCH_HEADER = "x-bench-sent"  # Header carrying the publish time (epoch seconds)
+BENCH_DRAIN_TIMEOUT = 30.0  # Seconds to wait for the consumer after the last publish
+
+# Ingest process (pika in a child process, deliveries through a shared-memory ring)
+INGEST_RING_BYTES = 32 * 1024 * 1024  # Size of the shared ring; deliveries are dropped when it is full
+INGEST_POLL_INTERVAL = 0.01  # Seconds the UI-side reader sleeps when the ring is empty
+
+# Live queue discovery
+DISCOVERY_INTERVAL = 5.0  # Seconds between Management API snapshots
+
+# Queue depth history: (snapshots averaged per sample, samples kept) for each resolution
+QUEUE_HISTORY_RESOLUTIONS = ((1, 120), (12, 120), (144, 120))  # ~10 min, ~2 h, ~24 h at 5 s polls
+QUEUE_SPARKLINE_WIDTH = 20  # Characters of the trend column
+QUEUE_SPARKLINE_LEVEL = 0  # Resolution shown in the trend column
+
+# Queue alerts (rules used when a connection has no 'alert_rules')
+DEFAULT_ALERT_RULES = (
+    "consumers = 0 and messages > 0 for 60",
+    "publish_rate > deliver_rate and messages > 1000 for 120",
+)
+
+# Connection config store
+CONFIG_SAVE_DEBOUNCE = 2.0  # Seconds to coalesce config writes (e.g. last_used updates)
+
+# Connection health
+HEALTH_TICK_INTERVAL = 5.0  # Seconds between liveness ticks scheduled on the pika I/O loop
 
-
-def initialize_globals():
-    """Initialize global variables with default values"""
-    global ACTIVE_CONNECTION, CURRENT_MESSAGES
-    ACTIVE_CONNECTION = None
-    CURRENT_MESSAGES = []
-    # Note: We don't reset CONNECTIONS_LIST here as it's managed in connections.py
-
-
-def set_live_instance(live):
-    """Set the global Live instance"""
-    global LIVE_INSTANCE
-    LIVE_INSTANCE = live
-
-
-def get_live_instance():
-    """Return the global Live instance"""
-    return LIVE_INSTANCE
-
-
-def set_selected_index(index):
-    """Set the global selected index"""
-    global SELECTED_INDEX
-    SELECTED_INDEX = index
-
-
-def get_selected_index():
-    """Return the global selected index"""
-    return SELECTED_INDEX
-
-
-def set_active_connection(connection):
-    """Set the global active connection"""
-    global ACTIVE_CONNECTION
-    ACTIVE_CONNECTION = connection
-
-
-def get_active_connection():
-    """Return the global active connection"""
-    return ACTIVE_CONNECTION
-
-
-# Removed connection list functions since they're now in connections.py
-
-def add_message(message):
-    """Add a message to the current messages list"""
-    global CURRENT_MESSAGES
-    CURRENT_MESSAGES.append(message)
-    if len(CURRENT_MESSAGES) > MAX_MESSAGES:
-        CURRENT_MESSAGES = CURRENT_MESSAGES[-MAX_MESSAGES:]
-
-
-def get_messages():
-    """Return the list of current messages"""
-    return CURRENT_MESSAGES
-
-
-def clear_messages():
-    """Clear the list of current messages"""
-    global CURRENT_MESSAGES
-    CURRENT_MESSAGES = []
\ No newline at end of file
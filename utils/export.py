@@ -0,0 +1,239 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Esportazione colonnare del traffico catturato (CSV, Parquet, Arrow IPC).
+Le righe vengono scritte a blocchi: la memoria usata non dipende dal numero di messaggi.
+"""
+import csv
+import os
+import time
+from collections import OrderedDict
+
+from utils.constants import EXPORT_BATCH_SIZE, LOG_PAYLOAD_REFS
+from utils.state import get_messages
+from utils.logger import LOG_BODY_REF_PREFIX
+
+BASE_COLUMNS = ("timestamp", "queue", "exchange", "routing_key", "size")
+EXPORT_FORMATS = ("csv", "parquet", "arrow")
+
+_LOG_RECORD_MARKER = "--- NUOVO MESSAGGIO: "
+_LOG_FIELDS = {
+    "Coda: ": "queue",
+    "Routing Key: ": "routing_key",
+    "Exchange: ": "exchange",
+    "Dimensione: ": "size",
+    "Payload: ": "payload_id",
+}
+
+
+def export_format_for(path, export_format=None):
+    """
+    Determina il formato di esportazione dall'argomento esplicito o dall'estensione del file.
+
+    Args:
+        path (str): File di destinazione
+        export_format (str, optional): Formato esplicito (csv, parquet, arrow)
+
+    Returns:
+        str: Formato di esportazione
+    """
+    if export_format:
+        export_format = export_format.lower()
+    else:
+        extension = os.path.splitext(path)[1].lower().lstrip(".")
+        export_format = {"pq": "parquet", "feather": "arrow", "ipc": "arrow"}.get(extension, extension)
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"Formato di esportazione non supportato: {export_format or path}")
+    return export_format
+
+
+def message_to_row(message, header_names=()):
+    """
+    Converte un messaggio in una riga dell'esportazione.
+
+    Args:
+        message (dict): Messaggio (dal buffer in memoria o da un file catturato)
+        header_names (tuple): Header da esportare come colonne "header_<nome>"
+
+    Returns:
+        dict: Riga con colonne fisse, header selezionati e corpo
+    """
+    body = message.get("body", "")
+    size = message.get("size")
+    if size in (None, ""):
+        size = len(str(body).encode("utf-8"))
+    row = {
+        "timestamp": message.get("timestamp") or "",
+        "queue": message.get("queue", ""),
+        "exchange": message.get("exchange", ""),
+        "routing_key": message.get("routing_key", ""),
+        "size": int(size),
+    }
+    headers = message.get("headers") or {}
+    for name in header_names:
+        value = headers.get(name)
+        if isinstance(value, bytes):
+            value = value.decode("utf-8", errors="replace")
+        row[f"header_{name}"] = "" if value is None else str(value)
+    row["body"] = str(body)
+    return row
+
+
+def iter_retained_messages():
+    """Itera sui messaggi attualmente trattenuti in memoria, dal più vecchio"""
+    # Istantanea immutabile: il buffer può cambiare durante l'esportazione
+    for message in get_messages():
+        if message.get("queue") != "system":
+            yield message
+
+
+def iter_log_messages(paths):
+    """
+    Legge in streaming i file di log testuali scritti da utils.logger.log_message.
+
+    Args:
+        paths (list): File di log da leggere, nell'ordine
+
+    Yields:
+        dict: Messaggio ricostruito (i record 'system' sono esclusi)
+    """
+    for path in paths:
+        # Corpi già letti nel file, per risolvere i riferimenti ai payload ripetuti: stessa LRU
+        # del logger, che non scrive riferimenti a payload più vecchi di LOG_PAYLOAD_REFS
+        bodies = OrderedDict()
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            message = None
+            body_lines = None
+            for line in f:
+                line = line.rstrip("\n")
+                if line.startswith(_LOG_RECORD_MARKER):
+                    if message is not None and message.get("queue") != "system":
+                        yield _finish_log_message(message, body_lines, bodies)
+                    message = {"timestamp": line[len(_LOG_RECORD_MARKER):].rstrip(" -")}
+                    body_lines = None
+                    continue
+                if message is None:
+                    continue
+                if body_lines is not None:
+                    body_lines.append(line)
+                elif line == "Corpo:":
+                    body_lines = []
+                elif line.startswith(LOG_BODY_REF_PREFIX):
+                    message["payload_id"] = line[len(LOG_BODY_REF_PREFIX):]
+                    message["body_ref"] = True
+                else:
+                    for prefix, key in _LOG_FIELDS.items():
+                        if line.startswith(prefix):
+                            message[key] = line[len(prefix):]
+                            break
+            if message is not None and message.get("queue") != "system":
+                yield _finish_log_message(message, body_lines, bodies)
+
+
+def _finish_log_message(message, body_lines, bodies):
+    payload_id = message.get("payload_id")
+    if message.pop("body_ref", False):
+        body = bodies.get(payload_id)
+        if body is None:
+            # Riferimento a un corpo non letto (es. log iniziato a metà): resta visibile
+            message["body"] = f"= {payload_id}"
+        else:
+            bodies.move_to_end(payload_id)
+            message["body"] = body
+    else:
+        # Ogni record è seguito da una riga vuota prima del marcatore successivo
+        body_lines = body_lines or []
+        if body_lines and body_lines[-1] == "":
+            body_lines = body_lines[:-1]
+        message["body"] = "\n".join(body_lines)
+        if payload_id is not None:
+            bodies[payload_id] = message["body"]
+            bodies.move_to_end(payload_id)
+            if len(bodies) > LOG_PAYLOAD_REFS:
+                bodies.popitem(last=False)
+    message.setdefault("exchange", "")
+    return message
+
+
+class _CsvSink:
+    def __init__(self, path, columns):
+        self.file = open(path, "w", encoding="utf-8", newline="")
+        self.writer = csv.DictWriter(self.file, fieldnames=columns)
+        self.writer.writeheader()
+
+    def write_batch(self, rows, columns):
+        self.writer.writerows(rows)
+
+    def close(self):
+        self.file.close()
+
+
+class _ArrowSink:
+    def __init__(self, path, columns, export_format):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+            import pyarrow.ipc
+        except ImportError:
+            raise RuntimeError("Per l'esportazione Parquet/Arrow è necessario installare pyarrow")
+        self.pyarrow = pyarrow
+        fields = [pyarrow.field(name, pyarrow.int64() if name == "size" else pyarrow.string()) for name in columns]
+        self.schema = pyarrow.schema(fields)
+        if export_format == "parquet":
+            self.writer = pyarrow.parquet.ParquetWriter(path, self.schema, compression="zstd")
+        else:
+            self.writer = pyarrow.ipc.new_file(path, self.schema)
+
+    def write_batch(self, rows, columns):
+        arrays = {name: [row[name] for row in rows] for name in columns}
+        batch = self.pyarrow.RecordBatch.from_pydict(arrays, schema=self.schema)
+        if hasattr(self.writer, "write_batch"):
+            self.writer.write_batch(batch)
+        else:
+            self.writer.write_table(self.pyarrow.Table.from_batches([batch]))
+
+    def close(self):
+        self.writer.close()
+
+
+def export_messages(messages, path, export_format=None, header_names=(), batch_size=EXPORT_BATCH_SIZE):
+    """
+    Esporta un flusso di messaggi in un file colonnare, a blocchi di batch_size righe.
+
+    Args:
+        messages (iterable): Messaggi da esportare (anche un generatore)
+        path (str): File di destinazione
+        export_format (str, optional): csv, parquet o arrow (default: dall'estensione)
+        header_names (tuple): Header da esportare come colonne
+        batch_size (int): Righe per blocco
+
+    Returns:
+        dict: Statistiche {'rows', 'elapsed', 'path', 'format'}
+    """
+    export_format = export_format_for(path, export_format)
+    header_names = tuple(header_names or ())
+    columns = list(BASE_COLUMNS) + [f"header_{name}" for name in header_names] + ["body"]
+
+    started = time.perf_counter()
+    sink = _CsvSink(path, columns) if export_format == "csv" else _ArrowSink(path, columns, export_format)
+    rows_written = 0
+    batch = []
+    try:
+        for message in messages:
+            batch.append(message_to_row(message, header_names))
+            if len(batch) >= batch_size:
+                sink.write_batch(batch, columns)
+                rows_written += len(batch)
+                batch = []
+        if batch:
+            sink.write_batch(batch, columns)
+            rows_written += len(batch)
+    finally:
+        sink.close()
+
+    return {
+        "rows": rows_written,
+        "elapsed": time.perf_counter() - started,
+        "path": path,
+        "format": export_format,
+    }
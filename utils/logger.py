@@ -4,8 +4,17 @@
 Funzionalità di logging per l'applicazione
 """
 import os
+import threading
+from collections import OrderedDict
 from datetime import datetime
 
+from utils.constants import LOG_PAYLOAD_REFS
+
+LOG_BODY_REF_PREFIX = "Corpo: = "
+
+_payload_lock = threading.Lock()
+_logged_payloads = OrderedDict()  # payload_id -> file di log in cui il corpo è già stato scritto
+
 
 def ensure_log_directory():
     """Crea la directory di log se non esiste"""
@@ -29,13 +38,37 @@ def log_message(message_data):
             f.write(f"\n--- NUOVO MESSAGGIO: {datetime.now().isoformat()} ---\n")
             f.write(f"Coda: {message_data.get('queue', 'Sconosciuta')}\n")
             f.write(f"Routing Key: {message_data.get('routing_key', '')}\n")
+            if 'exchange' in message_data:
+                f.write(f"Exchange: {message_data['exchange']}\n")
+            if 'size' in message_data:
+                f.write(f"Dimensione: {message_data['size']}\n")
             f.write(f"Proprietà: {message_data.get('properties', '')}\n")
-            f.write(f"Corpo:\n{message_data.get('body', '')}\n")
+            payload_id = message_data.get('payload_id')
+            if payload_id is not None and _body_already_logged(payload_id, log_file):
+                # Corpo identico già scritto in questo file: solo il riferimento
+                f.write(f"{LOG_BODY_REF_PREFIX}{payload_id}\n")
+            else:
+                if payload_id is not None:
+                    f.write(f"Payload: {payload_id}\n")
+                f.write(f"Corpo:\n{message_data.get('body', '')}\n")
     except Exception:
         # Ignoriamo errori di logging per non interrompere l'applicazione
         pass
 
 
+def _body_already_logged(payload_id, log_file):
+    """Verifica (e registra) se il corpo di un payload è già stato scritto nel file di log"""
+    with _payload_lock:
+        if _logged_payloads.get(payload_id) == log_file:
+            _logged_payloads.move_to_end(payload_id)
+            return True
+        _logged_payloads[payload_id] = log_file
+        _logged_payloads.move_to_end(payload_id)
+        if len(_logged_payloads) > LOG_PAYLOAD_REFS:
+            _logged_payloads.popitem(last=False)
+        return False
+
+
 def log_error(error_message):
     """
     Registra un errore nel file di log degli errori
@@ -53,3 +86,24 @@ def log_error(error_message):
     except Exception:
         # Ignoriamo errori di logging per non interrompere l'applicazione
         pass
+
+
+def log_alerts(alert_messages):
+    """
+    Registra uno o più allarmi nel file di log degli allarmi, separato da messaggi ed errori
+    
+    Args:
+        alert_messages (list): Allarmi da registrare, scritti con un'unica apertura del file
+    """
+    if not alert_messages:
+        return
+    try:
+        log_dir = ensure_log_directory()
+        alert_log = os.path.join(log_dir, "alerts.log")
+        timestamp = datetime.now().isoformat()
+        
+        with open(alert_log, "a", encoding="utf-8") as f:
+            f.writelines(f"{timestamp} {alert_message}\n" for alert_message in alert_messages)
+    except Exception:
+        # Ignoriamo errori di logging per non interrompere l'applicazione
+        pass
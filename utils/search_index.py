@@ -0,0 +1,179 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Indice invertito incrementale sui messaggi trattenuti in memoria.
+Aggiornato a ogni inserimento ed espulsione dal buffer circolare.
+"""
+import re
+import threading
+
+_TOKEN_RE = re.compile(r"\w+")
+MAX_INDEXED_BODY = 65536  # Caratteri del corpo indicizzati per messaggio
+
+_lock = threading.Lock()
+_postings = {}  # token -> set di seq
+_messages = {}  # seq -> messaggio
+_tokens_by_seq = {}  # seq -> token del messaggio (per l'espulsione)
+_token_sets = {}  # insieme di token -> [stesso insieme condiviso, messaggi che lo usano]
+
+
+def tokenize(text):
+    """
+    Suddivide un testo in token normalizzati (minuscoli, alfanumerici).
+
+    Args:
+        text (str): Testo da suddividere
+
+    Returns:
+        set: Token distinti
+    """
+    if not text:
+        return set()
+    return set(_TOKEN_RE.findall(str(text).lower()))
+
+
+def message_tokens(message):
+    """Estrae i token di corpo, routing key, coda, exchange e valori degli header"""
+    tokens = tokenize(str(message.get("body", ""))[:MAX_INDEXED_BODY])
+    tokens |= tokenize(message.get("routing_key", ""))
+    tokens |= tokenize(message.get("queue", ""))
+    tokens |= tokenize(message.get("exchange", ""))
+    for value in (message.get("headers") or {}).values():
+        if isinstance(value, bytes):
+            value = value.decode("utf-8", errors="replace")
+        tokens |= tokenize(value)
+    return tokens
+
+
+def _message_text(message):
+    parts = [
+        str(message.get("body", ""))[:MAX_INDEXED_BODY],
+        str(message.get("routing_key", "")),
+        str(message.get("queue", "")),
+        str(message.get("exchange", "")),
+    ]
+    for value in (message.get("headers") or {}).values():
+        if isinstance(value, bytes):
+            value = value.decode("utf-8", errors="replace")
+        parts.append(str(value))
+    return "\n".join(parts).lower()
+
+
+def index_message(seq, message):
+    """
+    Aggiunge un messaggio all'indice.
+
+    Args:
+        seq (int): Identificativo progressivo del messaggio
+        message (dict): Dati del messaggio
+    """
+    tokens = frozenset(message_tokens(message))
+    with _lock:
+        # Messaggi ripetuti condividono un unico insieme di token (e le relative stringhe)
+        shared = _token_sets.get(tokens)
+        if shared is None:
+            _token_sets[tokens] = [tokens, 1]
+        else:
+            tokens = shared[0]
+            shared[1] += 1
+        _messages[seq] = message
+        _tokens_by_seq[seq] = tokens
+        for token in tokens:
+            postings = _postings.get(token)
+            if postings is None:
+                _postings[token] = {seq}
+            else:
+                postings.add(seq)
+
+
+def reindex_message(seq, message):
+    """
+    Aggiorna i token di un messaggio modificato dopo l'inserimento (es. decodifica differita).
+    I messaggi già espulsi dal buffer vengono ignorati.
+
+    Args:
+        seq (int): Identificativo progressivo del messaggio
+        message (dict): Dati aggiornati del messaggio
+    """
+    with _lock:
+        if seq not in _messages:
+            return
+    evict_message(seq)
+    index_message(seq, message)
+
+
+def evict_message(seq):
+    """
+    Rimuove dall'indice un messaggio espulso dal buffer.
+
+    Args:
+        seq (int): Identificativo progressivo del messaggio
+    """
+    with _lock:
+        _messages.pop(seq, None)
+        tokens = _tokens_by_seq.pop(seq, ())
+        for token in tokens:
+            postings = _postings.get(token)
+            if postings is not None:
+                postings.discard(seq)
+                if not postings:
+                    del _postings[token]
+        shared = _token_sets.get(tokens)
+        if shared is not None:
+            shared[1] -= 1
+            if shared[1] <= 0:
+                del _token_sets[tokens]
+
+
+def clear_index():
+    """Svuota l'indice"""
+    with _lock:
+        _postings.clear()
+        _messages.clear()
+        _tokens_by_seq.clear()
+        _token_sets.clear()
+
+
+def search_messages(query, limit=None):
+    """
+    Cerca i messaggi che contengono tutti i token della query.
+
+    Args:
+        query (str): Testo da cercare (es. un order id)
+        limit (int, optional): Numero massimo di risultati
+
+    Returns:
+        list: Messaggi trovati, dal più recente al meno recente
+    """
+    tokens = tokenize(query)
+    if not tokens:
+        return []
+
+    with _lock:
+        postings = []
+        for token in tokens:
+            token_postings = _postings.get(token)
+            if not token_postings:
+                return []
+            postings.append(token_postings)
+
+        # Intersezione a partire dalla lista più corta
+        postings.sort(key=len)
+        matches = set(postings[0])
+        for token_postings in postings[1:]:
+            matches &= token_postings
+            if not matches:
+                return []
+
+        # I token sono solo un pre-filtro: ogni termine deve comparire come sottostringa,
+        # così "ORD-5" non trova "ORD-119199" con amount 5
+        terms = [term for term in query.lower().split() if term]
+        results = []
+        for seq in sorted(matches, reverse=True):
+            message = _messages[seq]
+            text = _message_text(message)
+            if all(term in text for term in terms):
+                results.append(message)
+                if limit is not None and len(results) >= limit:
+                    break
+        return results
@@ -0,0 +1,179 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Buffer circolare in memoria condivisa (multiprocessing.shared_memory) con un solo produttore
+e un solo consumatore, su processi diversi.
+
+Layout: un'intestazione di HEADER_SIZE byte seguita dall'area dati. I record sono
+[lunghezza u32][payload] allineati a 8 byte; un record che non entra prima della fine
+dell'area viene preceduto da un marcatore di riempimento e scritto dall'inizio.
+Il produttore pubblica un record aggiornando 'head' dopo averlo scritto, il consumatore
+lo libera aggiornando 'tail': nessun lock tra i processi.
+"""
+import struct
+from multiprocessing import shared_memory
+
+RING_MAGIC = 0x52494E47  # "RING"
+HEADER_SIZE = 64
+_PAD = 0xFFFFFFFF
+_LENGTH = struct.Struct("<I")
+_U64 = struct.Struct("<Q")
+
+# Offset dei campi dell'intestazione
+_MAGIC_AT = 0
+_FLAGS_AT = 4  # u32, bit impostati dal produttore (es. FLAG_BLOCKED)
+_CAPACITY_AT = 8
+_HEAD_AT = 16  # byte scritti in totale (produttore)
+_TAIL_AT = 24  # byte letti in totale (consumatore)
+_DROPPED_AT = 32  # record scartati perché il buffer era pieno
+_TICKS_AT = 40  # contatore di vita del produttore
+
+FLAG_BLOCKED = 1
+
+
+def _aligned(size):
+    return (size + 7) & ~7
+
+
+class SharedRing:
+    """Buffer circolare di record di byte in un segmento di memoria condivisa"""
+
+    def __init__(self, shm, owner):
+        self.shm = shm
+        self.owner = owner
+        self.buf = shm.buf
+        self.capacity = _U64.unpack_from(self.buf, _CAPACITY_AT)[0]
+
+    @classmethod
+    def create(cls, capacity):
+        """
+        Crea un nuovo segmento; il creatore è responsabile di rimuoverlo con close().
+
+        Args:
+            capacity (int): Byte dell'area dati (arrotondati a multipli di 8)
+        """
+        capacity = _aligned(max(64, int(capacity)))
+        shm = shared_memory.SharedMemory(create=True, size=HEADER_SIZE + capacity)
+        shm.buf[:HEADER_SIZE] = bytes(HEADER_SIZE)
+        struct.pack_into("<I", shm.buf, _MAGIC_AT, RING_MAGIC)
+        _U64.pack_into(shm.buf, _CAPACITY_AT, capacity)
+        return cls(shm, owner=True)
+
+    @classmethod
+    def attach(cls, name):
+        """Si collega a un segmento esistente creato da un altro processo"""
+        shm = shared_memory.SharedMemory(name=name)
+        if struct.unpack_from("<I", shm.buf, _MAGIC_AT)[0] != RING_MAGIC:
+            shm.close()
+            raise ValueError(f"Segmento {name} non è un buffer circolare")
+        return cls(shm, owner=False)
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def _get(self, offset):
+        return _U64.unpack_from(self.buf, offset)[0]
+
+    def _set(self, offset, value):
+        _U64.pack_into(self.buf, offset, value)
+
+    # --- Produttore ---
+
+    def write(self, *parts):
+        """
+        Accoda un record formato dalla concatenazione di parts, senza bloccare.
+
+        Returns:
+            bool: False se il buffer è pieno e il record è stato scartato
+        """
+        length = sum(len(part) for part in parts)
+        needed = _aligned(_LENGTH.size + length)
+        head = self._get(_HEAD_AT)
+        free = self.capacity - (head - self._get(_TAIL_AT))
+        position = head % self.capacity
+        padding = self.capacity - position if position + needed > self.capacity else 0
+
+        if padding + needed > free:
+            self._set(_DROPPED_AT, self._get(_DROPPED_AT) + 1)
+            return False
+
+        if padding:
+            _LENGTH.pack_into(self.buf, HEADER_SIZE + position, _PAD)
+            head += padding
+            position = 0
+
+        offset = HEADER_SIZE + position
+        _LENGTH.pack_into(self.buf, offset, length)
+        offset += _LENGTH.size
+        for part in parts:
+            self.buf[offset:offset + len(part)] = part
+            offset += len(part)
+        # Il record diventa visibile al consumatore solo ora
+        self._set(_HEAD_AT, head + needed)
+        return True
+
+    def tick(self):
+        """Segnala che il produttore è vivo"""
+        self._set(_TICKS_AT, self._get(_TICKS_AT) + 1)
+
+    def set_flag(self, flag, enabled):
+        flags = struct.unpack_from("<I", self.buf, _FLAGS_AT)[0]
+        flags = flags | flag if enabled else flags & ~flag
+        struct.pack_into("<I", self.buf, _FLAGS_AT, flags)
+
+    # --- Consumatore ---
+
+    def read(self, handle, limit=None):
+        """
+        Passa a handle(memoryview) i record disponibili, nell'ordine di scrittura.
+        La memoryview punta direttamente al segmento ed è valida solo durante la chiamata:
+        lo spazio viene restituito al produttore dopo che handle è terminata.
+
+        Args:
+            handle (callable): Funzione chiamata con il payload di ogni record
+            limit (int, optional): Numero massimo di record da leggere
+
+        Returns:
+            int: Record letti
+        """
+        head = self._get(_HEAD_AT)
+        tail = self._get(_TAIL_AT)
+        count = 0
+        while tail < head and (limit is None or count < limit):
+            position = tail % self.capacity
+            length = _LENGTH.unpack_from(self.buf, HEADER_SIZE + position)[0]
+            if length == _PAD:
+                tail += self.capacity - position
+                self._set(_TAIL_AT, tail)
+                continue
+            start = HEADER_SIZE + position + _LENGTH.size
+            payload = self.buf[start:start + length]
+            try:
+                handle(payload)
+            finally:
+                payload.release()
+                tail += _aligned(_LENGTH.size + length)
+                self._set(_TAIL_AT, tail)
+            count += 1
+        return count
+
+    def stats(self):
+        """Ritorna {'used', 'capacity', 'dropped', 'ticks', 'flags'}"""
+        return {
+            'used': self._get(_HEAD_AT) - self._get(_TAIL_AT),
+            'capacity': self.capacity,
+            'dropped': self._get(_DROPPED_AT),
+            'ticks': self._get(_TICKS_AT),
+            'flags': struct.unpack_from("<I", self.buf, _FLAGS_AT)[0],
+        }
+
+    def close(self):
+        """Rilascia il segmento; il creatore lo rimuove anche dal sistema"""
+        self.buf = None
+        self.shm.close()
+        if self.owner:
+            try:
+                self.shm.unlink()
+            except FileNotFoundError:
+                pass
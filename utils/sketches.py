@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Strutture di conteggio approssimato a memoria fissa per flussi con molte chiavi distinte.
+"""
+import heapq
+from array import array
+
+
+class SpaceSaving:
+    """
+    Top-K approssimato (algoritmo Space-Saving, con pesi): al più 'capacity' contatori.
+    Una chiave nuova con la tabella piena sostituisce quella con il conteggio minimo ed eredita
+    quel minimo come errore massimo della stima.
+    """
+
+    __slots__ = ("capacity", "counters", "heap")
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.counters = {}  # chiave -> [conteggio stimato, errore massimo]
+        self.heap = []  # (conteggio, chiave), con voci superate rimosse solo quando emergono
+
+    def _push(self, count, key):
+        heap = self.heap
+        if len(heap) > 4 * self.capacity:
+            # Ricostruzione periodica: il heap non cresce oltre un multiplo della capacità
+            heap[:] = [(counter[0], item) for item, counter in self.counters.items()]
+            heapq.heapify(heap)
+        heapq.heappush(heap, (count, key))
+
+    def add(self, key, weight=1):
+        counter = self.counters.get(key)
+        if counter is not None:
+            counter[0] += weight
+            self._push(counter[0], key)
+        elif len(self.counters) < self.capacity:
+            self.counters[key] = [weight, 0]
+            self._push(weight, key)
+        else:
+            heap = self.heap
+            while True:
+                floor, victim = heapq.heappop(heap)
+                current = self.counters.get(victim)
+                if current is not None and current[0] == floor:
+                    break
+            del self.counters[victim]
+            self.counters[key] = [floor + weight, floor]
+            self._push(floor + weight, key)
+
+    def top(self, k):
+        """Le k chiavi con il conteggio stimato più alto, come (chiave, conteggio, errore)"""
+        ranked = heapq.nlargest(k, self.counters.items(), key=lambda item: item[1][0])
+        return [(key, count, error) for key, (count, error) in ranked]
+
+    def clear(self):
+        self.counters.clear()
+        self.heap.clear()
+
+
+class CountMinSketch:
+    """
+    Sketch count-min: depth righe da width contatori; la stima di una chiave è il minimo
+    dei suoi contatori e non è mai inferiore al valore vero.
+    Più sketch con le stesse dimensioni si sommano cella per cella (es. finestre scorrevoli).
+    """
+
+    __slots__ = ("width", "depth", "table")
+
+    def __init__(self, width, depth):
+        self.width = width
+        self.depth = depth
+        self.table = array("q", bytes(8 * width * depth))
+
+    def cells(self, key):
+        """Indici delle celle di una chiave, da calcolare una volta e riusare per più sketch"""
+        # Doppio hashing: le righe derivano da due metà indipendenti dello stesso hash a 64 bit
+        width = self.width
+        value = hash(key)
+        first = value & 0xFFFFFFFF
+        step = ((value >> 32) & 0xFFFFFFFF) | 1
+        return [row * width + (first + row * step) % width for row in range(self.depth)]
+
+    def add_cells(self, cells, weight=1):
+        table = self.table
+        for cell in cells:
+            table[cell] += weight
+
+    def add(self, key, weight=1):
+        self.add_cells(self.cells(key), weight)
+
+    def estimate(self, key):
+        return min(self.table[cell] for cell in self.cells(key))
+
+    @staticmethod
+    def estimate_sum(sketches, cells):
+        """Stima di una chiave sulla somma di più sketch (celle calcolate con cells)"""
+        if not sketches:
+            return 0
+        return min(sum(sketch.table[cell] for sketch in sketches) for cell in cells)
+
+    def clear(self):
+        self.table[:] = array("q", bytes(8 * len(self.table)))
@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Corpi dei messaggi molto grandi scaricati su file temporanei.
+In memoria restano solo un riferimento al file e un'anteprima; il file viene rimosso quando
+nessun messaggio trattenuto lo usa più (o all'uscita del programma).
+"""
+import atexit
+import os
+import shutil
+import tempfile
+import threading
+import weakref
+
+_lock = threading.Lock()
+_spill_dir = None
+
+
+def _get_spill_dir():
+    global _spill_dir
+    with _lock:
+        if _spill_dir is None:
+            _spill_dir = tempfile.mkdtemp(prefix="lt-superstar-spill-")
+            atexit.register(shutil.rmtree, _spill_dir, True)
+        return _spill_dir
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+class SpilledBody:
+    """Riferimento a un corpo scritto su disco"""
+
+    __slots__ = ("path", "size", "__weakref__")
+
+    def __init__(self, path, size):
+        self.path = path
+        self.size = size
+        weakref.finalize(self, _remove, path)
+
+    def read(self):
+        """Rilegge il corpo completo dal disco"""
+        with open(self.path, "rb") as f:
+            return f.read()
+
+    def __len__(self):
+        return self.size
+
+    def __repr__(self):
+        return f"SpilledBody({self.path!r}, {self.size})"
+
+
+def spill_body(body):
+    """
+    Scrive un corpo su un file temporaneo.
+
+    Args:
+        body (bytes): Corpo del messaggio
+
+    Returns:
+        SpilledBody: Riferimento al file
+    """
+    fd, path = tempfile.mkstemp(prefix="body-", dir=_get_spill_dir())
+    with os.fdopen(fd, "wb") as f:
+        f.write(body)
+    return SpilledBody(path, len(body))
+
+
+def spill_preview(body, content_encoding=None, preview_bytes=4096):
+    """
+    Anteprima testuale di un corpo scaricato su disco, senza decodificarlo per intero.
+
+    Args:
+        body (bytes): Corpo del messaggio
+        content_encoding (str, optional): Content encoding (i corpi compressi non hanno anteprima)
+        preview_bytes (int): Byte iniziali usati per l'anteprima
+
+    Returns:
+        str: Anteprima seguita dall'indicazione della dimensione completa
+    """
+    prefix = body[:preview_bytes]
+    if content_encoding:
+        preview = f"[Corpo compresso ({content_encoding})]"
+    elif b"\x00" in prefix:
+        preview = "[Dati binari]"
+    else:
+        preview = prefix.decode("utf-8", errors="replace")
+    return f"{preview}\n[... corpo completo di {len(body)} bytes su disco]"
+
+
+def body_bytes(raw_body):
+    """
+    Ritorna il corpo completo di un messaggio, rileggendolo dal disco se era stato scaricato.
+
+    Args:
+        raw_body (bytes | SpilledBody | None): Valore di 'raw_body' di un messaggio
+
+    Returns:
+        bytes: Corpo completo (b"" se assente)
+    """
+    if raw_body is None:
+        return b""
+    if isinstance(raw_body, SpilledBody):
+        return raw_body.read()
+    return raw_body
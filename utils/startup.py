@@ -0,0 +1,45 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Misurazione dei tempi di avvio (time to first frame, time to first message)
+"""
+import time
+
+# Riferimento temporale: il modulo viene importato per primo da main.py
+STARTUP_T0 = time.perf_counter()
+
+_marks = {}
+
+
+def mark_once(name):
+    """
+    Registra il primo istante in cui si verifica un evento di avvio.
+
+    Args:
+        name (str): Nome dell'evento (es. 'first_frame', 'first_message')
+    """
+    if name not in _marks:
+        _marks[name] = time.perf_counter() - STARTUP_T0
+
+
+def get_mark(name):
+    """Ritorna i secondi trascorsi dall'avvio all'evento, o None se non ancora avvenuto"""
+    return _marks.get(name)
+
+
+def get_marks():
+    """Ritorna una copia di tutti gli eventi registrati"""
+    return dict(_marks)
+
+
+def format_marks():
+    """
+    Formatta gli eventi registrati per la stampa a terminale.
+
+    Returns:
+        str: Una riga per evento, in ordine cronologico
+    """
+    lines = []
+    for name, elapsed in sorted(_marks.items(), key=lambda item: item[1]):
+        lines.append(f"{name:<20} {elapsed * 1000:9.1f} ms")
+    return "\n".join(lines)
@@ -0,0 +1,282 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Application state shared by the consumer thread, pollers, keyboard hooks and the main loop.
+Every store has its own lock and a version counter; readers get immutable snapshots and
+can wait for changes instead of polling.
+"""
+import hashlib
+import itertools
+import threading
+from collections import deque
+from itertools import islice
+
+from utils.constants import MAX_MESSAGES, MAIN_VIEW_MESSAGES
+from utils.search_index import index_message, evict_message, clear_index
+
+
+def payload_digest(body, content_type=None, content_encoding=None):
+    """
+    Content hash of a payload, used to intern identical bodies.
+    Content type and encoding are part of the key because they determine the decoded text.
+    """
+    digest = hashlib.blake2b(body, digest_size=16)
+    digest.update(f"\0{content_type or ''}\0{content_encoding or ''}".encode("utf-8"))
+    return digest.hexdigest()
+
+
+class AppState:
+    """Central application state with per-store locks, versions and change notifications"""
+
+    def __init__(self):
+        # Versions: store name -> version of its last mutation (one global counter)
+        self._version_counter = itertools.count(1)
+        self._versions = {}
+        self._global_version = 0
+        self._changed = threading.Condition(threading.Lock())
+        self._listeners = []
+
+        # UI state
+        self._ui_lock = threading.Lock()
+        self._active_connection = None
+        self._live_instance = None
+        self._selected_index = 0
+        self._fast_start = True
+        self._main_view = MAIN_VIEW_MESSAGES
+
+        # Retained messages (ring buffer) and search
+        self._messages_lock = threading.Lock()
+        self._max_messages = MAX_MESSAGES
+        self._messages = deque(maxlen=MAX_MESSAGES)
+        self._message_seq = 0
+        self._messages_snapshot = (None, ())  # (version, tuple) built at most once per version
+        self._search_state = None
+        # Interned payloads: digest -> [raw body, decoded text or None, retained references]
+        self._payloads = {}
+
+    # --- Versions and notifications ---
+
+    def bump(self, *stores):
+        """Mark one or more stores as changed and wake up waiting readers"""
+        with self._changed:
+            version = next(self._version_counter)
+            for store in stores:
+                self._versions[store] = version
+            self._global_version = version
+            self._changed.notify_all()
+            listeners = list(self._listeners)
+        for listener in listeners:
+            for store in stores:
+                listener(store, version)
+
+    def version(self, store=None):
+        """Return the version of a store, or the global version if store is None"""
+        if store is None:
+            return self._global_version
+        return self._versions.get(store, 0)
+
+    def subscribe(self, listener):
+        """Register listener(store, version), called after every mutation (on the mutating thread)"""
+        with self._changed:
+            self._listeners.append(listener)
+
+    def unsubscribe(self, listener):
+        """Remove a listener registered with subscribe"""
+        with self._changed:
+            if listener in self._listeners:
+                self._listeners.remove(listener)
+
+    def wait_for_change(self, since_version, timeout=None):
+        """
+        Wait until some store changes after since_version.
+
+        Returns:
+            int: Current global version
+        """
+        with self._changed:
+            if self._global_version == since_version:
+                self._changed.wait(timeout)
+            return self._global_version
+
+    # --- UI state ---
+
+    def set_active_connection(self, connection):
+        with self._ui_lock:
+            self._active_connection = connection
+        self.bump('active')
+
+    def get_active_connection(self):
+        return self._active_connection
+
+    def set_live_instance(self, live):
+        with self._ui_lock:
+            self._live_instance = live
+
+    def get_live_instance(self):
+        return self._live_instance
+
+    def set_selected_index(self, index):
+        with self._ui_lock:
+            self._selected_index = index
+        self.bump('selection')
+
+    def get_selected_index(self):
+        return self._selected_index
+
+    def set_main_view(self, view):
+        """Select what the lower panel shows: MAIN_VIEW_MESSAGES or a heavy-hitter dimension"""
+        with self._ui_lock:
+            self._main_view = view
+        self.bump('view')
+
+    def get_main_view(self):
+        return self._main_view
+
+    def set_fast_start(self, enabled):
+        with self._ui_lock:
+            self._fast_start = enabled
+
+    def is_fast_start(self):
+        return self._fast_start
+
+    # --- Messages ---
+
+    def set_max_messages(self, max_messages):
+        with self._messages_lock:
+            self._max_messages = max(1, int(max_messages))
+        self.clear_messages()
+
+    def add_message(self, message, decoded=True):
+        """
+        Add a message to the ring buffer.
+        Messages get a progressive 'seq' and are indexed for search; evicted ones are unindexed.
+        Messages with a 'payload_id' share one copy of identical raw bodies and decoded texts;
+        decoded=False means 'body' is still a placeholder (see set_payload_text).
+        """
+        with self._messages_lock:
+            self._message_seq += 1
+            message['seq'] = self._message_seq
+            if len(self._messages) == self._messages.maxlen:
+                evicted = self._messages[0]
+                evict_message(evicted['seq'])
+                self._release_payload(evicted)
+            self._intern_payload(message, decoded)
+            self._messages.append(message)
+            index_message(self._message_seq, message)
+        self.bump('messages')
+
+    def _intern_payload(self, message, decoded):
+        payload_id = message.get('payload_id')
+        if payload_id is None:
+            return
+        entry = self._payloads.get(payload_id)
+        if entry is None:
+            self._payloads[payload_id] = [message.get('raw_body'), message.get('body') if decoded else None, 1]
+            return
+        entry[2] += 1
+        message['raw_body'] = entry[0]
+        if entry[1] is None:
+            if decoded:
+                entry[1] = message.get('body')
+        elif decoded:
+            message['body'] = entry[1]
+
+    def _release_payload(self, message):
+        payload_id = message.get('payload_id')
+        entry = self._payloads.get(payload_id)
+        if entry is not None:
+            entry[2] -= 1
+            if entry[2] <= 0:
+                del self._payloads[payload_id]
+
+    def get_payload_text(self, payload_id):
+        """Return the decoded text of a retained payload, or None if unknown or still decoding"""
+        entry = self._payloads.get(payload_id)
+        return entry[1] if entry is not None else None
+
+    def set_payload_text(self, payload_id, text):
+        """Record the decoded text of a payload whose decoding was deferred"""
+        with self._messages_lock:
+            entry = self._payloads.get(payload_id)
+            if entry is not None and entry[1] is None:
+                entry[1] = text
+
+    def get_payload_refs(self, payload_id):
+        """Return how many retained messages share a payload"""
+        entry = self._payloads.get(payload_id)
+        return entry[2] if entry is not None else 0
+
+    def get_messages(self):
+        """Return an immutable snapshot of the retained messages, oldest first"""
+        version = self.version('messages')
+        cached_version, snapshot = self._messages_snapshot
+        if cached_version == version:
+            return snapshot
+        with self._messages_lock:
+            snapshot = tuple(self._messages)
+        self._messages_snapshot = (version, snapshot)
+        return snapshot
+
+    def get_recent_messages(self, limit):
+        """Return up to limit messages, newest first, copying only what is needed"""
+        with self._messages_lock:
+            return list(islice(reversed(self._messages), limit))
+
+    def clear_messages(self):
+        with self._messages_lock:
+            self._messages = deque(maxlen=self._max_messages)
+            self._messages_snapshot = (None, ())
+            self._payloads = {}
+            clear_index()
+        self.bump('messages')
+
+    # --- Search ---
+
+    def set_search_results(self, query, results, elapsed=None, label="Ricerca"):
+        """Set the active search query and its results (query None clears the search)"""
+        self._search_state = None if query is None else {
+            'query': query, 'results': results, 'elapsed': elapsed, 'label': label
+        }
+        self.bump('search')
+
+    def get_search_results(self):
+        """Return the active search as {'query', 'results', 'elapsed', 'label'} or None"""
+        return self._search_state
+
+
+STATE = AppState()
+
+
+def initialize_globals():
+    """Reset the application state to its default values"""
+    STATE.set_active_connection(None)
+    STATE.clear_messages()
+    # Note: the connections list is managed in config/connections.py
+
+
+# Module-level accessors bound to the shared state
+bump_version = STATE.bump
+get_version = STATE.version
+subscribe_state = STATE.subscribe
+unsubscribe_state = STATE.unsubscribe
+wait_for_change = STATE.wait_for_change
+set_active_connection = STATE.set_active_connection
+get_active_connection = STATE.get_active_connection
+set_live_instance = STATE.set_live_instance
+get_live_instance = STATE.get_live_instance
+set_selected_index = STATE.set_selected_index
+get_selected_index = STATE.get_selected_index
+set_main_view = STATE.set_main_view
+get_main_view = STATE.get_main_view
+set_fast_start = STATE.set_fast_start
+is_fast_start = STATE.is_fast_start
+set_max_messages = STATE.set_max_messages
+add_message = STATE.add_message
+get_messages = STATE.get_messages
+get_recent_messages = STATE.get_recent_messages
+get_payload_text = STATE.get_payload_text
+set_payload_text = STATE.set_payload_text
+get_payload_refs = STATE.get_payload_refs
+clear_messages = STATE.clear_messages
+set_search_results = STATE.set_search_results
+get_search_results = STATE.get_search_results
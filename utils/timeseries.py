@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Serie storiche per coda (profondità, ready, unacked, rate) in buffer circolari compatti.
+Ogni coda occupa un unico array di float a 32 bit, con più risoluzioni ottenute per media.
+"""
+import threading
+from array import array
+
+from utils.constants import QUEUE_HISTORY_RESOLUTIONS
+
+METRICS = ("messages", "ready", "unacked", "rate")
+SPARK_CHARS = "▁▂▃▄▅▆▇█"
+
+# Inizio della fascia di ogni livello nell'array di una coda
+_LEVEL_BASES = [
+    sum(capacity for _, capacity in QUEUE_HISTORY_RESOLUTIONS[:level]) * len(METRICS)
+    for level in range(len(QUEUE_HISTORY_RESOLUTIONS))
+]
+
+_lock = threading.Lock()
+_series = {}  # nome coda -> _QueueSeries
+
+
+class _QueueSeries:
+    """Buffer circolari di una coda: per ogni livello, capacità righe da len(METRICS) valori"""
+
+    __slots__ = ("data", "positions", "lengths", "sums", "pending")
+
+    def __init__(self):
+        levels = len(QUEUE_HISTORY_RESOLUTIONS)
+        size = sum(capacity for _, capacity in QUEUE_HISTORY_RESOLUTIONS) * len(METRICS)
+        self.data = array("f", bytes(4 * size))
+        self.positions = [0] * levels
+        self.lengths = [0] * levels
+        self.sums = [None] * levels
+        self.pending = [0] * levels
+
+    def _write(self, level, values):
+        capacity = QUEUE_HISTORY_RESOLUTIONS[level][1]
+        position = self.positions[level]
+        start = _LEVEL_BASES[level] + position * len(METRICS)
+        self.data[start:start + len(METRICS)] = array("f", values)
+        self.positions[level] = (position + 1) % capacity
+        if self.lengths[level] < capacity:
+            self.lengths[level] += 1
+
+    def append(self, values):
+        for level, (factor, _) in enumerate(QUEUE_HISTORY_RESOLUTIONS):
+            if factor <= 1:
+                self._write(level, values)
+                continue
+            # Livelli più lunghi: media di factor campioni consecutivi
+            sums = self.sums[level]
+            self.sums[level] = list(values) if sums is None else [a + b for a, b in zip(sums, values)]
+            self.pending[level] += 1
+            if self.pending[level] >= factor:
+                self._write(level, [total / factor for total in self.sums[level]])
+                self.sums[level] = None
+                self.pending[level] = 0
+
+    def values(self, level, metric_index):
+        capacity = QUEUE_HISTORY_RESOLUTIONS[level][1]
+        base = _LEVEL_BASES[level] + metric_index
+        length = self.lengths[level]
+        start = (self.positions[level] - length) % capacity
+        width = len(METRICS)
+        return [self.data[base + ((start + index) % capacity) * width] for index in range(length)]
+
+
+def queue_sample(queue):
+    """
+    Estrae i valori campionati da una coda dell'API Management.
+
+    Args:
+        queue (dict): Coda come restituita da /api/queues
+
+    Returns:
+        tuple: (messages, ready, unacked, rate di pubblicazione)
+    """
+    publish_details = (queue.get("message_stats") or {}).get("publish_details") or {}
+    return (
+        float(queue.get("messages") or 0),
+        float(queue.get("messages_ready") or 0),
+        float(queue.get("messages_unacknowledged") or 0),
+        float(publish_details.get("rate") or 0),
+    )
+
+
+def record_queue_samples(queues_data):
+    """
+    Aggiunge un campione per ogni coda dello snapshot. Le code non più presenti vengono scartate,
+    così la memoria resta proporzionale alle code esistenti.
+
+    Args:
+        queues_data (list): Snapshot delle code dall'API Management
+    """
+    with _lock:
+        seen = set()
+        for queue in queues_data:
+            name = queue.get("name")
+            if name is None:
+                continue
+            seen.add(name)
+            series = _series.get(name)
+            if series is None:
+                series = _series[name] = _QueueSeries()
+            series.append(queue_sample(queue))
+        for name in [name for name in _series if name not in seen]:
+            del _series[name]
+
+
+def reset_queue_history():
+    """Svuota tutte le serie (es. al cambio di connessione)"""
+    with _lock:
+        _series.clear()
+
+
+def get_queue_series(queue_name, metric="messages", level=0):
+    """
+    Ritorna la serie di una coda, dal campione più vecchio al più recente.
+
+    Args:
+        queue_name (str): Nome della coda
+        metric (str): Una tra METRICS
+        level (int): Indice della risoluzione in QUEUE_HISTORY_RESOLUTIONS
+
+    Returns:
+        list: Valori della serie (vuota se la coda non ha storico)
+    """
+    with _lock:
+        series = _series.get(queue_name)
+        if series is None:
+            return []
+        return series.values(level, METRICS.index(metric))
+
+
+def sparkline(values, width):
+    """
+    Rappresenta gli ultimi valori di una serie come sparkline testuale.
+
+    Args:
+        values (list): Valori in ordine cronologico
+        width (int): Numero massimo di caratteri
+
+    Returns:
+        str: Sparkline (vuota senza valori)
+    """
+    values = values[-width:]
+    if not values:
+        return ""
+    low, high = min(values), max(values)
+    if high == low:
+        return (SPARK_CHARS[0] if high == 0 else SPARK_CHARS[3]) * len(values)
+    scale = (len(SPARK_CHARS) - 1) / (high - low)
+    return "".join(SPARK_CHARS[int((value - low) * scale)] for value in values)